@@ -0,0 +1,66 @@
+"""
+Compare the per-row cost of the default JSON path with the FAST_JSON one for large expense lists.
+
+Default: stdlib json decode (aiohttp) -> pydantic validation and serialization of `List[ExpenseResponse]`
+(FastAPI's response_model) -> stdlib json encode (JSONResponse).
+Fast: orjson decode -> rows returned as-is -> orjson encode (ORJSONResponse).
+
+Usage: python -m benchmarks.bench_json [rows] [repeats]
+"""
+from fastapi.responses import JSONResponse, ORJSONResponse
+from datetime import datetime, timedelta, timezone
+from models import ExpenseResponse
+from pydantic import TypeAdapter
+from typing import List
+
+import orjson
+import random
+import time
+import json
+import uuid
+import sys
+
+ADAPTER = TypeAdapter(List[ExpenseResponse])
+
+
+def make_payload(rows: int) -> bytes:
+    """Build an upstream PostgREST response body with `rows` expenses."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    user_id = str(uuid.uuid4())
+    return json.dumps([{
+        "id": str(uuid.uuid4()), "user_id": user_id, "amount": round(random.uniform(1, 500), 2),
+        "category": random.choice(["food", "travel", "utilities", "health"]), "description": f"Expense {i}",
+        "payment_method": "bank", "is_recurring": False, "currency": random.choice(["USD", "EUR"]),
+        "created_at": (start + timedelta(minutes=i)).isoformat(), "updated_at": None,
+    } for i in range(rows)]).encode()
+
+
+def default_path(payload: bytes) -> bytes:
+    rows = json.loads(payload)
+    content = ADAPTER.dump_python(ADAPTER.validate_python(rows), mode="json")
+    return JSONResponse(content).body
+
+
+def fast_path(payload: bytes) -> bytes:
+    return ORJSONResponse(orjson.loads(payload)).body
+
+
+def measure(path, payload: bytes, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        path(payload)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    payload = make_payload(rows)
+    default_seconds = measure(default_path, payload, repeats)
+    fast_seconds = measure(fast_path, payload, repeats)
+    print(f"{rows} rows, {len(payload) / 1024:.0f} KiB, best of {repeats}")
+    print(f"default:   {default_seconds * 1000:8.2f} ms  {default_seconds / rows * 1e6:6.2f} us/row")
+    print(f"fast_json: {fast_seconds * 1000:8.2f} ms  {fast_seconds / rows * 1e6:6.2f} us/row")
+    print(f"speedup:   {default_seconds / fast_seconds:8.1f}x")
@@ -0,0 +1,60 @@
+"""
+Measure registration and login latency under concurrency against the local fake Supabase.
+
+Registration looks the user up before signing them up, and login is a sign-in followed by a single upsert of the users
+row, so with an upstream latency of L both should take about 2 L.
+
+Usage: python -m benchmarks.bench_login [--users 200] [--concurrency 50] [--requests 2000] [--latency 0.02]
+"""
+from benchmarks.load_test import Account, PASSWORD, drive, login, print_report, start_fake, summarize
+from benchmarks.fake_supabase import ANON_KEY, SERVICE_KEY, JWT_SECRET
+
+import argparse
+import asyncio
+import random
+import httpx
+import sys
+import os
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import main  # Only now, so it picks up the fake's settings
+
+    accounts = [Account(f"login{index}@example.com") for index in range(args.users)]
+    emails = iter(account.email for account in accounts)
+
+    async def register(client: httpx.AsyncClient, account: Account) -> httpx.Response:
+        return await client.post("/register", json={"email": next(emails), "password": PASSWORD})
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            register_samples, register_elapsed = await drive(client, accounts, [("POST /register", 1, register)],
+                                                             args.users, args.concurrency)
+            login_samples, login_elapsed = await drive(client, accounts, [("POST /login", 1, login)], args.requests,
+                                                       args.concurrency)
+
+    report = summarize(login_samples, login_elapsed)
+    report["endpoints"].update(summarize(register_samples, register_elapsed)["endpoints"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="Users registered before logging in")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="Logins to send")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the fake adds to every upstream request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(sys.argv[1:])
+
+    random.seed(args.seed)
+    fake, url = start_fake(args.latency, args.jitter)
+    os.environ.update({"SUPABASE_URL": url, "SUPABASE_ANON_KEY": ANON_KEY, "SUPABASE_SERVICE_KEY": SERVICE_KEY,
+                       "JWT_SECRET_KEY": JWT_SECRET})
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # Measure the app, not the per-user limits
+    try:
+        print_report(asyncio.run(run(args)))
+    finally:
+        fake.terminate()
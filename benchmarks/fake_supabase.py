@@ -0,0 +1,434 @@
+"""
+In-memory stand-in for the parts of Supabase the app talks to, so tests and benchmarks run without the network.
+
+It serves the GoTrue endpoints used by `AsyncSupabaseClient` (`auth/v1/signup`, `token`, `recover` and
+`admin/users/{id}`) and PostgREST `rest/v1/{table}` reads and writes with the filters the client sends (`eq`, `neq`,
+`gt(e)`, `lt(e)`, `in`, `like`, `ilike`, `is`, `not.`, `or=(...)`/`and(...)`), `select`, `order`, `limit`/`offset`,
+the `Range` header and the `Prefer` options `return=representation`, `count=...` and
+`resolution=merge-duplicates|ignore-duplicates` (upserts, together with `on_conflict`). Access tokens are real HS256
+JWTs signed with `jwt_secret`, so the app's token validation runs unchanged.
+
+Every request can be delayed by `latency` seconds plus up to `jitter` seconds, to mimic a remote project.
+
+Usage: python -m benchmarks.fake_supabase [--port 54321] [--latency 0.02] [--jitter 0.005]
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+from operator import itemgetter
+from aiohttp import web
+
+import argparse
+import asyncio
+import random
+import uuid
+import json
+import time
+import jwt
+import re
+
+ANON_KEY = "fake-anon-key"
+SERVICE_KEY = "fake-service-key"
+JWT_SECRET = "fake-jwt-secret"
+TOKEN_LIFETIME = 3600
+
+# Columns filled in by the database when a row is inserted without them
+TABLE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "expenses": {"description": None, "payment_method": "bank", "is_recurring": False, "currency": "USD",
+                 "updated_at": None},
+}
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+Predicate = Callable[[dict], bool]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split(text: str) -> List[str]:
+    """Split on top-level commas, keeping quoted strings and parenthesized groups together."""
+    parts, depth, quoted, start, index = [], 0, False, 0, 0
+    while index < len(text):
+        char = text[index]
+        if quoted and char == "\\":
+            index += 1
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and not depth and char == ",":
+            parts.append(text[start:index])
+            start = index + 1
+        index += 1
+    parts.append(text[start:])
+    return [part for part in parts if part]
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def _coerce(row_value: Any, value: str) -> Any:
+    """Convert a filter value to the type of the column value it's compared with."""
+    if isinstance(row_value, bool):
+        return value.lower() == "true"
+    if isinstance(row_value, (int, float)):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _pattern(pattern: str, ignore_case: bool) -> "re.Pattern":
+    regex = "".join(".*" if char in "*%" else re.escape(char) for char in pattern)
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL if ignore_case else re.DOTALL)
+
+
+def _compare(column: str, operator: str, value: str) -> Predicate:
+    """Build the predicate of a single `column=operator.value` filter."""
+    if operator == "in":
+        values = [_unquote(item) for item in _split(value.strip("()"))]
+        return lambda row: row.get(column) is not None and row[column] in [_coerce(row[column], v) for v in values]
+    if operator == "is":
+        expected = {"null": None, "true": True, "false": False}[value.lower()]
+        return lambda row: row.get(column) is expected
+    if operator in ("like", "ilike"):
+        pattern = _pattern(_unquote(value), operator == "ilike")
+        return lambda row: row.get(column) is not None and bool(pattern.match(str(row[column])))
+
+    value = _unquote(value)
+    compare = {
+        "eq": lambda a, b: a == b, "neq": lambda a, b: a != b, "gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+        "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b,
+    }.get(operator)
+    if compare is None:
+        raise web.HTTPBadRequest(text=json.dumps({"code": "PGRST100", "message": f"Unknown operator: {operator}"}),
+                                 content_type="application/json")
+    return lambda row: row.get(column) is not None and compare(row[column], _coerce(row[column], value))
+
+
+def _condition(column: str, expression: str) -> Predicate:
+    """Parse `[not.]operator.value`, the right-hand side of a filter."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, value = expression.partition(".")
+    predicate = _compare(column, operator, value)
+    return (lambda row: not predicate(row)) if negate else predicate
+
+
+def _logical(operator: str, conditions: str) -> Predicate:
+    """Parse the body of an `or=(...)`/`and=(...)` filter, which may nest further `or(...)`/`and(...)` groups."""
+    predicates = []
+    for condition in _split(conditions.strip()[1:-1]):
+        name, _, rest = condition.partition("(") if condition.startswith(("or(", "and(")) else ("", "", "")
+        if name in ("or", "and"):
+            predicates.append(_logical(name, "(" + rest))
+        else:
+            column, _, expression = condition.partition(".")
+            predicates.append(_condition(column, expression))
+    combine = any if operator == "or" else all
+    return lambda row: combine(predicate(row) for predicate in predicates)
+
+
+def _filters(params: Iterable[Tuple[str, str]]) -> Tuple[List[Predicate], Dict[str, str]]:
+    """Split query parameters into row predicates and the equality filters usable for index lookups."""
+    predicates, equalities = [], {}
+    for key, value in params:
+        if key in RESERVED_PARAMS:
+            continue
+        if key in ("or", "and"):
+            predicates.append(_logical(key, value))
+            continue
+        predicates.append(_condition(key, value))
+        if value.startswith("eq."):
+            equalities[key] = _unquote(value[3:])
+    return predicates, equalities
+
+
+class Table:
+    """Rows keyed by id, with a secondary index on `user_id` since nearly every app query filters on it."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: Dict[str, dict] = {}
+        self.by_user: Dict[str, Dict[str, dict]] = {}
+
+    def candidates(self, equalities: Dict[str, str]) -> Iterable[dict]:
+        if "id" in equalities:
+            row = self.rows.get(equalities["id"])
+            return [row] if row else []
+        if "user_id" in equalities:
+            return list(self.by_user.get(equalities["user_id"], {}).values())
+        return list(self.rows.values())
+
+    def put(self, row: dict) -> None:
+        self.rows[row["id"]] = row
+        if row.get("user_id") is not None:
+            self.by_user.setdefault(str(row["user_id"]), {})[row["id"]] = row
+
+    def remove(self, row: dict) -> None:
+        del self.rows[row["id"]]
+        if row.get("user_id") is not None:
+            self.by_user.get(str(row["user_id"]), {}).pop(row["id"], None)
+
+
+class FakeSupabase:
+    """The fake project: auth users, refresh tokens and tables, served by the aiohttp app from `make_app`."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, jwt_secret: str = JWT_SECRET,
+                 anon_key: str = ANON_KEY, service_key: str = SERVICE_KEY):
+        self.latency = latency
+        self.jitter = jitter
+        self.jwt_secret = jwt_secret
+        self.anon_key = anon_key
+        self.service_key = service_key
+        self.auth_users: Dict[str, dict] = {}  # email -> {"user": ..., "password": ...}
+        self.refresh_tokens: Dict[str, str] = {}  # refresh token -> email
+        self.tables: Dict[str, Table] = {}
+        self.requests = 0
+
+    def table(self, name: str) -> Table:
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = Table(name)
+        return table
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._delay])
+        app.router.add_post("/auth/v1/signup", self.signup)
+        app.router.add_post("/auth/v1/token", self.token)
+        app.router.add_post("/auth/v1/recover", self.recover)
+        app.router.add_delete("/auth/v1/admin/users/{user_id}", self.delete_auth_user)
+        app.router.add_route("*", "/rest/v1/{table}", self.rest)
+        return app
+
+    @web.middleware
+    async def _delay(self, request: web.Request, handler):
+        self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await handler(request)
+
+    # Auth (GoTrue)
+    def _session(self, user: dict) -> dict:
+        issued_at = int(time.time())
+        access_token = jwt.encode({"sub": user["id"], "email": user["email"], "role": "authenticated",
+                                   "aud": "authenticated", "iat": issued_at, "exp": issued_at + TOKEN_LIFETIME},
+                                  self.jwt_secret, algorithm="HS256")
+        refresh_token = uuid.uuid4().hex
+        self.refresh_tokens[refresh_token] = user["email"]
+        return {"access_token": access_token, "token_type": "bearer", "expires_in": TOKEN_LIFETIME,
+                "expires_at": issued_at + TOKEN_LIFETIME, "refresh_token": refresh_token, "user": user}
+
+    @staticmethod
+    def _auth_error(status: int, error_code: str, message: str) -> web.Response:
+        return web.json_response({"code": status, "error_code": error_code, "msg": message}, status=status)
+
+    async def signup(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body["email"] in self.auth_users:
+            return self._auth_error(422, "user_already_exists", "User already registered")
+        user = {"id": str(uuid.uuid4()), "aud": "authenticated", "role": "authenticated", "email": body["email"],
+                "created_at": _now()}
+        self.auth_users[body["email"]] = {"user": user, "password": body["password"]}
+        return web.json_response(user)
+
+    async def token(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        grant_type = request.query.get("grant_type")
+        if grant_type == "password":
+            account = self.auth_users.get(body.get("email"))
+            if not account or account["password"] != body.get("password"):
+                return self._auth_error(400, "invalid_credentials", "Invalid login credentials")
+            return web.json_response(self._session(account["user"]))
+        if grant_type == "refresh_token":
+            email = self.refresh_tokens.pop(body.get("refresh_token"), None)
+            if email is None or email not in self.auth_users:
+                return self._auth_error(400, "refresh_token_not_found", "Invalid Refresh Token")
+            return web.json_response(self._session(self.auth_users[email]["user"]))
+        return self._auth_error(400, "unsupported_grant_type", "Unsupported grant type")
+
+    async def recover(self, request: web.Request) -> web.Response:
+        await request.json()
+        return web.json_response({})
+
+    async def delete_auth_user(self, request: web.Request) -> web.Response:
+        if request.headers.get("Authorization") != f"Bearer {self.service_key}":
+            return self._auth_error(403, "not_admin", "User not allowed")
+        user_id = request.match_info["user_id"]
+        for email, account in list(self.auth_users.items()):
+            if account["user"]["id"] == user_id:
+                del self.auth_users[email]
+                return web.json_response({})
+        return self._auth_error(404, "user_not_found", "User not found")
+
+    # Data (PostgREST)
+    def _authorized(self, request: web.Request) -> bool:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token in (self.anon_key, self.service_key):
+            return True
+        try:
+            jwt.decode(token, self.jwt_secret, algorithms=["HS256"], options={"verify_aud": False})
+            return True
+        except jwt.PyJWTError:
+            return False
+
+    @staticmethod
+    def _rest_error(status: int, code: str, message: str) -> web.Response:
+        return web.json_response({"code": code, "details": None, "hint": None, "message": message}, status=status)
+
+    async def rest(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._rest_error(401, "PGRST301", "JWT could not be verified")
+        table = self.table(request.match_info["table"])
+        params = list(request.query.items())
+        prefer = {option.strip() for value in request.headers.getall("Prefer", []) for option in value.split(",")}
+        try:
+            if request.method in ("GET", "HEAD"):
+                return self._select(request, table, params, prefer)
+            if request.method == "POST":
+                return self._insert(table, await request.json(), request.query, prefer)
+            if request.method == "PATCH":
+                return self._update(table, params, await request.json(), prefer)
+            if request.method == "DELETE":
+                return self._delete(table, params, prefer)
+        except (KeyError, ValueError) as e:
+            return self._rest_error(400, "PGRST100", f"Failed to parse request: {e}")
+        return self._rest_error(405, "PGRST117", f"Unsupported HTTP method: {request.method}")
+
+    @staticmethod
+    def _matching(table: Table, params: List[Tuple[str, str]]) -> List[dict]:
+        predicates, equalities = _filters(params)
+        return [row for row in table.candidates(equalities) if all(predicate(row) for predicate in predicates)]
+
+    @staticmethod
+    def _project(rows: List[dict], params: List[Tuple[str, str]]) -> List[dict]:
+        columns = dict(params).get("select", "*")
+        if columns == "*":
+            return [dict(row) for row in rows]
+        names = [column.split(":")[-1] for column in columns.split(",")]
+        return [{name: row.get(name) for name in names} for row in rows]
+
+    @staticmethod
+    def _respond(rows: List[dict], prefer: set, status: int, params: List[Tuple[str, str]]) -> web.Response:
+        if "return=representation" in prefer:
+            return web.json_response(FakeSupabase._project(rows, params), status=status)
+        return web.Response(status=204 if status == 200 else status)
+
+    def _select(self, request: web.Request, table: Table, params: List[Tuple[str, str]], prefer: set) -> web.Response:
+        rows = self._matching(table, params)
+        query = dict(params)
+        for ordering in reversed(query["order"].split(",") if "order" in query else []):
+            column, _, direction = ordering.partition(".")
+            desc = direction.startswith("desc")
+            present = sorted((row for row in rows if row.get(column) is not None), key=itemgetter(column),
+                             reverse=desc)
+            missing = [row for row in rows if row.get(column) is None]
+            # Nulls sort last ascending and first descending, like Postgres
+            rows = missing + present if desc else present + missing
+
+        total = len(rows)
+        start, stop = int(query.get("offset", 0)), None
+        if "limit" in query:
+            stop = start + int(query["limit"])
+        if "Range" in request.headers:
+            first, _, last = request.headers["Range"].partition("-")
+            start, stop = start + int(first), start + int(last) + 1 if last else stop
+        rows = rows[start:stop]
+
+        headers = {}
+        if any(option.startswith("count=") for option in prefer):
+            headers["Content-Range"] = f"{start}-{start + len(rows) - 1}/{total}" if rows else f"*/{total}"
+        else:
+            headers["Content-Range"] = f"{start}-{start + len(rows) - 1}/*" if rows else "*/*"
+        if request.method == "HEAD":
+            return web.Response(headers=headers, content_type="application/json")
+        return web.json_response(self._project(rows, params), headers=headers)
+
+    def _insert(self, table: Table, body: Any, query, prefer: set) -> web.Response:
+        rows = body if isinstance(body, list) else [body]
+        conflict_columns = query.get("on_conflict", "id").split(",")
+        merge = "resolution=merge-duplicates" in prefer
+        ignore = "resolution=ignore-duplicates" in prefer
+
+        written = []
+        for data in rows:
+            existing = None
+            if all(data.get(column) is not None for column in conflict_columns):
+                key = {column: str(data[column]) for column in conflict_columns}
+                existing = next((row for row in table.candidates(key)
+                                 if all(str(row.get(column)) == value for column, value in key.items())), None)
+            if existing is not None:
+                if ignore:
+                    continue
+                if not merge:
+                    return self._rest_error(409, "23505", f'duplicate key value violates unique constraint '
+                                                          f'"{table.name}_pkey"')
+                table.remove(existing)
+                row = {**existing, **data}
+            else:
+                row = {"id": str(uuid.uuid4()), "created_at": _now(), **TABLE_DEFAULTS.get(table.name, {}), **data}
+            table.put(row)
+            written.append(row)
+        return self._respond(written, prefer, 201, [])
+
+    def _update(self, table: Table, params: List[Tuple[str, str]], data: dict, prefer: set) -> web.Response:
+        updated = []
+        for row in self._matching(table, params):
+            table.remove(row)
+            row = {**row, **data}
+            table.put(row)
+            updated.append(row)
+        return self._respond(updated, prefer, 200, params)
+
+    def _delete(self, table: Table, params: List[Tuple[str, str]], prefer: set) -> web.Response:
+        deleted = self._matching(table, params)
+        for row in deleted:
+            table.remove(row)
+        return self._respond(deleted, prefer, 200, params)
+
+
+async def start(fake: FakeSupabase, host: str = "127.0.0.1", port: int = 0) -> Tuple[web.AppRunner, str]:
+    """Serve the fake on the running loop. Returns the runner (to `cleanup()` later) and the base URL."""
+    runner = web.AppRunner(fake.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_host, bound_port = runner.addresses[0][:2]
+    return runner, f"http://{bound_host}:{bound_port}"
+
+
+def serve(port: int, latency: float, jitter: float, ready: Optional[Callable[[str], None]] = None) -> None:
+    """Run the fake until interrupted, calling `ready` with its URL once it accepts connections."""
+
+    async def main():
+        runner, url = await start(FakeSupabase(latency, jitter), port=port)
+        if ready:
+            ready(url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.jitter,
+          ready=lambda url: print(f"Fake Supabase on {url} (anon key {ANON_KEY!r}, service key {SERVICE_KEY!r}, "
+                                  f"JWT secret {JWT_SECRET!r})"))
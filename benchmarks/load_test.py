@@ -0,0 +1,214 @@
+"""
+Drive `main.app` against the local fake Supabase at a fixed concurrency and report throughput and latency
+percentiles per endpoint, so performance changes can be compared run to run without the network.
+
+The fake runs in its own process so its CPU time doesn't skew the app's latencies, and the app is called in-process
+through httpx's ASGI transport. The Supabase settings are pointed at the fake before `main` is imported, any other
+setting (e.g. FAST_JSON, SUPABASE_SINGLE_FLIGHT) is read from the environment as usual. Rate limiting is off unless
+RATE_LIMIT_ENABLED is set, since a few benchmark users would otherwise exhaust their buckets.
+
+Usage: python -m benchmarks.load_test [--users 10] [--seed-expenses 200] [--concurrency 50] [--requests 2000]
+                                      [--latency 0.01] [--jitter 0.005] [--scenarios list,create,...] [--output out.json]
+"""
+from benchmarks.fake_supabase import ANON_KEY, SERVICE_KEY, JWT_SECRET, serve
+from typing import Awaitable, Callable, Dict, List, Tuple
+from dataclasses import dataclass, field
+
+import multiprocessing
+import itertools
+import argparse
+import asyncio
+import random
+import httpx
+import json
+import time
+import sys
+import os
+
+import numpy as np
+
+CATEGORIES = ["food", "transportation", "health", "entertainment", "utilities", "bench"]
+PASSWORD = "benchmark-password"
+
+
+@dataclass
+class Account:
+    email: str
+    token: str = ""
+    expense_ids: List[str] = field(default_factory=list)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+def random_expense() -> dict:
+    return {"amount": round(random.uniform(1, 500), 2), "category": random.choice(CATEGORIES),
+            "description": "benchmark", "currency": random.choice(["USD", "EUR"])}
+
+
+async def create_expense(client: httpx.AsyncClient, account: Account) -> httpx.Response:
+    response = await client.post("/expenses", json=random_expense(), headers=account.headers)
+    if response.status_code == 201:
+        account.expense_ids.append(response.json()["id"])
+    return response
+
+
+async def update_expense(client: httpx.AsyncClient, account: Account) -> httpx.Response:
+    expense_id = random.choice(account.expense_ids)
+    return await client.put(f"/expenses/{expense_id}", json={"amount": round(random.uniform(1, 500), 2)},
+                            headers=account.headers)
+
+
+async def login(client: httpx.AsyncClient, account: Account) -> httpx.Response:
+    return await client.post("/login", json={"email": account.email, "password": PASSWORD})
+
+
+Scenario = Tuple[str, int, Callable[[httpx.AsyncClient, Account], Awaitable[httpx.Response]]]
+
+# Short name -> (endpoint label, weight, request)
+SCENARIOS: Dict[str, Scenario] = {
+    "list": ("GET /expenses/{user_email}", 30,
+             lambda client, account: client.get(f"/expenses/{account.email}", params={"limit": 50},
+                                                headers=account.headers)),
+    "create": ("POST /expenses", 15, create_expense),
+    "update": ("PUT /expenses/{expense_id}", 5, update_expense),
+    "categories": ("GET /categories", 15, lambda client, account: client.get("/categories", headers=account.headers)),
+    "profile": ("GET /users/{user_email}", 15,
+                lambda client, account: client.get(f"/users/{account.email}", headers=account.headers)),
+    "summary": ("GET /expenses/{user_email}/summary", 5,
+                lambda client, account: client.get(f"/expenses/{account.email}/summary", headers=account.headers)),
+    "rollups": ("GET /expenses/{user_email}/rollups", 10,
+                lambda client, account: client.get(f"/expenses/{account.email}/rollups", headers=account.headers)),
+    "login": ("POST /login", 5, login),
+}
+
+
+def _serve_fake(ready: multiprocessing.Queue, latency: float, jitter: float) -> None:
+    serve(0, latency, jitter, ready=ready.put)
+
+
+def start_fake(latency: float, jitter: float) -> Tuple[multiprocessing.Process, str]:
+    """Start the fake Supabase in a child process and wait until it accepts connections."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_fake, args=(ready, latency, jitter), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+async def set_up(client: httpx.AsyncClient, users: int, seed_expenses: int) -> List[Account]:
+    """Register and log in the benchmark users, each with a custom category and `seed_expenses` expenses."""
+
+    async def set_up_account(index: int) -> Account:
+        account = Account(f"bench{index}@example.com")
+        credentials = {"email": account.email, "password": PASSWORD}
+        (await client.post("/register", json=credentials)).raise_for_status()
+        response = await client.post("/login", json=credentials)
+        response.raise_for_status()
+        account.token = response.json()["access_token"]
+        (await client.post("/categories", json={"name": "bench"}, headers=account.headers)).raise_for_status()
+        for start in range(0, seed_expenses, 500):
+            expenses = [random_expense() for _ in range(min(500, seed_expenses - start))]
+            response = await client.post("/expenses/bulk", json=expenses, headers=account.headers)
+            response.raise_for_status()
+            account.expense_ids.extend(result["id"] for result in response.json()["results"] if "id" in result)
+        if not account.expense_ids:
+            await create_expense(client, account)
+        return account
+
+    return list(await asyncio.gather(*(set_up_account(index) for index in range(users))))
+
+
+async def drive(client: httpx.AsyncClient, accounts: List[Account], scenarios: List[Scenario], requests: int,
+                concurrency: int) -> Tuple[List[Tuple[str, float, int]], float]:
+    """Send `requests` requests from `concurrency` workers. Returns (endpoint, seconds, status) samples and the wall
+    clock time taken."""
+    samples: List[Tuple[str, float, int]] = []
+    sent = itertools.count()
+    weights = [weight for _, weight, _ in scenarios]
+
+    async def worker():
+        while next(sent) < requests:
+            name, _, request = random.choices(scenarios, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = (await request(client, random.choice(accounts))).status_code
+            except Exception:
+                status = 0
+            samples.append((name, time.perf_counter() - started, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: List[Tuple[str, float, int]], elapsed: float) -> dict:
+    """Throughput and p50/p95/p99 latency (ms) per endpoint and overall."""
+
+    def stats(latencies: List[float], errors: int) -> dict:
+        p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+        return {"count": len(latencies), "errors": errors, "rps": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+                "max_ms": round(max(latencies) * 1000, 2)}
+
+    by_endpoint: Dict[str, Tuple[List[float], int]] = {}
+    for name, seconds, status in samples:
+        latencies, errors = by_endpoint.get(name, ([], 0))
+        latencies.append(seconds)
+        by_endpoint[name] = (latencies, errors + (not 200 <= status < 400))
+    endpoints = {name: stats(*by_endpoint[name]) for name in sorted(by_endpoint)}
+    overall = stats([seconds for _, seconds, _ in samples], sum(errors for _, errors in by_endpoint.values()))
+    return {"elapsed_s": round(elapsed, 3), "overall": overall, "endpoints": endpoints}
+
+
+def print_report(report: dict) -> None:
+    print(f"{'endpoint':40} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8}")
+    for name, stats in [*report["endpoints"].items(), ("overall", report["overall"])]:
+        print(f"{name:40} {stats['count']:7} {stats['errors']:6} {stats['rps']:8} {stats['p50_ms']:8} "
+              f"{stats['p95_ms']:8} {stats['p99_ms']:8} {stats['max_ms']:8}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import main  # Only now, so it picks up the fake's settings
+
+    scenarios = [SCENARIOS[name] for name in args.scenarios.split(",")]
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            accounts = await set_up(client, args.users, args.seed_expenses)
+            await drive(client, accounts, scenarios, args.warmup, args.concurrency)
+            samples, elapsed = await drive(client, accounts, scenarios, args.requests, args.concurrency)
+    return summarize(samples, elapsed)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--seed-expenses", type=int, default=200, help="Expenses created per user before the run")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200, help="Requests sent before measuring")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds the fake adds to every upstream request")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Any of {', '.join(SCENARIOS)}")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible request mixes")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    random.seed(args.seed)
+    fake, url = start_fake(args.latency, args.jitter)
+    os.environ.update({"SUPABASE_URL": url, "SUPABASE_ANON_KEY": ANON_KEY, "SUPABASE_SERVICE_KEY": SERVICE_KEY,
+                       "JWT_SECRET_KEY": JWT_SECRET})
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # Measure the app, not the per-user limits
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        fake.terminate()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
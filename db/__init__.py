@@ -1,2 +1,6 @@
-from .async_supabase_client import AsyncSupabaseClient
+from .async_supabase_client import AsyncSupabaseClient, FAST_JSON
+from .query import Query, quote
+from .resilience import UpstreamUnavailable, UpstreamBusy, CircuitBreaker
+from .backend import StorageBackend
+from .postgres_backend import PostgresBackend
 from .supabase import supabase
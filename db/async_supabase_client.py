@@ -1,11 +1,84 @@
-from typing import Optional
+from db.resilience import (CircuitBreaker, ConcurrencyLimiter, RetryBudget, LatencyWindow, UpstreamUnavailable,
+                           backoff)
+from typing import Optional, List, Callable, Awaitable, Hashable, Any, Union, Tuple, Dict
+from multidict import CIMultiDictProxy
+from functools import partial
+from yarl import URL
+from db.query import Query
 
+import logging
+import time
+import asyncio
 import aiohttp
 import json
+import copy
 import os
 
+try:
+    import orjson
+except ImportError:  # Only needed for the FAST_JSON path
+    orjson = None
+
 SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Connection pool and timeout tuning
+POOL_LIMIT = int(os.getenv("SUPABASE_POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.getenv("SUPABASE_POOL_LIMIT_PER_HOST", 0))  # 0 means no per-host limit
+KEEPALIVE_TIMEOUT = float(os.getenv("SUPABASE_KEEPALIVE_TIMEOUT", 60))
+DNS_CACHE_TTL = int(os.getenv("SUPABASE_DNS_CACHE_TTL", 300))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", 30))
+HTTP_TRACE = os.getenv("SUPABASE_HTTP_TRACE", "false").lower() == "true"
+SINGLE_FLIGHT = os.getenv("SUPABASE_SINGLE_FLIGHT", "true").lower() == "true"
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() == "true" and orjson is not None
+HEADER_CACHE_SIZE = 1024
+
+# Resilience: total time allowed per request by kind of endpoint, retries of idempotent reads, hedged reads and the
+# circuit breaker per upstream service (auth and rest)
+AUTH_TIMEOUT = float(os.getenv("SUPABASE_AUTH_TIMEOUT", 10))
+SELECT_TIMEOUT = float(os.getenv("SUPABASE_SELECT_TIMEOUT", 5))
+WRITE_TIMEOUT = float(os.getenv("SUPABASE_WRITE_TIMEOUT", 15))
+RETRY_ATTEMPTS = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", 2))
+RETRY_BASE_DELAY = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", 0.05))
+RETRY_MAX_DELAY = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", 1))
+RETRY_BUDGET_RATIO = float(os.getenv("SUPABASE_RETRY_BUDGET_RATIO", 0.2))
+HEDGE_READS = os.getenv("SUPABASE_HEDGE_READS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("SUPABASE_HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.getenv("SUPABASE_HEDGE_MIN_DELAY", 0.02))
+BREAKER_FAILURE_RATE = float(os.getenv("SUPABASE_BREAKER_FAILURE_RATE", 0.5))
+BREAKER_MIN_REQUESTS = int(os.getenv("SUPABASE_BREAKER_MIN_REQUESTS", 20))
+BREAKER_WINDOW = float(os.getenv("SUPABASE_BREAKER_WINDOW", 30))
+BREAKER_OPEN_SECONDS = float(os.getenv("SUPABASE_BREAKER_OPEN_SECONDS", 15))
+RETRYABLE_STATUSES = (502, 503, 504)
+# Admission control: outstanding upstream requests, and how many more may queue for how long before being shed
+MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", POOL_LIMIT))
+MAX_QUEUE = int(os.getenv("SUPABASE_MAX_QUEUE", 1000))
+QUEUE_TIMEOUT = float(os.getenv("SUPABASE_QUEUE_TIMEOUT", 5))
+
+logger = logging.getLogger(__name__)
+
+
+def _logging_trace_config() -> aiohttp.TraceConfig:
+    """Trace hooks logging every upstream request and whether it reused a pooled connection."""
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+        context.reused = False
+
+    async def on_connection_reuseconn(session, context, params):
+        context.reused = True
+
+    async def on_request_end(session, context, params):
+        elapsed = (time.perf_counter() - context.start) * 1000
+        logger.debug("%s %s -> %s in %.1fms (reused connection: %s)", params.method, params.url.path,
+                     params.response.status, elapsed, context.reused)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
 
 class AsyncSupabaseClient:
     def __init__(self, url: str, key: str):
@@ -15,12 +88,30 @@ class AsyncSupabaseClient:
             "Content-Type": "application/json",
             "prefer": "return=representation",
         }
+        self.service_headers = {**self.headers, "apikey": SERVICE_KEY, "Authorization": f"Bearer {SERVICE_KEY}"}
+        self._headers_by_token: dict[str, dict] = {}
+        self._inflight: dict[Hashable, Tuple[asyncio.Task, List[int]]] = {}
+        self.coalesced_requests = 0
+        self.breakers = {service: CircuitBreaker(service, BREAKER_FAILURE_RATE, BREAKER_MIN_REQUESTS, BREAKER_WINDOW,
+                                                 BREAKER_OPEN_SECONDS) for service in ("auth", "rest")}
+        self.retry_budget = RetryBudget(RETRY_BUDGET_RATIO)
+        self.limiter = ConcurrencyLimiter(MAX_CONCURRENCY, MAX_QUEUE, QUEUE_TIMEOUT)
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self.retried_requests = 0
+        self.hedged_requests = 0
         self.session: Optional[aiohttp.ClientSession] = None
 
-    async def _init_session(self) -> None:
-        """Initialize the aiohttp session."""
+    async def _init_session(self, trace_configs: Optional[List[aiohttp.TraceConfig]] = None) -> None:
+        """Initialize the aiohttp session with a pooled, keep-alive connector and request timeouts."""
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            trace_configs = list(trace_configs or [])
+            if HTTP_TRACE:
+                trace_configs.append(_logging_trace_config())
+            connector = aiohttp.TCPConnector(limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST,
+                                             keepalive_timeout=KEEPALIVE_TIMEOUT, ttl_dns_cache=DNS_CACHE_TTL,
+                                             use_dns_cache=True)
+            timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs)
 
     async def _close_session(self) -> None:
         """Close the aiohttp session when no longer needed."""
@@ -28,13 +119,120 @@ class AsyncSupabaseClient:
             await self.session.close()
             self.session = None
 
-    async def _request(self, method: str, endpoint: str, data: Optional[dict] = None, params: Optional[dict] = None,
-                       custom_headers: Optional[dict] = None) -> Optional[dict]:
-        """Generic function to handle HTTP requests."""
+    def pool_stats(self) -> dict:
+        """Return utilization of the connection pool (connections in use, idle keep-alive ones and queued requests)."""
+        connector = self.session.connector if self.session else None
+        if connector is None:
+            return {"limit": POOL_LIMIT, "limit_per_host": POOL_LIMIT_PER_HOST, "in_use": 0, "idle": 0, "waiting": 0}
+        return {
+            "limit": connector.limit,
+            "limit_per_host": connector.limit_per_host,
+            "in_use": len(connector._acquired),
+            "idle": sum(len(conns) for conns in connector._conns.values()),
+            "waiting": sum(len(waiters) for waiters in connector._waiters.values()),
+        }
+
+    def _auth_headers(self, token: str) -> dict:
+        """Return the full request headers for a bearer token, built once per token and reused."""
+        headers = self._headers_by_token.get(token)
+        if headers is None:
+            if len(self._headers_by_token) >= HEADER_CACHE_SIZE:
+                self._headers_by_token.clear()
+            headers = self._headers_by_token[token] = {**self.headers, "Authorization": f"Bearer {token}"}
+        return headers
+
+    async def _single_flight(self, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `request` once for all concurrent callers sharing the same key and hand each of them the result.
+
+        The upstream call runs in its own task so a cancelled caller doesn't cancel it for the others. When callers
+        joined an in-flight request, every one of them, the one that started it included, gets its own copy of the
+        result, so no one can mutate another caller's data. A request nobody joined hands over the result as is.
+        """
+        entry = self._inflight.get(key)
+        if entry is not None and not entry[0].done():
+            task, joined = entry
+            joined[0] += 1
+            self.coalesced_requests += 1
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(request())
+        joined = [0]  # Callers that joined, final once the task is done since no one joins a finished request
+        self._inflight[key] = (task, joined)
+
+        def _forget(done_task: asyncio.Task) -> None:
+            if self._inflight.get(key, (None,))[0] is done_task:
+                del self._inflight[key]
+            if not done_task.cancelled():
+                done_task.exception()  # Mark as retrieved in case every caller went away
+
+        task.add_done_callback(_forget)
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result) if joined[0] else result
+
+    async def _request(self, method: str, endpoint: str, data: Optional[Union[dict, list]] = None,
+                       params: Optional[Union[dict, list]] = None, headers: Optional[dict] = None) -> Optional[dict]:
+        """Generic function to handle HTTP requests. `headers` are the complete headers (defaults to the base ones)."""
+        return (await self._send(method, endpoint, data, params, headers))[1]
+
+    async def _send(self, method: str, endpoint: str, data: Optional[Union[dict, list]] = None,
+                    params: Optional[Union[dict, list]] = None,
+                    headers: Optional[dict] = None) -> Tuple[CIMultiDictProxy, Any]:
+        """
+        Send an HTTP request and return the response headers along with the decoded body.
+
+        Requests wait for a slot under the global concurrency cap (`UpstreamBusy` when too many are queued already),
+        are bounded by a per-endpoint timeout and go through the service's circuit breaker. Idempotent reads that time
+        out or get a 502/503/504 are retried with jittered backoff while the retry budget allows, and may be hedged
+        with a second request once they run slower than the endpoint's recent latency percentile. Upstream failures
+        that remain are raised as `UpstreamUnavailable`.
+        """
         url = endpoint if endpoint.startswith("http") else f"{self.base_url}/{endpoint}"
-        headers = {**self.headers, **(custom_headers or {})}
+        path = URL(url).path
+        service = "auth" if "/auth/v1/" in path else "rest"
+        breaker = self.breakers[service]
+        idempotent = method in ("GET", "HEAD")
+        # A per-request timeout replaces the session's one, so the socket timeouts have to be repeated here
+        timeout = aiohttp.ClientTimeout(total=AUTH_TIMEOUT if service == "auth" else
+                                        SELECT_TIMEOUT if idempotent else WRITE_TIMEOUT,
+                                        sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        # Keyed like the `endpoint` metric label (e.g. `/auth/v1/admin`), so ids in paths don't add windows forever
+        latencies = self.latencies.setdefault(f"{method} {'/'.join(path.split('/')[:4])}", LatencyWindow())
+        attempt = partial(self._attempt, method, url, data, params, headers or self.headers, timeout, latencies)
+        self.retry_budget.deposit()
+
+        retry = 0
+        while True:
+            async with self.limiter.slot():
+                probe = breaker.before_request()
+                try:
+                    result = await (self._hedged(attempt, latencies) if idempotent and HEDGE_READS else attempt())
+                except aiohttp.ClientResponseError as e:
+                    # An error response means the upstream is up, only server errors count as failures
+                    breaker.record(e.status < 500, probe)
+                    if e.status not in RETRYABLE_STATUSES:
+                        raise
+                    error = e
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    breaker.record(False, probe)
+                    error = e
+                else:
+                    breaker.record(True, probe)
+                    return result
 
-        async with self.session.request(method, url, headers=headers, json=data, params=params) as response:
+            if not idempotent or retry >= RETRY_ATTEMPTS or not self.retry_budget.withdraw():
+                raise UpstreamUnavailable(service, 1, type(error).__name__) from error
+            await asyncio.sleep(backoff(retry, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+            self.retried_requests += 1
+            retry += 1
+
+    async def _attempt(self, method: str, url: str, data: Optional[Union[dict, list]],
+                       params: Optional[Union[dict, list]], headers: dict, timeout: aiohttp.ClientTimeout,
+                       latencies: LatencyWindow) -> Tuple[CIMultiDictProxy, Any]:
+        """Send a single HTTP request, recording its latency when it succeeds."""
+        started = time.monotonic()
+        async with self.session.request(method, url, headers=headers, json=data, params=params,
+                                        timeout=timeout) as response:
             try:
                 response.raise_for_status()
             except aiohttp.ClientResponseError as e:
@@ -50,9 +248,60 @@ class AsyncSupabaseClient:
                 )
             content_type = response.headers.get("Content-Type", "")
             if "application/json" in content_type:
-                return await response.json()
-            text = await response.text()
-            return text if text else None
+                if FAST_JSON:
+                    raw = await response.read()
+                    body = orjson.loads(raw) if raw else None  # HEAD responses and `return=minimal` have no body
+                else:
+                    body = await response.json()
+            else:
+                text = await response.text()
+                body = text if text else None
+        latencies.add(time.monotonic() - started)
+        return response.headers, body
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[Any]], latencies: LatencyWindow) -> Any:
+        """
+        Run `attempt`, and if it hasn't finished after the endpoint's latency percentile run a second one. The first
+        to succeed wins and the other is cancelled.
+        """
+        delay = latencies.percentile(HEDGE_PERCENTILE)
+        if delay is None:
+            return await attempt()
+
+        tasks = {asyncio.ensure_future(attempt())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, HEDGE_MIN_DELAY))
+            if not done:
+                self.hedged_requests += 1
+                tasks.add(asyncio.ensure_future(attempt()))
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def resilience_stats(self) -> List[Tuple[str, dict, float]]:
+        """Return circuit breaker, retry and hedging samples as (name, labels, value)."""
+        states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        samples = []
+        for service, breaker in self.breakers.items():
+            labels = {"service": service}
+            samples.append(("supabase_circuit_state", labels, states[breaker.state]))
+            samples.append(("supabase_circuit_opened", labels, breaker.times_opened))
+            samples.append(("supabase_circuit_rejected", labels, breaker.rejected))
+        samples.append(("supabase_retried_requests", {}, self.retried_requests))
+        samples.append(("supabase_hedged_requests", {}, self.hedged_requests))
+        samples.append(("supabase_outstanding_requests", {}, self.limiter.active))
+        samples.append(("supabase_queued_requests", {}, len(self.limiter.waiters)))
+        samples.append(("supabase_shed_requests", {"reason": "queue_full"}, self.limiter.rejected))
+        samples.append(("supabase_shed_requests", {"reason": "queue_timeout"}, self.limiter.timed_out))
+        return samples
 
     async def sign_up(self, email: str, password: str) -> dict:
         """Sign up a new user."""
@@ -76,30 +325,65 @@ class AsyncSupabaseClient:
 
     async def delete_user(self, user_id: str) -> None:
         """Delete a user from Supabase Authentication and the database."""
-        headers = {"apikey": SERVICE_KEY, "Authorization": f"Bearer {SERVICE_KEY}"}
-        await self._request("DELETE", f"auth/v1/admin/users/{user_id}", custom_headers=headers)
-        await self._request("DELETE", f"rest/v1/users", params={"id": f"eq.{user_id}"}, custom_headers=headers)
-
-    async def select(self, table: str, token: str, params: Optional[dict] = None) -> Optional[dict]:
-        """Select data from a table."""
-        headers = {"Authorization": f"Bearer {token}"}
-        if params:
-            params = {key: f"eq.{value}" for key, value in params.items()}
-        return await self._request("GET", f"rest/v1/{table}", params=params, custom_headers=headers)
-
-    async def insert(self, table: str, data: dict, token: str) -> Optional[dict]:
-        """Insert data into a table."""
-        headers = {"Authorization": f"Bearer {token}"}
-        return await self._request("POST", f"rest/v1/{table}", data=data, custom_headers=headers)
-
-    async def update(self, table: str, filters: dict, data: dict, token: str) -> Optional[dict]:
-        """Update data in a table."""
-        headers = {"Authorization": f"Bearer {token}"}
-        params = {key: f"eq.{value}" for key, value in filters.items()}
-        return await self._request("PATCH", f"rest/v1/{table}", data=data, params=params, custom_headers=headers)
-
-    async def delete(self, table: str, filters: dict, token: str) -> Optional[dict]:
-        """Delete data from a table."""
-        headers = {"Authorization": f"Bearer {token}"}
-        params = {key: f"eq.{value}" for key, value in filters.items()}
-        return await self._request("DELETE", f"rest/v1/{table}", params=params, custom_headers=headers)
+        await self._request("DELETE", f"auth/v1/admin/users/{user_id}", headers=self.service_headers)
+        await self._request("DELETE", f"rest/v1/users", params={"id": f"eq.{user_id}"}, headers=self.service_headers)
+
+    def _query_request(self, token: str, filters: Optional[Union[dict, Query]]) -> Tuple[list, dict]:
+        """Turn equality filters or a `Query` into query string parameters and request headers."""
+        headers = self._auth_headers(token)
+        if isinstance(filters, Query):
+            extra_headers = filters.headers()
+            if not extra_headers:
+                return filters.params(), headers
+            if "prefer" in extra_headers:
+                extra_headers["prefer"] = f"{headers['prefer']},{extra_headers['prefer']}"
+            return filters.params(), {**headers, **extra_headers}
+        return [(key, f"eq.{value}") for key, value in (filters or {}).items()], headers
+
+    async def select(self, table: str, token: str, params: Optional[Union[dict, Query]] = None) -> Optional[list]:
+        """
+        Select data from a table. `params` are either equality filters or a `Query`.
+
+        Identical concurrent selects share a single upstream request.
+        """
+        params, headers = self._query_request(token, params)
+        request = partial(self._request, "GET", f"rest/v1/{table}", params=params, headers=headers)
+        if not SINGLE_FLIGHT:
+            return await request()
+        key = (table, token, tuple(sorted(params)), tuple(sorted(headers.items())))
+        return await self._single_flight(key, request)
+
+    async def count(self, table: str, token: str, query: Query, method: str = "exact") -> int:
+        """Count the rows matching the query with a HEAD request, without transferring them."""
+        params, headers = self._query_request(token, query.count(method))
+        response_headers, _ = await self._send("HEAD", f"rest/v1/{table}", params=params, headers=headers)
+        # Content-Range looks like "0-24/3573", or "*/0" when nothing matched
+        total = response_headers.get("Content-Range", "*/0").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
+
+    async def insert(self, table: str, data: Union[dict, list], token: str) -> Optional[list]:
+        """Insert data into a table. A list of rows is inserted in a single request."""
+        headers = self._auth_headers(token)
+        return await self._request("POST", f"rest/v1/{table}", data=data, headers=headers)
+
+    async def upsert(self, table: str, data: Union[dict, list], token: str, on_conflict: str = "id",
+                     ignore_duplicates: bool = False) -> Optional[list]:
+        """
+        Insert rows, or merge them into the existing rows conflicting on the `on_conflict` columns. With
+        `ignore_duplicates`, conflicting rows are skipped instead and only the inserted rows are returned.
+        """
+        headers = self._auth_headers(token)
+        resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+        headers = {**headers, "prefer": f"{headers['prefer']},resolution={resolution}"}
+        return await self._request("POST", f"rest/v1/{table}", data=data, params={"on_conflict": on_conflict},
+                                   headers=headers)
+
+    async def update(self, table: str, filters: Union[dict, Query], data: dict, token: str) -> Optional[list]:
+        """Update the rows matching equality filters or a `Query`."""
+        params, headers = self._query_request(token, filters)
+        return await self._request("PATCH", f"rest/v1/{table}", data=data, params=params, headers=headers)
+
+    async def delete(self, table: str, filters: Union[dict, Query], token: str) -> Optional[list]:
+        """Delete the rows matching equality filters or a `Query`."""
+        params, headers = self._query_request(token, filters)
+        return await self._request("DELETE", f"rest/v1/{table}", params=params, headers=headers)
@@ -0,0 +1,32 @@
+from typing import Optional, Protocol, Union, runtime_checkable
+from db.query import Query
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """
+    Table access used by the `Supabase` facade. `AsyncSupabaseClient` implements it over PostgREST, which is the
+    default, and `PostgresBackend` over a direct database connection.
+
+    `filters` are either equality filters (`{"column": value}`) or a `Query`. `token` is the caller's JWT (or the anon
+    key), backends that don't go through PostgREST may ignore it.
+    """
+
+    async def select(self, table: str, token: str, params: Optional[Union[dict, Query]] = None) -> Optional[list]:
+        ...
+
+    async def count(self, table: str, token: str, query: Query, method: str = "exact") -> int:
+        ...
+
+    async def insert(self, table: str, data: Union[dict, list], token: str) -> Optional[list]:
+        ...
+
+    async def upsert(self, table: str, data: Union[dict, list], token: str, on_conflict: str = "id",
+                     ignore_duplicates: bool = False) -> Optional[list]:
+        ...
+
+    async def update(self, table: str, filters: Union[dict, Query], data: dict, token: str) -> Optional[list]:
+        ...
+
+    async def delete(self, table: str, filters: Union[dict, Query], token: str) -> Optional[list]:
+        ...
@@ -0,0 +1,152 @@
+from db.sql import (filter_params, compile_select, compile_count, compile_insert, compile_upsert, compile_update,
+                    compile_delete)
+from multidict import CIMultiDict, CIMultiDictProxy
+from typing import Dict, Optional, Union
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from db.query import Query
+from yarl import URL
+
+import aiohttp
+import uuid
+import os
+
+try:
+    import asyncpg
+except ImportError:  # Only needed for the postgres storage backend
+    asyncpg = None
+
+DATABASE_SCHEMA = os.getenv("DATABASE_SCHEMA", "public")
+DATABASE_POOL_MIN = int(os.getenv("DATABASE_POOL_MIN", 5))
+DATABASE_POOL_MAX = int(os.getenv("DATABASE_POOL_MAX", 20))
+# Prepared statements cached per connection, set to 0 behind a transaction-mode pooler such as PgBouncer
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", 100))
+
+# SQLSTATE -> HTTP status, following PostgREST's mapping so the services see the same errors as with REST
+SQLSTATE_STATUS = {"23503": 409, "23505": 409, "23502": 400, "23514": 400, "22P02": 400, "22007": 400,
+                   "42703": 400, "42501": 403, "42P01": 404}
+
+
+def _coerce(type_name: Optional[str], value):
+    """Convert a PostgREST-style string value to the Python type asyncpg expects for the column's type."""
+    if not isinstance(value, str) or type_name is None:
+        return value
+    if type_name in ("int2", "int4", "int8"):
+        return int(value)
+    if type_name in ("float4", "float8"):
+        return float(value)
+    if type_name == "numeric":
+        return Decimal(value)
+    if type_name == "bool":
+        return value.lower() == "true"
+    if type_name in ("timestamptz", "timestamp"):
+        parsed = datetime.fromisoformat(value)
+        # Like Postgres with Supabase's default UTC time zone, times without an offset are taken as UTC
+        return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None and type_name == "timestamptz" else parsed
+    if type_name == "date":
+        return date.fromisoformat(value[:10])
+    if type_name == "uuid":
+        return uuid.UUID(value)
+    return value
+
+
+def _json_value(value):
+    """Convert a column value to what PostgREST would have returned in its JSON."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class PostgresBackend:
+    """
+    Storage backend querying Postgres directly through an asyncpg connection pool, skipping the PostgREST hop.
+
+    Queries are compiled from the same `Query`/equality filters the REST backend sends, and run as prepared statements
+    cached per connection. Parameters are converted to the column types read from the schema on connect.
+
+    Connecting as a database role bypasses the row-level security PostgREST applies for the caller's JWT, so `token`
+    is ignored and every query relies on the `user_id` scoping the services already do.
+    """
+
+    def __init__(self, dsn: str, min_size: int = DATABASE_POOL_MIN, max_size: int = DATABASE_POOL_MAX,
+                 statement_cache_size: int = DATABASE_STATEMENT_CACHE_SIZE, schema: str = DATABASE_SCHEMA):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.schema = schema
+        self.pool: Optional["asyncpg.Pool"] = None
+        self.column_types: Dict[str, Dict[str, str]] = {}  # table -> column -> type name (e.g. `uuid`, `numeric`)
+
+    async def connect(self) -> None:
+        """Open the connection pool and read the column types of the schema's tables."""
+        if asyncpg is None:
+            raise RuntimeError("The postgres storage backend requires asyncpg")
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size,
+                                                  statement_cache_size=self.statement_cache_size)
+            columns = await self.pool.fetch("SELECT table_name, column_name, udt_name FROM information_schema.columns "
+                                            "WHERE table_schema = $1", self.schema)
+            for column in columns:
+                self.column_types.setdefault(column["table_name"], {})[column["column_name"]] = column["udt_name"]
+
+    async def close(self) -> None:
+        """Close the connection pool."""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def pool_stats(self) -> dict:
+        """Return utilization of the connection pool."""
+        if self.pool is None:
+            return {"max": self.max_size, "size": 0, "idle": 0}
+        return {"max": self.pool.get_max_size(), "size": self.pool.get_size(), "idle": self.pool.get_idle_size()}
+
+    async def _fetch(self, method: str, table: str, sql: str, params: list) -> list:
+        """Run a statement and return its rows as JSON-ready dicts, raising database errors like PostgREST would."""
+        types = self.column_types.get(table, {})
+        args = [_coerce(types.get(column), value) for column, value in params]
+        try:
+            rows = await self.pool.fetch(sql, *args)
+        except asyncpg.PostgresError as e:
+            status = SQLSTATE_STATUS.get(e.sqlstate, 500)
+            url = URL(f"postgres:///{table}")
+            request_info = aiohttp.RequestInfo(url, method, CIMultiDictProxy(CIMultiDict()), url)
+            raise aiohttp.ClientResponseError(request_info, (), status=status, message=e.args[0] if e.args else "")
+        return [{key: _json_value(value) for key, value in row.items()} for row in rows]
+
+    async def select(self, table: str, token: str, params: Optional[Union[dict, Query]] = None) -> Optional[list]:
+        query_params, headers = filter_params(params)
+        return await self._fetch("GET", table, *compile_select(table, query_params, headers))
+
+    async def count(self, table: str, token: str, query: Query, method: str = "exact") -> int:
+        """Count the matching rows. The count is always exact, there's no planner estimate to fall back on."""
+        query_params, _ = filter_params(query)
+        rows = await self._fetch("HEAD", table, *compile_count(table, query_params))
+        return rows[0]["count"]
+
+    async def insert(self, table: str, data: Union[dict, list], token: str) -> Optional[list]:
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return []
+        return await self._fetch("POST", table, *compile_insert(table, rows))
+
+    async def upsert(self, table: str, data: Union[dict, list], token: str, on_conflict: str = "id",
+                     ignore_duplicates: bool = False) -> Optional[list]:
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return []
+        return await self._fetch("POST", table, *compile_upsert(table, rows, on_conflict.split(","),
+                                                                ignore_duplicates))
+
+    async def update(self, table: str, filters: Union[dict, Query], data: dict, token: str) -> Optional[list]:
+        query_params, _ = filter_params(filters)
+        return await self._fetch("PATCH", table, *compile_update(table, query_params, data))
+
+    async def delete(self, table: str, filters: Union[dict, Query], token: str) -> Optional[list]:
+        query_params, _ = filter_params(filters)
+        return await self._fetch("DELETE", table, *compile_delete(table, query_params))
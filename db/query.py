@@ -0,0 +1,119 @@
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+def quote(value: Any) -> str:
+    """Quote a value for use inside a PostgREST logical filter such as `or=(...)`."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class Query:
+    """
+    Builder for PostgREST queries: filters, column projection, ordering, limit/offset and the `Range` and
+    `Prefer: count=...` headers.
+
+    Every method returns the query itself so calls can be chained, e.g.
+    `Query().select("id", "amount").eq("user_id", user_id).gte("amount", 10).order("created_at", desc=True).limit(50)`.
+    """
+
+    def __init__(self):
+        self._filters: List[Tuple[str, str]] = []
+        self._columns: Optional[str] = None
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+        self._range: Optional[Tuple[int, int]] = None
+        self._count: Optional[str] = None
+
+    def _filter(self, column: str, operator: str, value: Any) -> "Query":
+        self._filters.append((column, f"{operator}.{value}"))
+        return self
+
+    def eq(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "Query":
+        return self._filter(column, "lte", value)
+
+    def in_(self, column: str, values: Iterable[Any]) -> "Query":
+        return self._filter(column, "in", f"({','.join(quote(value) for value in values)})")
+
+    def like(self, column: str, pattern: str) -> "Query":
+        """Case-sensitive pattern match, `*` is the wildcard."""
+        return self._filter(column, "like", pattern)
+
+    def ilike(self, column: str, pattern: str) -> "Query":
+        """Case-insensitive pattern match, `*` is the wildcard."""
+        return self._filter(column, "ilike", pattern)
+
+    def is_(self, column: str, value: Optional[bool]) -> "Query":
+        """Check for exact equality against null, true or false."""
+        return self._filter(column, "is", "null" if value is None else str(value).lower())
+
+    def or_(self, *conditions: str) -> "Query":
+        """Add a disjunction of raw PostgREST conditions, e.g. `created_at.lt."2025-01-01"`."""
+        self._filters.append(("or", f"({','.join(conditions)})"))
+        return self
+
+    def select(self, *columns: str) -> "Query":
+        """Only return the given columns instead of `*`."""
+        self._columns = ",".join(columns)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "Query":
+        self._order.append(f"{column}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count: int) -> "Query":
+        self._limit = count
+        return self
+
+    def offset(self, count: int) -> "Query":
+        self._offset = count
+        return self
+
+    def range(self, start: int, end: int) -> "Query":
+        """Request rows `start` to `end` (inclusive) through the `Range` header."""
+        self._range = (start, end)
+        return self
+
+    def count(self, method: str = "exact") -> "Query":
+        """Ask PostgREST to report the total row count (`exact`, `planned` or `estimated`) in `Content-Range`."""
+        if method not in ("exact", "planned", "estimated"):
+            raise ValueError(f"Unknown count method: {method}")
+        self._count = method
+        return self
+
+    def params(self) -> List[Tuple[str, str]]:
+        """Return the query string parameters. A list is used since PostgREST allows repeating a column."""
+        params = list(self._filters)
+        if self._columns:
+            params.append(("select", self._columns))
+        if self._order:
+            params.append(("order", ",".join(self._order)))
+        if self._limit is not None:
+            params.append(("limit", str(self._limit)))
+        if self._offset is not None:
+            params.append(("offset", str(self._offset)))
+        return params
+
+    def headers(self) -> dict:
+        """Return the extra request headers for the range and count options."""
+        headers = {}
+        if self._range:
+            headers["Range-Unit"] = "items"
+            headers["Range"] = f"{self._range[0]}-{self._range[1]}"
+        if self._count:
+            headers["prefer"] = f"count={self._count}"
+        return headers
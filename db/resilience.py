@@ -0,0 +1,200 @@
+from typing import AsyncIterator, Deque, Optional, Tuple
+from contextlib import asynccontextmanager
+from collections import deque
+
+import asyncio
+import random
+import time
+
+
+class UpstreamUnavailable(Exception):
+    """Supabase is failing or the circuit breaker is open. Answered with 503 and `Retry-After`."""
+
+    def __init__(self, service: str, retry_after: float, reason: str = "Upstream unavailable"):
+        super().__init__(f"{reason}: {service}")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class UpstreamBusy(Exception):
+    """Too many Supabase requests are outstanding and queued already. Answered with 429 and `Retry-After`."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many outstanding upstream requests")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of outstanding upstream requests. Requests over the cap wait in a FIFO queue for up to
+    `queue_timeout` seconds, and are rejected with `UpstreamBusy` when the queue is full or the wait times out.
+    A `limit` of 0 disables the cap.
+    """
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.rejected = 0
+        self.timed_out = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self.limit <= 0:
+            yield
+            return
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamBusy(self.queue_timeout)
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was handed over just as the wait ended, pass it on
+            else:
+                future.cancel()
+                try:
+                    self.waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise UpstreamBusy(self.queue_timeout) from None
+            raise
+
+    def _release(self) -> None:
+        """Hand the slot over to the longest waiting request, or free it."""
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class CircuitBreaker:
+    """
+    Fails requests fast once the upstream error rate over a sliding window crosses a threshold.
+
+    Closed: requests flow and their outcomes are counted. Open: requests are rejected until `open_seconds` have passed.
+    Half-open: one probe request is let through, its outcome closes the circuit again or reopens it.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, service: str, failure_rate: float = 0.5, min_requests: int = 20, window: float = 30,
+                 open_seconds: float = 15):
+        self.service = service
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.outcomes: Deque[Tuple[float, bool]] = deque()  # (time, succeeded) within the window
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_request(self) -> bool:
+        """Raise `UpstreamUnavailable` if the request must not be sent. Returns whether it is the half-open probe."""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise UpstreamUnavailable(self.service, remaining, "Circuit open")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                self.rejected += 1
+                raise UpstreamUnavailable(self.service, 1, "Circuit half-open")
+            self.probing = True
+            return True
+        return False
+
+    def record(self, succeeded: bool, probe: bool = False) -> None:
+        """Count the outcome of a request that `before_request` let through."""
+        if probe:
+            self.probing = False
+            self._close() if succeeded else self._open()
+            return
+        if self.state != self.CLOSED:
+            return  # Requests sent before the circuit opened don't count towards the next window
+
+        now = time.monotonic()
+        self.outcomes.append((now, succeeded))
+        self.failures += not succeeded
+        while self.outcomes and self.outcomes[0][0] < now - self.window:
+            self.failures -= not self.outcomes.popleft()[1]
+        if len(self.outcomes) >= self.min_requests and self.failures / len(self.outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+        self.failures = 0
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self.outcomes.clear()
+        self.failures = 0
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of the requests sent, plus a small reserve, so retries can't multiply the load on an
+    upstream that is already struggling.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = reserve
+
+    def deposit(self) -> None:
+        self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful requests to one endpoint, to decide when to send a hedged request."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0 for the first retry)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,186 @@
+from typing import Any, List, Optional, Tuple, Union
+from db.query import Query
+
+import re
+
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+COMPARISONS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "like": "LIKE",
+               "ilike": "ILIKE"}
+RESERVED_PARAMS = {"select", "order", "limit", "offset"}
+
+# (column the value is compared with or written to, value), so the backend can convert it to the column's type
+Param = Tuple[Optional[str], Any]
+
+
+def identifier(name: str) -> str:
+    """Quote a table or column name, rejecting anything that isn't a plain identifier."""
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return f'"{name}"'
+
+
+def filter_params(filters: Optional[Union[dict, Query]]) -> Tuple[List[Tuple[str, str]], dict]:
+    """Turn equality filters or a `Query` into the PostgREST parameters and headers the SQL is compiled from."""
+    if isinstance(filters, Query):
+        return filters.params(), filters.headers()
+    return [(key, f"eq.{value}") for key, value in (filters or {}).items()], {}
+
+
+def _split(text: str) -> List[str]:
+    """Split on top-level commas, keeping quoted values and parenthesized groups together."""
+    parts, depth, quoted, start, index = [], 0, False, 0, 0
+    while index < len(text):
+        char = text[index]
+        if quoted and char == "\\":
+            index += 1
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and not depth and char == ",":
+            parts.append(text[start:index])
+            start = index + 1
+        index += 1
+    parts.append(text[start:])
+    return [part for part in parts if part]
+
+
+def _unquote(value: str) -> str:
+    """Undo `db.query.quote`."""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+class _Compiler:
+    """Accumulates positional parameters while PostgREST filters are translated to a SQL condition."""
+
+    def __init__(self):
+        self.params: List[Param] = []
+
+    def param(self, column: Optional[str], value: Any) -> str:
+        self.params.append((column, value))
+        return f"${len(self.params)}"
+
+    def condition(self, column: str, expression: str) -> str:
+        """Translate `[not.]operator.value` applied to a column."""
+        negate = expression.startswith("not.")
+        if negate:
+            expression = expression[4:]
+        operator, _, value = expression.partition(".")
+        quoted_column = identifier(column)
+        if operator == "in":
+            values = [_unquote(item) for item in _split(value[1:-1])]
+            sql = (f"{quoted_column} IN ({', '.join(self.param(column, item) for item in values)})" if values
+                   else "FALSE")
+        elif operator == "is":
+            keyword = {"null": "NULL", "true": "TRUE", "false": "FALSE"}.get(value.lower())
+            if keyword is None:
+                raise ValueError(f"Invalid value for is: {value!r}")
+            sql = f"{quoted_column} IS {keyword}"
+        elif operator in COMPARISONS:
+            value = _unquote(value)
+            if operator in ("like", "ilike"):
+                value = value.replace("*", "%")
+            sql = f"{quoted_column} {COMPARISONS[operator]} {self.param(column, value)}"
+        else:
+            raise ValueError(f"Unsupported operator: {operator}")
+        return f"NOT ({sql})" if negate else sql
+
+    def logical(self, operator: str, body: str) -> str:
+        """Translate the body of `or=(...)`/`and=(...)`, which may nest `or(...)`/`and(...)` groups."""
+        conditions = []
+        for condition in _split(body.strip()[1:-1]):
+            if condition.startswith(("or(", "and(")):
+                name, _, rest = condition.partition("(")
+                conditions.append(self.logical(name, "(" + rest))
+            else:
+                column, _, expression = condition.partition(".")
+                conditions.append(self.condition(column, expression))
+        return "(" + f" {operator.upper()} ".join(conditions) + ")"
+
+    def where(self, params: List[Tuple[str, str]]) -> str:
+        conditions = [self.logical(key, value) if key in ("or", "and") else self.condition(key, value)
+                      for key, value in params if key not in RESERVED_PARAMS]
+        return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _order_by(order: str) -> str:
+    terms = []
+    for term in order.split(","):
+        column, *modifiers = term.split(".")
+        direction = " DESC" if "desc" in modifiers else ""
+        nulls = " NULLS FIRST" if "nullsfirst" in modifiers else " NULLS LAST" if "nullslast" in modifiers else ""
+        terms.append(f"{identifier(column)}{direction}{nulls}")
+    return " ORDER BY " + ", ".join(terms)
+
+
+def compile_select(table: str, params: List[Tuple[str, str]], headers: Optional[dict] = None) -> Tuple[str, list]:
+    """Compile a PostgREST read (filters, `select`, `order`, `limit`/`offset` and the `Range` header) to SQL."""
+    compiler, options = _Compiler(), dict(params)
+    columns = options.get("select", "*")
+    columns = "*" if columns == "*" else ", ".join(identifier(column) for column in columns.split(","))
+    sql = f"SELECT {columns} FROM {identifier(table)}{compiler.where(params)}"
+    if "order" in options:
+        sql += _order_by(options["order"])
+
+    offset = int(options.get("offset", 0))
+    limit = int(options["limit"]) if "limit" in options else None
+    if headers and "Range" in headers:
+        first, _, last = headers["Range"].partition("-")
+        offset, limit = offset + int(first), int(last) - int(first) + 1 if last else limit
+    if limit is not None:
+        sql += f" LIMIT {compiler.param(None, limit)}"
+    if offset:
+        sql += f" OFFSET {compiler.param(None, offset)}"
+    return sql, compiler.params
+
+
+def compile_count(table: str, params: List[Tuple[str, str]]) -> Tuple[str, list]:
+    compiler = _Compiler()
+    return f"SELECT count(*) FROM {identifier(table)}{compiler.where(params)}", compiler.params
+
+
+def _insert(table: str, rows: List[dict]) -> Tuple[str, list]:
+    compiler = _Compiler()
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    values = ", ".join("(" + ", ".join(compiler.param(column, row[column]) if column in row else "DEFAULT"
+                                       for column in columns) + ")" for row in rows)
+    return f"INSERT INTO {identifier(table)} ({', '.join(map(identifier, columns))}) VALUES {values}", compiler.params
+
+
+def compile_insert(table: str, rows: List[dict]) -> Tuple[str, list]:
+    """Compile a single multi-row insert. Columns missing from a row get their default, like PostgREST does."""
+    sql, params = _insert(table, rows)
+    return f"{sql} RETURNING *", params
+
+
+def compile_upsert(table: str, rows: List[dict], on_conflict: List[str],
+                   ignore_duplicates: bool = False) -> Tuple[str, list]:
+    """
+    Compile an insert that merges rows conflicting on the `on_conflict` columns into the existing ones, or skips them
+    with `ignore_duplicates`.
+    """
+    sql, params = _insert(table, rows)
+    columns = [] if ignore_duplicates else [column for column in dict.fromkeys(column for row in rows for column in row)
+                                            if column not in on_conflict]
+    assignments = ", ".join(f"{identifier(column)} = EXCLUDED.{identifier(column)}" for column in columns)
+    action = f"DO UPDATE SET {assignments}" if columns else "DO NOTHING"
+    return f"{sql} ON CONFLICT ({', '.join(map(identifier, on_conflict))}) {action} RETURNING *", params
+
+
+def compile_update(table: str, params: List[Tuple[str, str]], data: dict) -> Tuple[str, list]:
+    compiler = _Compiler()
+    assignments = ", ".join(f"{identifier(column)} = {compiler.param(column, value)}" for column, value in data.items())
+    where = compiler.where(params)
+    if not where:
+        raise ValueError("UPDATE requires a WHERE clause")
+    return f"UPDATE {identifier(table)} SET {assignments}{where} RETURNING *", compiler.params
+
+
+def compile_delete(table: str, params: List[Tuple[str, str]]) -> Tuple[str, list]:
+    compiler = _Compiler()
+    where = compiler.where(params)
+    if not where:
+        raise ValueError("DELETE requires a WHERE clause")
+    return f"DELETE FROM {identifier(table)}{where} RETURNING *", compiler.params
@@ -1,6 +1,8 @@
-from db import AsyncSupabaseClient
+from typing import Optional, Tuple, List, AsyncIterator, Sequence
+from aiohttp import ClientResponseError
+from db import AsyncSupabaseClient, PostgresBackend, StorageBackend, Query, quote
 from dotenv import load_dotenv
-from typing import Optional
+from models import ExpenseFilters
 
 import os
 
@@ -8,15 +10,42 @@ import os
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # For background jobs working across users
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "rest").lower()  # "rest" (PostgREST) or "postgres" (DATABASE_URL)
+DATABASE_URL = os.getenv("DATABASE_URL")
 
 
 class Supabase:
     def __init__(self):
         self.client = AsyncSupabaseClient(SUPABASE_URL, SUPABASE_KEY)  # Initialize the Supabase client
+        # Table access goes through the storage backend, authentication always goes through Supabase
+        if STORAGE_BACKEND == "postgres":
+            self.db: StorageBackend = PostgresBackend(DATABASE_URL)
+        elif STORAGE_BACKEND == "rest":
+            self.db: StorageBackend = self.client
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+    async def open(self, trace_configs: Optional[list] = None) -> None:
+        """Open the pooled HTTP session, and the storage backend's connections if it has its own."""
+        await self.client._init_session(trace_configs=trace_configs)
+        if self.db is not self.client:
+            await self.db.connect()
+
+    async def close(self) -> None:
+        """Close the storage backend's connections and the HTTP session."""
+        if self.db is not self.client:
+            await self.db.close()
+        await self.client._close_session()
 
     # User-related methods
     async def register_user(self, email: str, password: str) -> dict:
-        """Register a new user if the user exists."""
+        """
+        Register a new user if the user doesn't exist yet.
+
+        The users lookup has to finish before the sign-up is sent: Supabase Auth resends the confirmation mail when
+        an unconfirmed email signs up again, and a failed lookup must not let the registration through.
+        """
         existing_user = await self.get_user_by_email(email, SUPABASE_KEY)
         if existing_user:
             raise ValueError(f"User with email {email} already exists.")
@@ -28,14 +57,13 @@ class Supabase:
         return await self.client.send_password_reset_email(email)
 
     async def login_user(self, email: str, password: str) -> dict:
-        """Log in a user using their email and password. Add them to the `users` table if they don't exist."""
-        existing_user = await self.get_user_by_email(email, SUPABASE_KEY)
+        """
+        Log in a user using their email and password. Their `users` row is created if missing with one upsert that
+        skips existing rows, so the anon key only needs to be allowed to INSERT into `users`.
+        """
         login_response = await self.client.sign_in(email, password)
-
         user_data = {"id": login_response["user"]["id"], "email": email}
-        if not existing_user:
-            await self.client.insert("users", user_data, SUPABASE_KEY)
-
+        await self.db.upsert("users", user_data, SUPABASE_KEY, on_conflict="id", ignore_duplicates=True)
         return login_response
 
     async def refresh_token(self, refresh_token: str) -> dict:
@@ -48,60 +76,170 @@ class Supabase:
 
     async def get_user_by_email(self, email: str, token: str) -> Optional[dict]:
         """Retrieve a user by their email."""
-        user = await self.client.select("users", token, {"email": email})
+        user = await self.db.select("users", token, {"email": email})
         return user[0] if user else None
 
     # Expense-related methods
-    async def create_expense(self, user: tuple, amount: float, category: str, description: Optional[str] = None):
+    async def create_expense(self, user: tuple, expense: dict) -> dict:
         """Create an expense for a user."""
-        expense_data = {"user_id": user[0]["id"], "amount": amount, "category": category.lower(),
-                        "description": description}
-        expense = await self.client.insert("expenses", expense_data, user[1])
+        expense_data = {**expense, "user_id": user[0]["id"], "category": expense["category"].lower()}
+        expense = await self.db.insert("expenses", expense_data, user[1])
         return expense[0] if expense else {}
 
+    async def create_expenses(self, user: tuple, expenses: List[dict]) -> List[dict]:
+        """Create several expenses for a user with a single array insert. Rows are returned in the same order."""
+        rows = [{**expense, "user_id": user[0]["id"], "category": expense["category"].lower()} for expense in expenses]
+        return await self.db.insert("expenses", rows, user[1]) or []
+
     async def get_expense_by_id(self, expense_id: str, user: tuple) -> Optional[dict]:
         """Get an expense by its ID."""
-        expenses = await self.client.select("expenses", user[1], {"id": expense_id})
+        expenses = await self.db.select("expenses", user[1], {"id": expense_id})
         return expenses[0] if expenses else None
 
-    async def get_expenses_by_user(self, user: tuple):
-        """Get all expenses for a specific user."""
-        return await self.client.select("expenses", user[1], {"user_id": user[0]["id"]})
-
-    async def get_expenses_by_user_and_category(self, user: tuple, category: str):
-        """Get expenses for a specific user and category."""
-        params = {"user_id": user[0]["id"], "category": category.lower()}
-        return await self.client.select("expenses", user[1], params)
+    async def get_expenses_by_ids(self, user: tuple, expense_ids: List[str]) -> List[dict]:
+        """Get several of the user's expenses by their IDs with one request, in no particular order."""
+        query = Query().eq("user_id", user[0]["id"]).in_("id", expense_ids)
+        return await self.db.select("expenses", user[1], query) or []
+
+    async def get_expenses_by_user(self, user: tuple, filters: Optional[ExpenseFilters] = None,
+                                   after: Optional[Tuple[str, str]] = None, columns: Optional[Sequence[str]] = None):
+        """
+        Get expenses for a specific user. Without filters all of them are returned.
+
+        With filters, a page of up to `filters.limit` expenses is returned, ordered by (created_at, id) and starting
+        after the `after` keyset (the created_at and id of the last expense of the previous page). `columns` limits
+        the returned columns, `created_at` and `id` are always included.
+        """
+        if filters is None:
+            return await self.db.select("expenses", user[1], {"user_id": user[0]["id"]})
+
+        query = Query().eq("user_id", user[0]["id"])
+        if columns:
+            query.select(*dict.fromkeys(["id", "created_at", *columns]))
+        if filters.start_date:
+            query.gte("created_at", filters.start_date.isoformat())
+        if filters.end_date:
+            query.lte("created_at", filters.end_date.isoformat())
+        if filters.category:
+            query.eq("category", filters.category.lower())
+        if filters.payment_method:
+            query.eq("payment_method", filters.payment_method.value)
+        if filters.currency:
+            query.eq("currency", filters.currency.value)
+        if filters.min_amount is not None:
+            query.gte("amount", filters.min_amount)
+        if filters.max_amount is not None:
+            query.lte("amount", filters.max_amount)
+
+        desc = filters.order == "desc"
+        if after:
+            created_at, expense_id = map(quote, after)
+            operator = "lt" if desc else "gt"
+            query.or_(f"created_at.{operator}.{created_at}",
+                      f"and(created_at.eq.{created_at},id.{operator}.{expense_id})")
+        query.order("created_at", desc=desc).order("id", desc=desc).limit(filters.limit)
+        return await self.db.select("expenses", user[1], query)
+
+    async def has_expenses_in_category(self, user: tuple, category: str) -> bool:
+        """Check whether the user has any expense in the category, fetching at most one id."""
+        query = Query().select("id").eq("user_id", user[0]["id"]).eq("category", category.lower()).limit(1)
+        return bool(await self.db.select("expenses", user[1], query))
+
+    async def iter_expenses_by_user(self, user: tuple, filters: Optional[ExpenseFilters] = None,
+                                    page_size: int = 1000,
+                                    columns: Optional[Sequence[str]] = None) -> AsyncIterator[List[dict]]:
+        """Yield pages of a user's expenses following the (created_at, id) keyset, holding one page at a time."""
+        filters = (filters or ExpenseFilters(order="asc")).model_copy(update={"limit": page_size, "cursor": None})
+        after = None
+        while True:
+            page = await self.get_expenses_by_user(user, filters, after, columns)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1]["created_at"], page[-1]["id"])
 
     async def update_expense(self, expense_id: str, data: dict, user: tuple):
-        """Update an expense's details."""
-        expense = await self.client.update("expenses", {"id": expense_id}, data, user[1])
+        """Update an expense's details if it belongs to the user. Returns an empty dict when nothing matched."""
+        filters = {"id": expense_id, "user_id": user[0]["id"]}
+        expense = await self.db.update("expenses", filters, data, user[1])
         return expense[0] if expense else {}
 
     async def delete_expense(self, expense_id: str, user: tuple):
-        """Delete an expense by its ID."""
-        return await self.client.delete("expenses", {"id": expense_id}, user[1])
+        """Delete an expense by its ID if it belongs to the user. Returns the deleted rows."""
+        return await self.db.delete("expenses", {"id": expense_id, "user_id": user[0]["id"]}, user[1]) or []
+
+    async def update_expenses(self, expense_ids: List[str], data: dict, user: tuple) -> List[dict]:
+        """Apply the same changes to several of the user's expenses in one request. Returns the updated rows."""
+        query = Query().eq("user_id", user[0]["id"]).in_("id", expense_ids)
+        return await self.db.update("expenses", query, data, user[1]) or []
+
+    async def delete_expenses(self, expense_ids: List[str], user: tuple) -> List[dict]:
+        """Delete several of the user's expenses in one request. Returns the deleted rows."""
+        query = Query().eq("user_id", user[0]["id"]).in_("id", expense_ids)
+        return await self.db.delete("expenses", query, user[1]) or []
 
     # Category-related methods
     async def create_user_category(self, user: tuple, category_name: str):
         """Create a custom category for a user."""
         data = {"user_id": user[0]["id"], "name": category_name.lower()}
-        category = await self.client.insert("categories", data, user[1])
+        category = await self.db.insert("categories", data, user[1])
         return category[0] if category else {}
 
     async def get_user_categories(self, user: tuple):
         """Get all categories for a specific user."""
-        return await self.client.select("categories", user[1], {"user_id": user[0]["id"]})
+        return await self.db.select("categories", user[1], {"user_id": user[0]["id"]})
 
     async def get_user_category_by_name(self, user: tuple, category_name: str) -> Optional[dict]:
         """Get a specific category by name for a user."""
         params = {"user_id": user[0]["id"], "name": category_name.lower()}
-        cats = await self.client.select("categories", user[1], params)
+        cats = await self.db.select("categories", user[1], params)
         return cats[0] if cats else None
 
     async def delete_user_category(self, category_id: str, user: tuple):
         """Delete a category by its ID."""
-        return await self.client.delete("categories", {"id": category_id}, user[1])
+        return await self.db.delete("categories", {"id": category_id}, user[1])
+
+    # Scheduler-related methods, using the service key
+    async def acquire_lease(self, name: str, holder: str, now: str, expires_at: str) -> bool:
+        """
+        Take or renew the `scheduler_locks` lease `name` with one conditional write, succeeding only if it is held by
+        `holder` already or has expired. Returns whether `holder` holds the lease until `expires_at`.
+        """
+        data = {"holder": holder, "expires_at": expires_at}
+        query = Query().eq("id", name).or_(f"expires_at.lt.{quote(now)}", f"holder.eq.{quote(holder)}")
+        if await self.db.update("scheduler_locks", query, data, SUPABASE_SERVICE_KEY):
+            return True
+        try:
+            await self.db.insert("scheduler_locks", {"id": name, **data}, SUPABASE_SERVICE_KEY)
+        except ClientResponseError as e:
+            if e.status == 409:
+                return False  # The lease exists and someone else holds it
+            raise
+        return True
+
+    async def get_recurring_expenses(self, created_before: str, after: Optional[Tuple[str, str]] = None,
+                                     limit: int = 500) -> List[dict]:
+        """Get a page of all users' recurring expenses created before a time, following the (created_at, id) keyset."""
+        query = Query().is_("is_recurring", True).lt("created_at", created_before)
+        if after:
+            created_at, expense_id = map(quote, after)
+            query.or_(f"created_at.gt.{created_at}", f"and(created_at.eq.{created_at},id.gt.{expense_id})")
+        query.order("created_at").order("id").limit(limit)
+        return await self.db.select("expenses", SUPABASE_SERVICE_KEY, query) or []
+
+    async def stop_recurring(self, expense_ids: List[str], updated_at: str) -> List[dict]:
+        """Clear `is_recurring` on the expenses that still have it set. Returns the rows that changed."""
+        query = Query().in_("id", expense_ids).is_("is_recurring", True)
+        data = {"is_recurring": False, "updated_at": updated_at}
+        return await self.db.update("expenses", query, data, SUPABASE_SERVICE_KEY) or []
+
+    async def create_occurrences(self, expenses: List[dict]) -> List[dict]:
+        """
+        Insert expenses for any users with a single array insert, skipping those whose id exists already.
+        Returns the inserted rows.
+        """
+        return await self.db.upsert("expenses", expenses, SUPABASE_SERVICE_KEY, ignore_duplicates=True) or []
 
 
 supabase = Supabase()
@@ -1 +1 @@
-from .auth_decorator import validate_user_decorator
+from .auth_decorator import validate_user_decorator, cache_user_decorator
@@ -1,4 +1,4 @@
-from utils import validate_user_by_token
+from utils import validate_user_by_token, get_token_lifetime, token_cache
 from fastapi import HTTPException
 from functools import wraps
 
@@ -19,3 +19,19 @@ def validate_user_decorator(func):
         return await func(*args, **kwargs)
 
     return wrapper
+
+
+def cache_user_decorator(func):
+    """Decorator to serve validated (user, token) results from the token cache until the token expires."""
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = kwargs.get('token')
+        cached_user = token_cache.get(token) if token else None
+        if cached_user is not None:
+            return cached_user
+        user = await func(*args, **kwargs)
+        token_cache.set(token, user, ttl=get_token_lifetime(token))
+        return user
+
+    return wrapper
@@ -1,27 +1,42 @@
 from models import (UserCredentials, ExpenseCreate, ExpenseUpdate, CategoryCreate, RefreshRequest, UserResponse,
-                    ExpenseResponse, CategoryResponse)
-from fastapi import FastAPI, HTTPException, Depends
+                    ExpenseResponse, CategoryResponse, ExpenseFilters, ExpenseBulkUpdate, ExpenseBulkDelete,
+                    BulkResponse, FileFormatEnum, ImportReport, SummaryFilters, ExpenseSummary, RollupEntry)
+from fastapi import FastAPI, HTTPException, Depends, Query, Response, Body, Request
+from typing import List, AsyncIterator, Annotated, Optional, Type
 from fastapi.middleware.cors import CORSMiddleware
-from services import User, Expense, Category
+from fastapi.responses import StreamingResponse, ORJSONResponse, JSONResponse, PlainTextResponse
+from services import User, Expense, Category, Rollup, Search, Recurring, RECURRING_SCHEDULER_ENABLED
 from contextlib import asynccontextmanager
-from typing import List, AsyncIterator
-from pydantic import EmailStr
-from db import supabase
+from utils import (encode_cursor, cache_validators, is_not_modified, metrics, metrics_trace_config, cache_samples,
+                   token_cache, rejected_token_cache, category_cache, rollups, search_indexes, fx_rates)
+from middleware import MetricsMiddleware, RateLimitMiddleware
+from pydantic import BaseModel, EmailStr
+from db import supabase, PostgresBackend, UpstreamUnavailable, UpstreamBusy, FAST_JSON
 
 import uvicorn
+import asyncio
+import math
 import os
 
 
-# ToDo should probably add mass delete and update endpoints for expenses and categories
+# ToDo should probably add mass delete endpoints for categories
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
-    """Function to manage the lifespan of the FastAPI application. Closes DB session when the app is shut down."""
-    await supabase.client._init_session()
+    """Function to manage the lifespan of the FastAPI application. Opens the pooled DB session and starts the background
+    tasks (FX rate refresh, recurring expenses scheduler) on startup, and stops them when the app is shut down."""
+    await supabase.open(trace_configs=[metrics_trace_config(metrics)])
+    background = [asyncio.create_task(fx_rates.refresh_periodically())]
+    if RECURRING_SCHEDULER_ENABLED:
+        background.append(asyncio.create_task(Recurring.run_periodically()))
     yield
-    await supabase.client._close_session()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await supabase.close()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse if FAST_JSON else JSONResponse)
+app.add_middleware(RateLimitMiddleware, metrics=metrics, routes=app.router.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:8080", "http://localhost:5000", "http://localhost:5173",
@@ -29,7 +44,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+
+def collect_process_metrics():
+    """Sample the caches and the upstream connection pool on every scrape."""
+    for name, cache in (("token", token_cache), ("rejected_token", rejected_token_cache),
+                        ("category", category_cache), ("rollup", rollups.cache), ("search", search_indexes.cache)):
+        yield from cache_samples(name, cache)
+    for stat, value in supabase.client.pool_stats().items():
+        yield f"supabase_pool_{stat}", {}, value
+    yield "supabase_coalesced_requests", {}, supabase.client.coalesced_requests
+    yield from supabase.client.resilience_stats()
+    if isinstance(supabase.db, PostgresBackend):
+        for stat, value in supabase.db.pool_stats().items():
+            yield f"database_pool_{stat}", {}, value
+
+
+metrics.add_collector(collect_process_metrics)
+
+
+def response_rows(rows: List[dict], model: Type[BaseModel]) -> List[dict]:
+    """
+    Give rows exactly the keys of the response model, filling in its defaults, without validating them. Responses
+    skipping the model for speed then have the same shape as validated ones.
+    """
+    defaults = {name: None if field.is_required() else field.default for name, field in model.model_fields.items()}
+    return [{name: row.get(name, default) for name, default in defaults.items()} for row in rows]
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    """Fail fast with 503 while Supabase is down or the circuit breaker is open, telling clients when to retry."""
+    return JSONResponse(status_code=503, content={"detail": "Service temporarily unavailable"},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@app.exception_handler(UpstreamBusy)
+async def upstream_busy_handler(request: Request, exc: UpstreamBusy):
+    """Shed the request with 429 when too many Supabase requests are outstanding and queued already."""
+    metrics.inc("http_requests_shed_total", (("reason", "upstream_busy"), ("route", request.scope["route"].path)))
+    return JSONResponse(status_code=429, content={"detail": "Too many requests"},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Expose request, upstream, cache and pool metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # User endpoints
@@ -81,15 +145,130 @@ async def create_expense(expense: ExpenseCreate, user: tuple = Depends(User.vali
     return await Expense.create(user, expense)
 
 
+@app.post("/expenses/bulk", response_model=BulkResponse)
+async def create_expenses(expenses: List[ExpenseCreate] = Body(min_length=1), user: tuple = Depends(User.validate)):
+    """Create many expenses at once. Each item gets its own status, invalid items don't prevent the others."""
+    return {"results": await Expense.bulk_create(user, expenses)}
+
+
+@app.patch("/expenses/bulk", response_model=BulkResponse)
+async def update_expenses(bulk_update: ExpenseBulkUpdate, user: tuple = Depends(User.validate)):
+    """Apply the same changes to many expenses. Expenses that don't exist or aren't the user's are reported as 404."""
+    expense_ids = [str(expense_id) for expense_id in bulk_update.ids]
+    return {"results": await Expense.bulk_update(expense_ids, bulk_update.changes, user)}
+
+
+@app.delete("/expenses/bulk", response_model=BulkResponse)
+async def delete_expenses(bulk_delete: ExpenseBulkDelete, user: tuple = Depends(User.validate)):
+    """Delete many expenses. Expenses that don't exist or aren't the user's are reported as 404."""
+    expense_ids = [str(expense_id) for expense_id in bulk_delete.ids]
+    return {"results": await Expense.bulk_delete(expense_ids, user)}
+
+
+@app.post("/expenses/import", response_model=ImportReport)
+async def import_expenses(request: Request, format: FileFormatEnum = FileFormatEnum.CSV,
+                          user: tuple = Depends(User.validate)):
+    """
+    Import expenses from a CSV (with a header row) or NDJSON request body, parsed while it is uploaded.
+    Rows that fail validation are reported with their row number and don't prevent the others from being imported.
+    """
+    return await Expense.import_stream(user, request.stream(), format)
+
+
 @app.get("/expenses/{user_email}", response_model=List[ExpenseResponse])
-async def get_expenses(user_email: EmailStr, user: tuple = Depends(User.validate)):
-    """Retrieve all expenses for the specified user."""
+async def get_expenses(user_email: EmailStr, request: Request, response: Response,
+                       filters: Annotated[ExpenseFilters, Query()], user: tuple = Depends(User.validate)):
+    """
+    Retrieve a page of expenses for the specified user, matching the filters and ordered by creation date.
+    When more expenses may follow, the cursor for the next page is returned in the `X-Next-Cursor` header.
+    Supports conditional requests through `If-None-Match`, answering 304 when nothing changed.
+    With `base_currency`, every expense also gets its amount converted to that currency as `base_amount`.
+    """
+
+    # Check if the user is authorized to view the expenses
+    if user[0]["email"] != user_email:
+        raise HTTPException(status_code=403, detail="Not authorized to view this profile")
+
+    expenses = await Expense.get_by_user(user, filters)
+    # Converted amounts change with the rate table, not only with the rows
+    headers = cache_validators(expenses, user[0]["id"], request.url.query,
+                               *([fx_rates.version] if filters.base_currency else []))
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    if len(expenses) == filters.limit:
+        headers["X-Next-Cursor"] = encode_cursor(expenses[-1])
+    if FAST_JSON:
+        # Rows come straight from PostgREST with the response model's columns, so skip re-validating them
+        return ORJSONResponse(response_rows(expenses, ExpenseResponse), headers=headers)
+    response.headers.update(headers)
+    return expenses
+
+
+@app.get("/expenses/{user_email}/export")
+async def export_expenses(user_email: EmailStr, format: FileFormatEnum = FileFormatEnum.CSV,
+                          user: tuple = Depends(User.validate)):
+    """Stream the full expense history of the specified user as CSV or NDJSON."""
+
+    # Check if the user is authorized to view the expenses
+    if user[0]["email"] != user_email:
+        raise HTTPException(status_code=403, detail="Not authorized to view this profile")
+
+    media_type = "text/csv" if format == FileFormatEnum.CSV else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="expenses.{format.value}"'}
+    return StreamingResponse(Expense.export(user, format), media_type=media_type, headers=headers)
+
+
+@app.get("/expenses/{user_email}/summary", response_model=ExpenseSummary)
+async def get_expense_summary(user_email: EmailStr, summary_filters: Annotated[SummaryFilters, Query()],
+                              user: tuple = Depends(User.validate)):
+    """
+    Get spending totals of the specified user by currency, category, payment method and day/week/month.
+    With `base_currency`, amounts are converted to it at the rate of their date and totalled across currencies.
+    """
+
+    # Check if the user is authorized to view the expenses
+    if user[0]["email"] != user_email:
+        raise HTTPException(status_code=403, detail="Not authorized to view this profile")
+
+    return await Expense.summarize(user, summary_filters)
+
+
+@app.get("/expenses/{user_email}/rollups", response_model=List[RollupEntry])
+async def get_expense_rollups(user_email: EmailStr, month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+                              user: tuple = Depends(User.validate)):
+    """Get the specified user's running totals per month, category and currency, optionally for one month (YYYY-MM)."""
+
+    # Check if the user is authorized to view the expenses
+    if user[0]["email"] != user_email:
+        raise HTTPException(status_code=403, detail="Not authorized to view this profile")
+
+    return await Rollup.get(user, month)
+
+
+@app.post("/expenses/{user_email}/rollups/rebuild", response_model=List[RollupEntry])
+async def rebuild_expense_rollups(user_email: EmailStr, user: tuple = Depends(User.validate)):
+    """Recompute the specified user's rollups from their raw expenses."""
+
+    # Check if the user is authorized to view the expenses
+    if user[0]["email"] != user_email:
+        raise HTTPException(status_code=403, detail="Not authorized to view this profile")
+
+    return (await Rollup.rebuild(user)).totals()
+
+
+@app.get("/expenses/{user_email}/search", response_model=List[ExpenseResponse])
+async def search_expenses(user_email: EmailStr, q: str = Query(min_length=1, max_length=200),
+                          limit: int = Query(20, ge=1, le=100), user: tuple = Depends(User.validate)):
+    """
+    Search the specified user's expenses by description and category, best matches first.
+    Matching tolerates typos and unfinished words.
+    """
 
     # Check if the user is authorized to view the expenses
     if user[0]["email"] != user_email:
         raise HTTPException(status_code=403, detail="Not authorized to view this profile")
 
-    return await Expense.get_by_user(user)
+    return await Search.expenses(user, q, limit)
 
 
 @app.put("/expenses/{expense_id}", status_code=200, response_model=ExpenseResponse)
@@ -112,9 +291,19 @@ async def create_category(category: CategoryCreate, user: tuple = Depends(User.v
 
 
 @app.get("/categories", response_model=List[CategoryResponse])
-async def get_all_categories(user: tuple = Depends(User.validate)):
-    """Get all categories, including predefined and user-created ones."""
-    return await Category.get_all(user)
+async def get_all_categories(request: Request, response: Response, user: tuple = Depends(User.validate)):
+    """
+    Get all categories, including predefined and user-created ones.
+    Supports conditional requests through `If-None-Match`, answering 304 when nothing changed.
+    """
+    categories = await Category.get_all(user)
+    headers = cache_validators(categories, user[0]["id"])
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    if FAST_JSON:
+        return ORJSONResponse(response_rows(categories, CategoryResponse), headers=headers)
+    response.headers.update(headers)
+    return categories
 
 
 @app.get("/categories/{category_name}", response_model=CategoryResponse)
@@ -0,0 +1,2 @@
+from .metrics_middleware import MetricsMiddleware
+from .rate_limit_middleware import RateLimitMiddleware, TokenBucket
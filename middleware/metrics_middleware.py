@@ -0,0 +1,37 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.metrics import MetricsRegistry
+
+import time
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of every HTTP request, labelled with the matched route template
+    (e.g. `/expenses/{user_email}`) rather than the raw path so the number of series stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: MetricsRegistry):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # Reported if the app raises before starting the response
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            labels = (("method", scope["method"]), ("route", route.path if route else "unmatched"))
+            self.metrics.observe("http_request_duration_seconds", labels, time.perf_counter() - start)
+            self.metrics.inc("http_requests_total", (*labels, ("status", str(status))))
@@ -0,0 +1,115 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Dict, List, Optional, Tuple
+from starlette.routing import BaseRoute, Match
+from starlette.responses import JSONResponse
+from utils.metrics import MetricsRegistry
+from utils import TTLCache, token_cache
+
+import math
+import time
+import os
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 10))  # Requests per second per client and route
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_CLIENTS = int(os.getenv("RATE_LIMIT_CLIENTS", 100000))  # Buckets kept, idle ones are dropped first
+
+# (method, route) -> (rate, burst) for routes that are expensive or abuse-prone
+ROUTE_LIMITS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ("POST", "/register"): (0.2, 3),
+    ("POST", "/login"): (1, 5),
+    ("POST", "/forgot-password"): (0.1, 2),
+    ("POST", "/expenses/bulk"): (1, 5),
+    ("PATCH", "/expenses/bulk"): (1, 5),
+    ("DELETE", "/expenses/bulk"): (1, 5),
+    ("POST", "/expenses/import"): (0.2, 2),
+    ("GET", "/expenses/{user_email}/export"): (0.2, 2),
+    ("POST", "/expenses/{user_email}/rollups/rebuild"): (0.1, 2),
+}
+EXEMPT_ROUTES = {"/metrics"}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity` requests."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token. Returns 0 if one was available, otherwise the seconds until the next one."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware with a token bucket per client and route, answering 429 with `Retry-After` once it's empty.
+
+    A client is the user id when the bearer token has been validated before (it is in the token cache), otherwise the
+    remote address, so unauthenticated endpoints such as `/login` are limited per address. Behind a proxy that address
+    must come from `X-Forwarded-For` (uvicorn's `--proxy-headers --forwarded-allow-ips`), otherwise every client shares
+    the proxy's buckets.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: MetricsRegistry, routes: List[BaseRoute],
+                 rate: float = RATE_LIMIT_RATE, burst: float = RATE_LIMIT_BURST,
+                 route_limits: Optional[Dict[Tuple[str, str], Tuple[float, float]]] = None,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes  # The app's route list, routes added later are seen as well
+        self.default_limit = (rate, burst)
+        self.route_limits = ROUTE_LIMITS if route_limits is None else route_limits
+        self.enabled = enabled
+        self.buckets = TTLCache(RATE_LIMIT_CLIENTS, float("inf"))
+
+    def _route(self, scope: Scope) -> Optional[str]:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", None)
+        return None
+
+    @staticmethod
+    def _client(scope: Scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"authorization" and value[:7].lower() == b"bearer ":
+                cached_user = token_cache.peek(value[7:].decode("latin-1"))
+                if cached_user is not None:
+                    return f"user:{cached_user[0]['id']}"
+                break
+        client = scope.get("client")
+        return f"address:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        if route is None or route in EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        key = (self._client(scope), scope["method"], route)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*self.route_limits.get(key[1:], self.default_limit))
+        wait = bucket.take()
+        # A bucket left alone until it refills is no different from a new one, so it can be dropped by then
+        self.buckets.set(key, bucket, ttl=bucket.capacity / bucket.rate)
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+
+        self.metrics.inc("http_requests_shed_total", (("reason", "rate_limited"), ("route", route)))
+        response = JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": str(math.ceil(wait))})
+        await response(scope, receive, send)
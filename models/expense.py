@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 from uuid import UUID
@@ -47,3 +47,103 @@ class ExpenseResponse(BaseModel):
     currency: Optional[CurrencyEnum] = CurrencyEnum.USD
     created_at: datetime
     updated_at: Optional[datetime] = None
+    base_currency: Optional[CurrencyEnum] = None  # Only set when a base currency was requested
+    base_amount: Optional[float] = None
+
+
+class FileFormatEnum(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class SortOrderEnum(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+class ExpenseFilters(BaseModel):
+    limit: int = Field(default=100, ge=1, le=1000)
+    cursor: Optional[str] = None
+    order: SortOrderEnum = SortOrderEnum.DESC
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    category: Optional[str] = None
+    payment_method: Optional[PaymentMethodEnum] = None
+    currency: Optional[CurrencyEnum] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    base_currency: Optional[CurrencyEnum] = None
+
+
+class ExpenseBulkUpdate(BaseModel):
+    ids: List[UUID] = Field(min_length=1)
+    changes: ExpenseUpdate
+
+
+class ExpenseBulkDelete(BaseModel):
+    ids: List[UUID] = Field(min_length=1)
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[UUID] = None
+    status: int
+    detail: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    results: List[BulkItemResult]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    detail: str
+
+
+class ImportReport(BaseModel):
+    processed: int
+    inserted: int
+    failed: int
+    errors: List[ImportRowError]
+    duration_seconds: float
+    rows_per_second: float
+
+
+class SummaryBucketEnum(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class SummaryFilters(BaseModel):
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    bucket: SummaryBucketEnum = SummaryBucketEnum.MONTH
+    base_currency: Optional[CurrencyEnum] = None
+
+
+class SummaryGroup(BaseModel):
+    key: str
+    currency: str
+    total: float
+    count: int
+
+
+class ExpenseSummary(BaseModel):
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    bucket: SummaryBucketEnum
+    base_currency: Optional[CurrencyEnum] = None
+    count: int
+    totals: List[SummaryGroup]
+    by_category: List[SummaryGroup]
+    by_payment_method: List[SummaryGroup]
+    by_period: List[SummaryGroup]
+
+
+class RollupEntry(BaseModel):
+    month: str
+    category: str
+    currency: str
+    total: float
+    count: int
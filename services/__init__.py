@@ -1,3 +1,6 @@
 from .category import Category
+from .rollup import Rollup
+from .search import Search
 from .expense import Expense
 from .user import User
+from .recurring import Recurring, RECURRING_SCHEDULER_ENABLED
@@ -1,8 +1,11 @@
-from utils import check_category_exists, PREDEFINED_CATEGORIES
+from utils import (check_category_exists, get_user_categories_by_name, cache_user_category, uncache_user_category,
+                   PREDEFINED_CATEGORIES)
 from fastapi import HTTPException
 from typing import List
 from db import supabase
 
+import asyncio
+
 
 class Category:
     @staticmethod
@@ -13,12 +16,15 @@ class Category:
             raise HTTPException(status_code=400, detail="Category name already exists in predefined categories.")
         if existing_category:
             raise HTTPException(status_code=400, detail="Category name already exists in your custom categories.")
-        return await supabase.create_user_category(user, category_name)
+        category = await supabase.create_user_category(user, category_name)
+        if category:
+            cache_user_category(user, category)
+        return category
 
     @staticmethod
     async def get_all(user: tuple) -> List[dict]:
         """Get all categories, including predefined and user-created ones."""
-        return PREDEFINED_CATEGORIES + await supabase.get_user_categories(user)
+        return PREDEFINED_CATEGORIES + list((await get_user_categories_by_name(user)).values())
 
     @staticmethod
     async def get_by_name(user: tuple, category_name: str) -> dict:
@@ -27,12 +33,13 @@ class Category:
 
     @staticmethod
     async def delete(user: tuple, category_name: str) -> None:
-        """Delete a category if it's not linked to any expenses."""
-        category_type, category = await check_category_exists(user, category_name)
+        """Delete a category if it's not linked to any expenses. The category and the link are checked concurrently."""
+        (category_type, category), has_linked_expenses = await asyncio.gather(
+            check_category_exists(user, category_name), supabase.has_expenses_in_category(user, category_name))
         if category_type == "predefined":
             raise HTTPException(status_code=400, detail="Cannot delete predefined category.")
-        linked_expenses = await supabase.get_expenses_by_user_and_category(user, category_name)
-        if linked_expenses:
+        if has_linked_expenses:
             raise HTTPException(status_code=400, detail="Category is linked to one or more expenses. "
                                                         "Please update the expenses before deleting the category.")
         await supabase.delete_user_category(category["id"], user)
+        uncache_user_category(user, category_name)
@@ -1,34 +1,271 @@
-from utils import check_expense_authorization, check_category_exists
-from models import ExpenseUpdate, ExpenseCreate
+from models import (ExpenseUpdate, ExpenseCreate, ExpenseFilters, ExpenseResponse, FileFormatEnum, SummaryFilters,
+                    SortOrderEnum)
+from utils import (check_expense_authorization, check_category_exists, decode_cursor, get_category_names,
+                   ExpenseColumns, summarize, SUMMARY_COLUMNS, record_expenses, forget_expenses, fx_rates)
+from aiohttp import ClientResponseError
 from datetime import datetime, timezone
-from typing import List
+from fastapi import HTTPException
+from typing import List, AsyncIterator, Tuple
+from pydantic import ValidationError
 from db import supabase
 
+import asyncio
+import codecs
+import json
+import time
+import csv
+import io
+import os
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))  # Rows per upstream request for bulk writes
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 1000))  # Rows fetched per upstream request when exporting
+EXPORT_COLUMNS = [column for column in ExpenseResponse.model_fields if not column.startswith("base_")]
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", 4))  # Batched inserts in flight per import
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 100))  # Row errors listed in the import report
+
+
+def _batches(items: list, size: int = BULK_BATCH_SIZE):
+    """Split a list into consecutive batches of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def _read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream incrementally and yield it line by line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _read_records(chunks: AsyncIterator[bytes], file_format: FileFormatEnum) -> AsyncIterator[Tuple[int, dict]]:
+    """Yield numbered records of a CSV (with a header row) or NDJSON upload. Unparsable records are yielded as None."""
+    number = 0
+    if file_format == FileFormatEnum.NDJSON:
+        async for line in _read_lines(chunks):
+            if line.strip():
+                number += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield number, record if isinstance(record, dict) else None
+        return
+
+    header, record = None, ""
+    async for line in _read_lines(chunks):
+        record += line + "\n"
+        if record.count('"') % 2:
+            continue  # A quoted field spans several lines
+        values, record = next(csv.reader([record]), []), ""
+        if not values:
+            continue
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        number += 1
+        yield number, {column: value for column, value in zip(header, values) if value != ""}
+
 
 class Expense:
     @staticmethod
     async def create(user: tuple, expense: ExpenseCreate) -> dict:
         """Create a new expense for the current user. Category should exist in predefined or user-created categories."""
         category_exists, _ = await check_category_exists(user, expense.category)
-        return await supabase.create_expense(user, expense.amount, expense.category, expense.description)
+        created = await supabase.create_expense(user, expense.model_dump(mode="json"))
+        if created:
+            record_expenses(user, [created])
+        return created
 
     @staticmethod
-    async def get_by_user(user: tuple) -> List[dict]:
-        """Get all expenses for a specific user."""
-        return await supabase.get_expenses_by_user(user)
+    async def get_by_user(user: tuple, filters: ExpenseFilters) -> List[dict]:
+        """
+        Get a filtered page of expenses for a specific user, continuing after the filters' cursor if given.
+        With a base currency, each expense also gets its amount converted to it at the rate of its date.
+        """
+        after = decode_cursor(filters.cursor) if filters.cursor else None
+        expenses = await supabase.get_expenses_by_user(user, filters, after)
+        if filters.base_currency:
+            fx_rates.add_base_amounts(expenses, filters.base_currency.value)
+        return expenses
 
     @staticmethod
     async def update(expense_id: str, expense: ExpenseUpdate, user: tuple) -> dict:
-        """Update an expense's details."""
-        await check_expense_authorization(expense_id, user)
+        """
+        Update an expense's details with a single write filtered on both the expense and the user.
+        The expense is only looked up when nothing was updated, to tell a missing expense from someone else's.
+        """
         if expense.category:
             category_exists, _ = await check_category_exists(user, expense.category)
         data = {key: value for key, value in expense.model_dump().items() if value is not None}
         data["updated_at"] = datetime.now(timezone.utc).isoformat()
-        return await supabase.update_expense(expense_id, data, user)
+        updated = await supabase.update_expense(expense_id, data, user)
+        if not updated:
+            await Expense._raise_not_writable(expense_id, user)
+        record_expenses(user, [updated])
+        return updated
 
     @staticmethod
     async def delete(expense_id: str, user: tuple) -> None:
-        """Delete an expense by its ID."""
+        """Delete an expense with a single write filtered on both the expense and the user."""
+        if not await supabase.delete_expense(expense_id, user):
+            await Expense._raise_not_writable(expense_id, user)
+        forget_expenses(user, [expense_id])
+
+    @staticmethod
+    async def _raise_not_writable(expense_id: str, user: tuple) -> None:
+        """Raise 404 or 403 after a filtered write matched nothing."""
         await check_expense_authorization(expense_id, user)
-        return await supabase.delete_expense(expense_id, user)
+        # The expense was there and the user's, so it must have been deleted in the meantime
+        raise HTTPException(status_code=404, detail="Expense not found")
+
+    @staticmethod
+    async def bulk_create(user: tuple, expenses: List[ExpenseCreate]) -> List[dict]:
+        """Create many expenses, validating categories once and inserting them with array inserts per batch."""
+        category_names = await get_category_names(user)
+        results: List[dict] = [{}] * len(expenses)
+        valid = []
+        for index, expense in enumerate(expenses):
+            if expense.category.lower() not in category_names:
+                results[index] = {"index": index, "status": 404, "detail": "Category not found"}
+            else:
+                valid.append((index, expense.model_dump(mode="json")))
+
+        for batch in _batches(valid):
+            try:
+                rows = await supabase.create_expenses(user, [data for _, data in batch])
+                record_expenses(user, rows)
+            except ClientResponseError as e:
+                for index, _ in batch:
+                    results[index] = {"index": index, "status": e.status, "detail": e.message}
+                continue
+            for (index, _), row in zip(batch, rows):
+                results[index] = {"index": index, "id": row["id"], "status": 201}
+        return results
+
+    @staticmethod
+    async def bulk_update(expense_ids: List[str], expense: ExpenseUpdate, user: tuple) -> List[dict]:
+        """Apply the same changes to many expenses with one filtered update per batch."""
+        if expense.category and expense.category.lower() not in await get_category_names(user):
+            raise HTTPException(status_code=404, detail="Category not found")
+        data = {key: value for key, value in expense.model_dump(mode="json").items() if value is not None}
+        data["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+        updated_ids = set()
+        for batch in _batches(expense_ids):
+            rows = await supabase.update_expenses(batch, data, user)
+            record_expenses(user, rows)
+            updated_ids.update(row["id"] for row in rows)
+        return [{"index": index, "id": expense_id, "status": 200 if expense_id in updated_ids else 404,
+                 "detail": None if expense_id in updated_ids else "Expense not found"}
+                for index, expense_id in enumerate(expense_ids)]
+
+    @staticmethod
+    async def bulk_delete(expense_ids: List[str], user: tuple) -> List[dict]:
+        """Delete many expenses with one filtered delete per batch."""
+        deleted_ids = set()
+        for batch in _batches(expense_ids):
+            rows = await supabase.delete_expenses(batch, user)
+            forget_expenses(user, [row["id"] for row in rows])
+            deleted_ids.update(row["id"] for row in rows)
+        return [{"index": index, "id": expense_id, "status": 204 if expense_id in deleted_ids else 404,
+                 "detail": None if expense_id in deleted_ids else "Expense not found"}
+                for index, expense_id in enumerate(expense_ids)]
+
+    @staticmethod
+    async def export(user: tuple, export_format: FileFormatEnum) -> AsyncIterator[str]:
+        """Stream all of the user's expenses as CSV or NDJSON, one upstream page at a time."""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        if export_format == FileFormatEnum.CSV:
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        async for page in supabase.iter_expenses_by_user(user, page_size=EXPORT_PAGE_SIZE):
+            if export_format == FileFormatEnum.NDJSON:
+                yield "".join(json.dumps({column: row.get(column) for column in EXPORT_COLUMNS}) + "\n"
+                              for row in page)
+                continue
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(page)
+            yield buffer.getvalue()
+
+    @staticmethod
+    async def import_stream(user: tuple, chunks: AsyncIterator[bytes], file_format: FileFormatEnum) -> dict:
+        """
+        Import expenses from a CSV or NDJSON upload while it is being received.
+
+        Rows are validated as they are parsed and inserted with batched array inserts, a bounded number of them in
+        flight at once. Parsing waits for a free slot, so memory stays bounded whatever the size of the upload.
+        """
+        started = time.perf_counter()
+        category_names = await get_category_names(user)
+        report = {"processed": 0, "inserted": 0, "failed": 0, "errors": []}
+        slots = asyncio.Semaphore(IMPORT_CONCURRENCY)
+        inserts = set()
+
+        def add_error(row: int, detail: str) -> None:
+            report["failed"] += 1
+            if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                report["errors"].append({"row": row, "detail": detail})
+
+        async def insert(batch: List[Tuple[int, dict]]) -> None:
+            try:
+                rows = await supabase.create_expenses(user, [data for _, data in batch])
+                record_expenses(user, rows)
+                report["inserted"] += len(rows)
+            except ClientResponseError as e:
+                for row, _ in batch:
+                    add_error(row, e.message)
+            finally:
+                slots.release()
+
+        async def flush(batch: List[Tuple[int, dict]]) -> None:
+            await slots.acquire()
+            task = asyncio.create_task(insert(batch))
+            inserts.add(task)
+            task.add_done_callback(inserts.discard)
+
+        batch = []
+        async for row, record in _read_records(chunks, file_format):
+            report["processed"] += 1
+            if record is None:
+                add_error(row, "Could not parse row")
+                continue
+            try:
+                expense = ExpenseCreate.model_validate(record)
+            except ValidationError as e:
+                add_error(row, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+                continue
+            if expense.category.lower() not in category_names:
+                add_error(row, "Category not found")
+                continue
+            batch.append((row, expense.model_dump(mode="json")))
+            if len(batch) >= BULK_BATCH_SIZE:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        await asyncio.gather(*inserts)
+
+        report["duration_seconds"] = time.perf_counter() - started
+        report["rows_per_second"] = report["processed"] / report["duration_seconds"] if report["processed"] else 0.0
+        return report
+
+    @staticmethod
+    async def summarize(user: tuple, summary_filters: SummaryFilters) -> dict:
+        """Summarize the user's spending over a date range, fetching only the columns the aggregation needs."""
+        filters = ExpenseFilters(start_date=summary_filters.start_date, end_date=summary_filters.end_date,
+                                 order=SortOrderEnum.ASC)
+        columns = ExpenseColumns()
+        async for page in supabase.iter_expenses_by_user(user, filters, EXPORT_PAGE_SIZE, SUMMARY_COLUMNS):
+            columns.extend(page)
+        base_currency = summary_filters.base_currency.value if summary_filters.base_currency else None
+        return {**summary_filters.model_dump(), **summarize(columns, summary_filters.bucket.value, base_currency)}
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+from utils import metrics, record_expenses
+from typing import Dict, List, Optional
+from calendar import monthrange
+from db import supabase
+
+import logging
+import asyncio
+import socket
+import time
+import uuid
+import os
+
+# Needs the `scheduler_locks` table and SUPABASE_SERVICE_KEY, see the readme
+RECURRING_SCHEDULER_ENABLED = os.getenv("RECURRING_SCHEDULER_ENABLED", "false").lower() == "true"
+RECURRING_INTERVAL = float(os.getenv("RECURRING_INTERVAL_SECONDS", 300))  # Seconds between runs
+RECURRING_LEASE_SECONDS = float(os.getenv("RECURRING_LEASE_SECONDS", 900))  # Must outlast the interval
+RECURRING_BATCH_SIZE = int(os.getenv("RECURRING_BATCH_SIZE", 500))  # Due expenses handled per batch
+RECURRING_CONCURRENCY = int(os.getenv("RECURRING_CONCURRENCY", 4))  # Batches in flight per run
+RECURRING_MAX_CATCH_UP = int(os.getenv("RECURRING_MAX_CATCH_UP", 12))  # Missed occurrences created per expense and run
+LEASE_NAME = "recurring-expenses"
+OCCURRENCE_COLUMNS = ("user_id", "amount", "category", "description", "payment_method", "currency")
+
+logger = logging.getLogger(__name__)
+_holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"  # This worker, as a lease holder
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """Move a datetime by whole months, clamping the day to the length of the target month."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, monthrange(year, month)[1]))
+
+
+def _created_at(expense: dict) -> datetime:
+    created_at = datetime.fromisoformat(expense["created_at"])
+    return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+
+
+def occurrences(expense: dict, now: datetime) -> List[dict]:
+    """
+    The monthly occurrences of a recurring expense that are due by `now`, at most `RECURRING_MAX_CATCH_UP` of them.
+    The last one carries the recurrence on, so it's the only one created with `is_recurring` set. Their ids are derived
+    from the expense's id and their date, so materializing the same occurrence again can be detected.
+    """
+    created_at = _created_at(expense)
+    dates = []
+    while len(dates) < RECURRING_MAX_CATCH_UP:
+        date = add_months(created_at, len(dates) + 1)
+        if date > now:
+            break
+        dates.append(date)
+    return [{"id": str(uuid.uuid5(uuid.UUID(str(expense["id"])), date.isoformat())),
+             **{column: expense.get(column) for column in OCCURRENCE_COLUMNS}, "created_at": date.isoformat(),
+             "is_recurring": index == len(dates) - 1} for index, date in enumerate(dates)]
+
+
+class Recurring:
+    @staticmethod
+    async def run_once(now: Optional[datetime] = None) -> int:
+        """
+        Create the due occurrences of every user's recurring expenses. Returns the number of expenses created.
+
+        Due expenses are handled in batches, a bounded number of them in flight at once. Each batch inserts the
+        occurrences with a single array insert that skips ids which exist already, then clears `is_recurring` on its
+        expenses. A run interrupted in between, or two runs overlapping, therefore never lose a recurrence nor create
+        an occurrence twice: the next run inserts nothing new and clears the flag.
+        """
+        started = time.perf_counter()
+        now = now or datetime.now(timezone.utc)
+        slots = asyncio.Semaphore(RECURRING_CONCURRENCY)
+        batches = set()
+        produced = 0
+
+        async def materialize(due: List[dict]) -> None:
+            nonlocal produced
+            try:
+                rows = [occurrence for expense in due for occurrence in occurrences(expense, now)]
+                created = await supabase.create_occurrences(rows)
+                await supabase.stop_recurring([expense["id"] for expense in due], now.isoformat())
+                by_user: Dict[str, List[dict]] = {}
+                for row in created:
+                    by_user.setdefault(str(row["user_id"]), []).append(row)
+                for user_id, user_rows in by_user.items():
+                    record_expenses(({"id": user_id}, None), user_rows)
+                produced += len(created)
+            finally:
+                slots.release()
+
+        try:
+            # A month is never shorter than 28 days, the exact due date is checked per expense
+            created_before = (now - timedelta(days=28)).isoformat()
+            after = None
+            while True:
+                page = await supabase.get_recurring_expenses(created_before, after, RECURRING_BATCH_SIZE)
+                due = [expense for expense in page if add_months(_created_at(expense), 1) <= now]
+                if due:
+                    await slots.acquire()
+                    task = asyncio.create_task(materialize(due))
+                    batches.add(task)
+                    task.add_done_callback(batches.discard)
+                if len(page) < RECURRING_BATCH_SIZE:
+                    break
+                after = (page[-1]["created_at"], page[-1]["id"])
+            await asyncio.gather(*batches)
+        finally:
+            metrics.observe("recurring_expenses_run_duration_seconds", (), time.perf_counter() - started)
+            metrics.inc("recurring_expenses_created_total", value=produced)
+        return produced
+
+    @staticmethod
+    async def run_periodically(interval: float = RECURRING_INTERVAL) -> None:
+        """
+        Run the scheduler every `interval` seconds, until cancelled. With several workers, only the one holding the
+        lease runs it, and holding it is renewed on every run.
+        """
+        while True:
+            now = datetime.now(timezone.utc)
+            expires_at = now + timedelta(seconds=RECURRING_LEASE_SECONDS)
+            try:
+                if await supabase.acquire_lease(LEASE_NAME, _holder, now.isoformat(), expires_at.isoformat()):
+                    await Recurring.run_once(now)
+                    metrics.inc("recurring_expenses_runs_total", (("outcome", "succeeded"),))
+                else:
+                    metrics.inc("recurring_expenses_runs_total", (("outcome", "not_leader"),))
+            except Exception:
+                metrics.inc("recurring_expenses_runs_total", (("outcome", "failed"),))
+                logger.exception("Recurring expenses run failed")
+            await asyncio.sleep(interval)
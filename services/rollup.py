@@ -0,0 +1,23 @@
+from utils import UserRollup, rollups, SUMMARY_COLUMNS
+from models import ExpenseFilters, SortOrderEnum
+from typing import AsyncIterator, List, Optional
+from db import supabase
+
+REBUILD_PAGE_SIZE = 1000
+
+
+class Rollup:
+    @staticmethod
+    def _pages(user: tuple) -> AsyncIterator[List[dict]]:
+        return supabase.iter_expenses_by_user(user, ExpenseFilters(order=SortOrderEnum.ASC), REBUILD_PAGE_SIZE,
+                                              SUMMARY_COLUMNS)
+
+    @staticmethod
+    async def rebuild(user: tuple) -> UserRollup:
+        """Recompute the user's rollups from their raw expenses in a single streaming pass."""
+        return await rollups.build(user[0]["id"], Rollup._pages(user))
+
+    @staticmethod
+    async def get(user: tuple, month: Optional[str] = None) -> List[dict]:
+        """Get the user's monthly totals per category and currency, building them on first use."""
+        return (await rollups.get(user[0]["id"], Rollup._pages(user))).totals(month)
@@ -0,0 +1,26 @@
+from utils import search_indexes, SEARCH_COLUMNS
+from models import ExpenseFilters, SortOrderEnum
+from typing import List
+from db import supabase
+
+INDEX_PAGE_SIZE = 1000
+
+
+class Search:
+    @staticmethod
+    async def expenses(user: tuple, query: str, limit: int) -> List[dict]:
+        """
+        Get the user's expenses best matching the query, building their search index on first use.
+        Only the matching expenses are fetched, with one request.
+        """
+        pages = supabase.iter_expenses_by_user(user, ExpenseFilters(order=SortOrderEnum.ASC), INDEX_PAGE_SIZE,
+                                               SEARCH_COLUMNS)
+        index = await search_indexes.get(user[0]["id"], pages)
+        ranked = index.search(query, limit)
+        if not ranked:
+            return []
+        rows = {row["id"]: row for row in await supabase.get_expenses_by_ids(user, [key for key, _ in ranked])}
+        for expense_id, _ in ranked:
+            if expense_id not in rows:
+                index.remove(expense_id)  # Deleted behind the index's back, e.g. while it was being built
+        return [rows[expense_id] for expense_id, _ in ranked if expense_id in rows]
@@ -1,8 +1,9 @@
 from fastapi.security import OAuth2PasswordBearer
-from decorators import validate_user_decorator
+from decorators import validate_user_decorator, cache_user_decorator
 from fastapi import HTTPException, Depends
 from aiohttp import ClientResponseError
 from models import UserCredentials
+from utils import token_cache
 from db import supabase
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -10,6 +11,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class User:
     @staticmethod
+    @cache_user_decorator
     @validate_user_decorator
     async def validate(token: str = Depends(oauth2_scheme), user_email: str = None) -> tuple[dict, str]:
         """Validate the user's token and retrieve their profile."""
@@ -61,3 +63,4 @@ class User:
         if user["email"] != user_email:
             raise HTTPException(status_code=403, detail="Not authorized to delete this profile")
         await supabase.delete_user(user["id"])
+        token_cache.evict_where(lambda cached_user: cached_user[0]["id"] == user["id"])
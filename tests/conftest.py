@@ -1,3 +1,8 @@
+import os
+
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # Endpoint tests send bursts from one client address
+os.environ.setdefault("RECURRING_SCHEDULER_ENABLED", "false")  # No upstream to run it against
+
 from fastapi.testclient import TestClient
 from services import User
 from main import app
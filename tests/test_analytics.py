@@ -0,0 +1,36 @@
+from utils import ExpenseColumns, summarize
+
+
+def make_columns() -> ExpenseColumns:
+    columns = ExpenseColumns()
+    columns.extend([
+        {"amount": 10.0, "category": "food", "payment_method": "cash", "currency": "USD",
+         "created_at": "2025-01-06T10:00:00+00:00"},  # Monday
+        {"amount": 5.5, "category": "food", "payment_method": "bank", "currency": "USD",
+         "created_at": "2025-01-12T23:59:00+00:00"},  # Sunday of the same week
+        {"amount": 20.0, "category": "travel", "payment_method": None, "currency": "EUR",
+         "created_at": "2025-02-01T08:00:00+00:00"},
+    ])
+    return columns
+
+
+def test_summarize_groups_by_dimension_and_currency():
+    summary = summarize(make_columns(), "month")
+    assert summary["count"] == 3
+    assert summary["totals"] == [{"key": "EUR", "currency": "EUR", "total": 20.0, "count": 1},
+                                 {"key": "USD", "currency": "USD", "total": 15.5, "count": 2}]
+    assert summary["by_category"] == [{"key": "food", "currency": "USD", "total": 15.5, "count": 2},
+                                      {"key": "travel", "currency": "EUR", "total": 20.0, "count": 1}]
+    assert {group["key"] for group in summary["by_payment_method"]} == {"bank", "cash", "unknown"}
+    assert [group["key"] for group in summary["by_period"]] == ["2025-01-01", "2025-02-01"]
+
+
+def test_summarize_week_and_day_buckets():
+    assert [(group["key"], group["count"]) for group in summarize(make_columns(), "week")["by_period"]] == [
+        ("2025-01-06", 2), ("2025-01-27", 1)]
+    assert len(summarize(make_columns(), "day")["by_period"]) == 3
+
+
+def test_summarize_empty():
+    assert summarize(ExpenseColumns(), "day") == {"count": 0, "totals": [], "by_category": [],
+                                                  "by_payment_method": [], "by_period": []}
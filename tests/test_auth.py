@@ -0,0 +1,52 @@
+from utils import validate_user_by_token, rejected_token_cache
+from fastapi import HTTPException
+from unittest.mock import patch
+
+import asyncio
+import pytest
+import time
+import jwt
+
+SECRET = "test-secret"
+
+
+def make_token(**claims) -> str:
+    return jwt.encode({"email": "testuser@example.com", **claims}, SECRET, algorithm="HS256")
+
+
+@patch("utils.utils.SECRET_KEY", SECRET)
+def test_token_issued_slightly_in_the_future_is_accepted():
+    token = make_token(iat=int(time.time()) + 3, nbf=int(time.time()) + 3)
+    assert asyncio.run(validate_user_by_token(token)) == "testuser@example.com"
+
+
+@patch("utils.utils.SECRET_KEY", SECRET)
+def test_expired_token_is_rejected_and_remembered():
+    token = make_token(exp=int(time.time()) - 3600)
+
+    started = time.perf_counter()
+    with pytest.raises(HTTPException):
+        asyncio.run(validate_user_by_token(token))
+    assert time.perf_counter() - started < 0.5
+    assert rejected_token_cache.peek(token)
+
+    with patch("utils.utils.jwt.decode") as mock_decode, pytest.raises(HTTPException):
+        asyncio.run(validate_user_by_token(token))
+    mock_decode.assert_not_called()
+
+
+@patch("utils.utils.SECRET_KEY", SECRET)
+def test_just_expired_token_gets_no_leeway():
+    token = make_token(exp=int(time.time()) - 2)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(validate_user_by_token(token))
+    assert exc_info.value.detail == "Could not validate credentials"
+
+
+@patch("utils.utils.SECRET_KEY", SECRET)
+def test_not_yet_valid_token_is_not_remembered():
+    token = make_token(nbf=int(time.time()) + 3600)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(validate_user_by_token(token))
+    assert exc_info.value.detail == "Token is not yet valid"
+    assert rejected_token_cache.peek(token) is None
@@ -0,0 +1,61 @@
+from utils import TTLCache, token_cache, check_category_exists, cache_user_category, uncache_user_category
+from decorators import cache_user_decorator
+from unittest.mock import AsyncMock, patch
+
+import asyncio
+import time
+import jwt
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # "b" is the least recently used entry
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, ttl=5)
+    cache.set("b", 2, ttl=-1)  # already expired tokens are never stored
+
+    with patch("utils.cache.time.monotonic", return_value=time.monotonic() + 10):
+        assert cache.get("a") is None
+    assert "b" not in cache._data
+    assert cache.stats()["expirations"] == 1
+
+
+def test_cache_user_decorator_hits_cache():
+    token = jwt.encode({"email": "testuser@example.com", "exp": int(time.time()) + 3600}, "secret")
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com"}, token)
+    validate = AsyncMock(return_value=user)
+    cached_validate = cache_user_decorator(validate)
+
+    assert asyncio.run(cached_validate(token=token)) == user
+    assert asyncio.run(cached_validate(token=token)) == user
+    validate.assert_called_once_with(token=token)
+
+    token_cache.evict_where(lambda cached_user: cached_user[0]["id"] == user[0]["id"])
+    assert token_cache.peek(token) is None
+
+
+@patch("utils.utils.supabase")
+def test_category_cache_write_through(mock_supabase):
+    mock_supabase.get_user_categories = AsyncMock(return_value=[{"id": "c1", "name": "groceries"}])
+    user = ({"id": "3a4788f0-cc6e-46da-a209-49a737e43e22"}, "mock_token")
+
+    assert asyncio.run(check_category_exists(user, "Groceries")) == ("user", {"id": "c1", "name": "groceries"})
+    assert asyncio.run(check_category_exists(user, "food"))[0] == "predefined"
+    assert asyncio.run(check_category_exists(user, "rent", raise_exception=False)) == (None, None)
+
+    cache_user_category(user, {"id": "c2", "name": "rent"})
+    assert asyncio.run(check_category_exists(user, "Rent"))[1]["id"] == "c2"
+    uncache_user_category(user, "groceries")
+    assert asyncio.run(check_category_exists(user, "groceries", raise_exception=False)) == (None, None)
+
+    mock_supabase.get_user_categories.assert_called_once_with(user)
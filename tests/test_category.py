@@ -1,7 +1,12 @@
 from unittest.mock import AsyncMock, patch
 from tests.conftest import client
+from fastapi import HTTPException
+from utils import category_cache
 from services import Category
 
+import asyncio
+import pytest
+
 
 @patch.object(Category, 'create', new_callable=AsyncMock)
 def test_create_category(mock_create_category):
@@ -63,3 +68,54 @@ def test_delete_category(mock_delete_category):
                                                    "email": "testuser@example.com",
                                                    "created_at": "2025-01-15T17:24:15.541471"}, "mock_token"),
                                                  "TestCategory")
+
+
+@patch("utils.utils.supabase")
+@patch("services.category.supabase")
+def test_delete_category_checks_linked_expenses_with_one_row(mock_supabase, mock_utils_supabase):
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0"}, "mock_token")
+    category_cache.pop(user[0]["id"])
+    mock_utils_supabase.get_user_categories = AsyncMock(return_value=[{"id": "c1", "name": "testcategory"}])
+    mock_supabase.has_expenses_in_category = AsyncMock(return_value=True)
+    mock_supabase.delete_user_category = AsyncMock()
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(Category.delete(user, "TestCategory"))
+    assert exc_info.value.status_code == 400
+    mock_supabase.delete_user_category.assert_not_called()
+
+    mock_supabase.has_expenses_in_category.return_value = False
+    asyncio.run(Category.delete(user, "TestCategory"))
+    mock_supabase.delete_user_category.assert_called_once_with("c1", user)
+    assert asyncio.run(Category.get_all(user))[-1]["name"] == "savings"
+
+
+@patch.object(Category, 'get_all', new_callable=AsyncMock)
+def test_get_all_categories_not_modified(mock_get_all_categories):
+    mock_get_all_categories.return_value = [{"name": "food"},
+                                            {"id": "3a4788f0-cc6e-46da-a209-49a737e43e22",
+                                             "user_id": "3a4788f0-cc6e-46da-a209-49a737e43e22",
+                                             "name": "testcategory", "created_at": "2025-01-15T17:24:15.541471"}]
+
+    response = client.get("/categories", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+
+    response = client.get("/categories", headers={"Authorization": "Bearer mock_token",
+                                                  "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    mock_get_all_categories.return_value.pop()
+    response = client.get("/categories", headers={"Authorization": "Bearer mock_token",
+                                                  "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+
+@patch.object(Category, 'get_all', new_callable=AsyncMock)
+def test_get_all_categories_has_the_same_shape_with_fast_json(mock_get_all_categories):
+    mock_get_all_categories.return_value = [{"name": "food"}]
+
+    slow = client.get("/categories", headers={"Authorization": "Bearer mock_token"}).json()
+    with patch("main.FAST_JSON", True):
+        fast = client.get("/categories", headers={"Authorization": "Bearer mock_token"}).json()
+    assert fast == slow == [{"id": None, "user_id": None, "name": "food", "created_at": None}]
@@ -0,0 +1,126 @@
+from db import AsyncSupabaseClient, Query, supabase
+from unittest.mock import patch
+from models import ExpenseFilters
+
+import asyncio
+
+
+def test_pool_stats_and_header_reuse():
+    client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    assert client.pool_stats()["in_use"] == 0
+
+    async def run():
+        await client._init_session()
+        try:
+            assert client.session.timeout.sock_connect is not None
+            return client.pool_stats()
+        finally:
+            await client._close_session()
+
+    stats = asyncio.run(run())
+    assert stats == {"limit": 100, "limit_per_host": 0, "in_use": 0, "idle": 0, "waiting": 0}
+    assert client._auth_headers("token") is client._auth_headers("token")
+    assert client._auth_headers("token")["Authorization"] == "Bearer token"
+
+
+def test_concurrent_identical_selects_share_one_request():
+    client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    calls = []
+
+    async def fake_request(method, endpoint, data=None, params=None, headers=None):
+        calls.append((method, endpoint, params))
+        await asyncio.sleep(0.01)
+        return [{"id": "1", "email": "testuser@example.com"}]
+
+    async def run():
+        return await asyncio.gather(client.select("users", "token", {"email": "testuser@example.com"}),
+                                    client.select("users", "token", {"email": "testuser@example.com"}),
+                                    client.select("users", "other_token", {"email": "testuser@example.com"}))
+
+    client._request = fake_request
+    first, second, third = asyncio.run(run())
+    assert first == second == third
+    assert first is not second
+    assert len(calls) == 2
+    assert client.coalesced_requests == 1
+    assert client._inflight == {}
+
+
+def test_the_caller_that_started_a_shared_request_cannot_mutate_the_others_result():
+    client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+
+    async def fake_request(method, endpoint, data=None, params=None, headers=None):
+        await asyncio.sleep(0.01)
+        return [{"id": "1", "amount": 10.0}]
+
+    async def select_and_convert():
+        rows = await client.select("expenses", "token", {"user_id": "u1"})
+        rows[0]["base_amount"] = 9.26  # Like a listing with `base_currency` does in place
+        return rows
+
+    async def run():
+        return await asyncio.gather(select_and_convert(), client.select("expenses", "token", {"user_id": "u1"}))
+
+    client._request = fake_request
+    converted, plain = asyncio.run(run())
+    assert client.coalesced_requests == 1
+    assert "base_amount" in converted[0] and plain == [{"id": "1", "amount": 10.0}]
+
+
+def test_expense_page_query_uses_keyset():
+    params = []
+
+    async def fake_select(table, token, query):
+        params.extend(query.params())
+        return []
+
+    with patch.object(supabase.client, "select", fake_select):
+        asyncio.run(supabase.get_expenses_by_user(({"id": "u1"}, "token"), ExpenseFilters(limit=5, category="Food"),
+                                                  ("2024-01-02T00:00:00+00:00", "e1")))
+
+    assert params == [("user_id", "eq.u1"), ("category", "eq.food"),
+                      ("or", '(created_at.lt."2024-01-02T00:00:00+00:00",'
+                             'and(created_at.eq."2024-01-02T00:00:00+00:00",id.lt."e1"))'),
+                      ("order", "created_at.desc,id.desc"), ("limit", "5")]
+
+
+def test_query_builder_params_and_headers():
+    query = (Query().select("id", "amount").eq("user_id", "u1").in_("category", ["food", "travel"])
+             .is_("description", None).gte("amount", 10).order("created_at", desc=True).limit(10).offset(20))
+    assert query.params() == [("user_id", "eq.u1"), ("category", 'in.("food","travel")'), ("description", "is.null"),
+                              ("amount", "gte.10"), ("select", "id,amount"), ("order", "created_at.desc"),
+                              ("limit", "10"), ("offset", "20")]
+    assert query.range(0, 9).count("estimated").headers() == {"Range-Unit": "items", "Range": "0-9",
+                                                              "prefer": "count=estimated"}
+
+
+def test_count_reads_content_range():
+    client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    sent = {}
+
+    async def fake_send(method, endpoint, data=None, params=None, headers=None):
+        sent.update(method=method, params=params, prefer=headers["prefer"])
+        return {"Content-Range": "*/42"}, None
+
+    client._send = fake_send
+    assert asyncio.run(client.count("expenses", "token", Query().eq("user_id", "u1"))) == 42
+    assert sent == {"method": "HEAD", "params": [("user_id", "eq.u1")], "prefer": "return=representation,count=exact"}
+
+
+def test_iter_expenses_follows_keyset():
+    rows = [{"id": f"e{i}", "created_at": f"2025-01-0{i}T00:00:00Z"} for i in range(1, 6)]
+    calls = []
+
+    async def fake_get_expenses_by_user(user, filters, after, columns=None):
+        calls.append(after)
+        start = 0 if after is None else next(i for i, row in enumerate(rows) if row["id"] == after[1]) + 1
+        return rows[start:start + filters.limit]
+
+    async def collect():
+        return [page async for page in supabase.iter_expenses_by_user(({"id": "u1"}, "token"), page_size=2)]
+
+    with patch.object(supabase, "get_expenses_by_user", fake_get_expenses_by_user):
+        pages = asyncio.run(collect())
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert calls == [None, ("2025-01-02T00:00:00Z", "e2"), ("2025-01-04T00:00:00Z", "e4")]
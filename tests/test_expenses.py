@@ -1,8 +1,14 @@
-from models import ExpenseUpdate, ExpenseCreate
+from models import ExpenseUpdate, ExpenseCreate, ExpenseFilters, FileFormatEnum, SummaryFilters
 from unittest.mock import AsyncMock, patch
+from utils import encode_cursor, decode_cursor, category_cache
 from tests.conftest import client
+from fastapi import HTTPException
 from services import Expense
 
+import asyncio
+import pytest
+import json
+
 
 @patch.object(Expense, 'create', new_callable=AsyncMock)
 def test_create_expense(mock_create_expense):
@@ -35,6 +41,22 @@ def test_create_expense(mock_create_expense):
     )
 
 
+def test_create_expense_keeps_every_field():
+    def stored(table, data, token):
+        return [{"id": "123e4567-e89b-12d3-a456-426614174000", "created_at": "2023-10-01T12:00:00Z", **data}]
+
+    with patch("services.expense.supabase.db.insert", new_callable=AsyncMock, side_effect=stored) as mock_insert:
+        response = client.post("/expenses", json={"category": "Food", "amount": 12.5, "is_recurring": True,
+                                                  "currency": "EUR", "payment_method": "cash"},
+                               headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 201
+    table, data, _ = mock_insert.call_args.args
+    assert table == "expenses"
+    assert data["is_recurring"] is True and data["currency"] == "EUR" and data["payment_method"] == "cash"
+    assert data["category"] == "food" and data["user_id"] == "b79ab841-9bc5-426c-826e-192110dbada0"
+    assert response.json()["is_recurring"] is True and response.json()["currency"] == "EUR"
+
+
 @patch.object(Expense, 'get_by_user', new_callable=AsyncMock)
 def test_get_expenses(mock_get_expenses_by_user):
     mock_get_expenses_by_user.return_value = [{
@@ -55,9 +77,54 @@ def test_get_expenses(mock_get_expenses_by_user):
     assert isinstance(response.json(), list)
     assert response.json()[0]["category"] == "testcategory"
 
+    assert "X-Next-Cursor" not in response.headers
+
     mock_get_expenses_by_user.assert_called_once_with(({"id": "b79ab841-9bc5-426c-826e-192110dbada0",
                                                         "email": "testuser@example.com",
-                                                        "created_at": "2025-01-15T17:24:15.541471"}, "mock_token"))
+                                                        "created_at": "2025-01-15T17:24:15.541471"}, "mock_token"),
+                                                      ExpenseFilters())
+
+
+@patch.object(Expense, 'get_by_user', new_callable=AsyncMock)
+def test_get_expenses_paginated(mock_get_expenses_by_user):
+    mock_get_expenses_by_user.return_value = [{
+        "id": "123e4567-e89b-12d3-a456-426614174000",
+        "user_id": "123e4567-e89b-12d3-a456-426614174001",
+        "amount": 100.0,
+        "category": "testcategory",
+        "description": "Test Expense",
+        "payment_method": "bank",
+        "is_recurring": False,
+        "currency": "USD",
+        "created_at": "2023-10-01T12:00:00Z",
+        "updated_at": None
+    }]
+
+    response = client.get("/expenses/testuser@example.com?limit=1&category=TestCategory&min_amount=50&currency=USD",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == encode_cursor(mock_get_expenses_by_user.return_value[0])
+    assert decode_cursor(response.headers["X-Next-Cursor"]) == ("2023-10-01T12:00:00Z",
+                                                                "123e4567-e89b-12d3-a456-426614174000")
+
+    filters = mock_get_expenses_by_user.call_args.args[1]
+    assert filters == ExpenseFilters(limit=1, category="TestCategory", min_amount=50, currency="USD")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor({"created_at": "yesterday", "id": "x"}),
+                                    encode_cursor({"created_at": "2023-10-01T12:00:00Z", "id": "1) or (1=1"})])
+def test_get_expenses_rejects_invalid_cursor(cursor):
+    with patch("services.expense.supabase.get_expenses_by_user", new_callable=AsyncMock) as mock_get_expenses:
+        response = client.get("/expenses/testuser@example.com", params={"cursor": cursor},
+                              headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+    mock_get_expenses.assert_not_called()
+
+
+def test_get_expenses_rejects_invalid_limit():
+    response = client.get("/expenses/testuser@example.com?limit=0", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 422
 
 
 @patch.object(Expense, 'update', new_callable=AsyncMock)
@@ -101,3 +168,227 @@ def test_delete_expense(mock_delete_expense):
     mock_delete_expense.assert_called_once_with("1", ({"id": "b79ab841-9bc5-426c-826e-192110dbada0",
                                                        "email": "testuser@example.com",
                                                        "created_at": "2025-01-15T17:24:15.541471"}, "mock_token"))
+
+
+@patch.object(Expense, 'bulk_create', new_callable=AsyncMock)
+def test_bulk_create_expenses(mock_bulk_create):
+    mock_bulk_create.return_value = [{"index": 0, "id": "123e4567-e89b-12d3-a456-426614174000", "status": 201},
+                                     {"index": 1, "status": 404, "detail": "Category not found"}]
+
+    response = client.post("/expenses/bulk",
+                           json=[{"category": "food", "amount": 10.0}, {"category": "unknown", "amount": 5.0}],
+                           headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [201, 404]
+
+    mock_bulk_create.assert_called_once_with(
+        ({"id": "b79ab841-9bc5-426c-826e-192110dbada0",
+          "email": "testuser@example.com",
+          "created_at": "2025-01-15T17:24:15.541471"}, "mock_token"),
+        [ExpenseCreate(amount=10.0, category="food"), ExpenseCreate(amount=5.0, category="unknown")]
+    )
+
+
+@patch.object(Expense, 'bulk_update', new_callable=AsyncMock)
+def test_bulk_update_expenses(mock_bulk_update):
+    mock_bulk_update.return_value = [{"index": 0, "id": "123e4567-e89b-12d3-a456-426614174000", "status": 200}]
+
+    response = client.patch("/expenses/bulk",
+                            json={"ids": ["123e4567-e89b-12d3-a456-426614174000"], "changes": {"amount": 20.0}},
+                            headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["status"] == 200
+
+    mock_bulk_update.assert_called_once_with(
+        ["123e4567-e89b-12d3-a456-426614174000"],
+        ExpenseUpdate(amount=20.0),
+        ({"id": "b79ab841-9bc5-426c-826e-192110dbada0",
+          "email": "testuser@example.com",
+          "created_at": "2025-01-15T17:24:15.541471"}, "mock_token")
+    )
+
+
+@patch.object(Expense, 'bulk_delete', new_callable=AsyncMock)
+def test_bulk_delete_expenses(mock_bulk_delete):
+    mock_bulk_delete.return_value = [{"index": 0, "id": "123e4567-e89b-12d3-a456-426614174000", "status": 204}]
+
+    response = client.request("DELETE", "/expenses/bulk", json={"ids": ["123e4567-e89b-12d3-a456-426614174000"]},
+                              headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["status"] == 204
+    mock_bulk_delete.assert_called_once()
+
+
+@patch("services.expense.supabase")
+@patch("utils.utils.supabase")
+def test_bulk_create_validates_categories_once(mock_utils_supabase, mock_supabase):
+    mock_utils_supabase.get_user_categories = AsyncMock(return_value=[{"name": "mycategory"}])
+    mock_supabase.create_expenses = AsyncMock(return_value=[{"id": "e1"}, {"id": "e2"}])
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0"}, "mock_token")
+    category_cache.pop(user[0]["id"])
+    expenses = [ExpenseCreate(amount=1.0, category="Food"), ExpenseCreate(amount=2.0, category="unknown"),
+                ExpenseCreate(amount=3.0, category="MyCategory")]
+
+    results = asyncio.run(Expense.bulk_create(user, expenses))
+    assert [result["status"] for result in results] == [201, 404, 201]
+    assert [result.get("id") for result in results] == ["e1", None, "e2"]
+    mock_utils_supabase.get_user_categories.assert_called_once()
+    mock_supabase.create_expenses.assert_called_once()
+
+
+@patch.object(Expense, 'export')
+def test_export_expenses(mock_export):
+    async def export_chunks():
+        yield "id,amount\n"
+        yield "123e4567-e89b-12d3-a456-426614174000,100.0\n"
+
+    mock_export.return_value = export_chunks()
+
+    response = client.get("/expenses/testuser@example.com/export?format=csv",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text == "id,amount\n123e4567-e89b-12d3-a456-426614174000,100.0\n"
+
+
+@patch("services.expense.supabase")
+def test_export_streams_pages(mock_supabase):
+    async def pages(user, page_size):
+        yield [{"id": "e1", "amount": 1.0, "category": "food", "created_at": "2025-01-01T00:00:00Z"}]
+        yield [{"id": "e2", "amount": 2.5, "category": "travel", "created_at": "2025-01-02T00:00:00Z"}]
+
+    async def collect(export_format):
+        return [chunk async for chunk in Expense.export(({"id": "u1"}, "mock_token"), export_format)]
+
+    mock_supabase.iter_expenses_by_user = pages
+    csv_chunks = asyncio.run(collect(FileFormatEnum.CSV))
+    assert len(csv_chunks) == 3
+    assert csv_chunks[0].startswith("id,user_id,amount,category")
+    assert csv_chunks[2].startswith("e2,,2.5,travel")
+
+    ndjson_chunks = asyncio.run(collect(FileFormatEnum.NDJSON))
+    assert [json.loads(chunk)["id"] for chunk in ndjson_chunks] == ["e1", "e2"]
+
+
+@patch.object(Expense, 'import_stream', new_callable=AsyncMock)
+def test_import_expenses(mock_import_stream):
+    mock_import_stream.return_value = {"processed": 2, "inserted": 1, "failed": 1,
+                                       "errors": [{"row": 2, "detail": "Category not found"}],
+                                       "duration_seconds": 0.01, "rows_per_second": 200.0}
+
+    response = client.post("/expenses/import?format=ndjson", content=b'{"amount": 1, "category": "food"}\n',
+                           headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()["errors"] == [{"row": 2, "detail": "Category not found"}]
+    assert mock_import_stream.call_args.args[2] == FileFormatEnum.NDJSON
+
+
+@patch("services.expense.BULK_BATCH_SIZE", 2)
+@patch("services.expense.supabase")
+@patch("utils.utils.supabase")
+def test_import_stream_parses_incrementally(mock_utils_supabase, mock_supabase):
+    mock_utils_supabase.get_user_categories = AsyncMock(return_value=[])
+    mock_supabase.create_expenses = AsyncMock(side_effect=lambda user, rows: [{"id": str(i)} for i in range(len(rows))])
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0"}, "mock_token")
+    category_cache.pop(user[0]["id"])
+    upload = (b'amount,category,description,currency\n10,food,"Lunch,\nwith team",EUR\n'
+              b'abc,food,,\n5,unknown,,\n7.5,travel,,\n3,food,Coffee,USD')
+
+    async def chunks():
+        for start in range(0, len(upload), 7):
+            yield upload[start:start + 7]
+
+    report = asyncio.run(Expense.import_stream(user, chunks(), FileFormatEnum.CSV))
+    assert (report["processed"], report["inserted"], report["failed"]) == (5, 3, 2)
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+    assert mock_supabase.create_expenses.call_count == 2
+    first_batch = mock_supabase.create_expenses.call_args_list[0].args[1]
+    assert first_batch[0]["description"] == "Lunch,\nwith team"
+    assert first_batch[0]["currency"] == "EUR"
+
+
+@patch.object(Expense, 'summarize', new_callable=AsyncMock)
+def test_get_expense_summary(mock_summarize):
+    mock_summarize.return_value = {"start_date": None, "end_date": None, "bucket": "week", "count": 1,
+                                   "totals": [{"key": "USD", "currency": "USD", "total": 100.0, "count": 1}],
+                                   "by_category": [], "by_payment_method": [], "by_period": []}
+
+    response = client.get("/expenses/testuser@example.com/summary?bucket=week",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()["totals"][0]["total"] == 100.0
+    assert mock_summarize.call_args.args[1] == SummaryFilters(bucket="week")
+
+    response = client.get("/expenses/someone@example.com/summary", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 403
+
+
+@patch("utils.utils.supabase")
+@patch("services.expense.supabase")
+def test_update_is_a_single_conditional_write(mock_supabase, mock_utils_supabase):
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0"}, "mock_token")
+    mock_supabase.update_expense = AsyncMock(return_value={"id": "e1", "user_id": user[0]["id"], "amount": 5.0})
+    mock_utils_supabase.get_expense_by_id = AsyncMock()
+
+    assert asyncio.run(Expense.update("e1", ExpenseUpdate(amount=5.0), user))["amount"] == 5.0
+    mock_supabase.update_expense.assert_called_once()
+    mock_utils_supabase.get_expense_by_id.assert_not_called()
+
+
+@patch("utils.utils.supabase")
+@patch("services.expense.supabase")
+def test_failed_conditional_write_tells_404_from_403(mock_supabase, mock_utils_supabase):
+    user = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0"}, "mock_token")
+    mock_supabase.delete_expense = AsyncMock(return_value=[])
+
+    mock_utils_supabase.get_expense_by_id = AsyncMock(return_value=None)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(Expense.delete("e1", user))
+    assert exc_info.value.status_code == 404
+
+    mock_utils_supabase.get_expense_by_id = AsyncMock(return_value={"id": "e1", "user_id": "someone-else"})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(Expense.delete("e1", user))
+    assert exc_info.value.status_code == 403
+
+
+@patch.object(Expense, 'get_by_user', new_callable=AsyncMock)
+def test_get_expenses_conditional_requests(mock_get_expenses_by_user):
+    mock_get_expenses_by_user.return_value = [{
+        "id": "123e4567-e89b-12d3-a456-426614174000",
+        "user_id": "123e4567-e89b-12d3-a456-426614174001",
+        "amount": 100.0,
+        "category": "testcategory",
+        "description": "Test Expense",
+        "payment_method": "bank",
+        "is_recurring": False,
+        "currency": "USD",
+        "created_at": "2023-10-01T12:00:00Z",
+        "updated_at": "2023-10-02T12:00:00Z"
+    }]
+    headers = {"Authorization": "Bearer mock_token"}
+
+    response = client.get("/expenses/testuser@example.com", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "Last-Modified" not in response.headers
+
+    response = client.get("/expenses/testuser@example.com", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # A date can't tell deletions apart, so it never answers 304 on its own
+    response = client.get("/expenses/testuser@example.com",
+                          headers={**headers, "If-Modified-Since": "Tue, 03 Oct 2023 00:00:00 GMT"})
+    assert response.status_code == 200
+
+    # A different page of the same rows has its own ETag
+    response = client.get("/expenses/testuser@example.com?category=food", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+    mock_get_expenses_by_user.return_value[0]["amount"] = 150.0
+    mock_get_expenses_by_user.return_value[0]["updated_at"] = "2023-10-03T12:00:00Z"
+    response = client.get("/expenses/testuser@example.com", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["amount"] == 150.0
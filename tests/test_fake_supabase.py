@@ -0,0 +1,98 @@
+from benchmarks.fake_supabase import FakeSupabase, ANON_KEY, start
+from db import AsyncSupabaseClient, UpstreamUnavailable, Query, quote
+from db.supabase import Supabase
+from unittest.mock import patch
+
+import asyncio
+import aiohttp
+import pytest
+
+
+def run_against_fake(scenario):
+    """Run `scenario(client, token)` with a client talking to a freshly started fake Supabase."""
+
+    async def run():
+        runner, url = await start(FakeSupabase())
+        client = AsyncSupabaseClient(url, ANON_KEY)
+        await client._init_session()
+        try:
+            await client.sign_up("testuser@example.com", "password")
+            session = await client.sign_in("testuser@example.com", "password")
+            return await scenario(client, session)
+        finally:
+            await client._close_session()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_keyset_pages_count_and_bulk_writes():
+    async def scenario(client, session):
+        token, user_id = session["access_token"], session["user"]["id"]
+        rows = await client.insert("expenses", [{"user_id": user_id, "amount": amount, "category": "food",
+                                                 "created_at": f"2025-01-0{amount}T00:00:00+00:00"}
+                                                for amount in range(1, 6)], token)
+        assert [row["currency"] for row in rows] == ["USD"] * 5  # Column defaults are filled in
+
+        page = await client.select("expenses", token, Query().eq("user_id", user_id).order("created_at", desc=True)
+                                   .order("id", desc=True).limit(2))
+        assert [row["amount"] for row in page] == [5, 4]
+        created_at, expense_id = map(quote, (page[-1]["created_at"], page[-1]["id"]))
+        next_page = await client.select("expenses", token, Query().eq("user_id", user_id).or_(
+            f"created_at.lt.{created_at}", f"and(created_at.eq.{created_at},id.lt.{expense_id})")
+            .order("created_at", desc=True).order("id", desc=True).limit(2))
+        assert [row["amount"] for row in next_page] == [3, 2]
+
+        assert await client.count("expenses", token, Query().eq("user_id", user_id).gte("amount", 3)) == 3
+        ids = [row["id"] for row in rows[:2]]
+        updated = await client.update("expenses", Query().eq("user_id", user_id).in_("id", ids), {"amount": 9}, token)
+        assert sorted(row["amount"] for row in updated) == [9, 9]
+        deleted = await client.delete("expenses", Query().eq("user_id", user_id).in_("id", ids), token)
+        assert len(deleted) == 2
+        return await client.select("expenses", token, Query().select("amount").eq("user_id", user_id))
+
+    assert run_against_fake(scenario) == [{"amount": 3}, {"amount": 4}, {"amount": 5}]
+
+
+def test_auth_errors_and_refresh():
+    async def scenario(client, session):
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await client.sign_in("testuser@example.com", "wrong")
+        assert error.value.status == 400 and error.value.message == "Invalid login credentials"
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await client.select("expenses", "not-a-jwt")
+        assert error.value.status == 401
+        return await client.refresh_token(session["refresh_token"])
+
+    assert run_against_fake(scenario)["user"]["email"] == "testuser@example.com"
+
+
+def test_concurrent_logins_upsert_a_single_users_row():
+    async def scenario(client, session):
+        facade = Supabase()
+        facade.client = facade.db = client
+        with patch("db.supabase.SUPABASE_KEY", ANON_KEY):
+            with patch.object(client, "upsert", wraps=client.upsert) as upsert:
+                await asyncio.gather(*(facade.login_user("testuser@example.com", "password") for _ in range(3)))
+            assert upsert.call_args.kwargs["ignore_duplicates"]  # INSERT ... ON CONFLICT DO NOTHING, no UPDATE grant
+            with pytest.raises(ValueError):
+                await facade.register_user("testuser@example.com", "password")
+            assert (await facade.register_user("other@example.com", "password"))["email"] == "other@example.com"
+            lookup_failure = UpstreamUnavailable("rest", 1, "Circuit open")
+            with patch.object(facade, "get_user_by_email", side_effect=lookup_failure), \
+                    patch.object(client, "sign_up") as sign_up, pytest.raises(UpstreamUnavailable):
+                await facade.register_user("third@example.com", "password")
+            sign_up.assert_not_called()
+        return await client.select("users", ANON_KEY)
+
+    assert [row["email"] for row in run_against_fake(scenario)] == ["testuser@example.com"]
+
+
+def test_count_with_fast_json():
+    async def scenario(client, session):
+        token, user_id = session["access_token"], session["user"]["id"]
+        await client.insert("expenses", {"user_id": user_id, "amount": 1, "category": "food"}, token)
+        with patch("db.async_supabase_client.FAST_JSON", True):
+            return await client.count("expenses", token, Query().eq("user_id", user_id))
+
+    assert run_against_fake(scenario) == 1
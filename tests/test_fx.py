@@ -0,0 +1,85 @@
+from unittest.mock import AsyncMock, patch
+from utils import FxRates, ExpenseColumns, summarize
+from tests.conftest import client
+
+import numpy as np
+import asyncio
+import pytest
+import os
+
+RATES = "date,currency,rate\n2025-02-01,EUR,1.04\n2025-01-01,EUR,1.03\n2025-03-01,EUR,1.08\n"
+
+
+@pytest.fixture
+def rates(tmp_path) -> FxRates:
+    path = tmp_path / "fx_rates.csv"
+    path.write_text(RATES)
+    return FxRates(str(path))
+
+
+def test_convert_uses_the_latest_rate_on_or_before_each_date(rates):
+    dates = np.asarray(["2024-12-31", "2025-01-31", "2025-02-01", "2025-06-30", "2025-02-15"], dtype="datetime64[D]")
+    currencies = np.asarray(["EUR", "EUR", "EUR", "EUR", "USD"])
+    converted = rates.convert(np.full(5, 100.0), currencies, dates, "USD")
+    assert converted == pytest.approx([103, 103, 104, 108, 100])
+    assert rates.convert(np.asarray([104.0]), np.asarray(["USD"]), dates[2:3], "EUR") == pytest.approx([100])
+    assert np.isnan(rates.convert(np.asarray([1.0]), np.asarray(["GBP"]), dates[:1], "USD")).all()
+
+
+def test_refresh_reloads_a_changed_file(rates):
+    rates.convert(np.asarray([1.0]), np.asarray(["EUR"]), np.asarray(["2025-01-01"], dtype="datetime64[D]"), "USD")
+    assert not rates.refresh()
+    with open(rates.path, "a") as file:
+        file.write("2025-01-01,GBP,1.25\n")
+    os.utime(rates.path, (0, os.path.getmtime(rates.path) + 1))
+    assert rates.refresh()
+    assert rates.tables["GBP"][1].tolist() == [1.25]
+
+
+def test_malformed_file_keeps_the_loaded_rates(rates):
+    rates.load()
+    with open(rates.path, "a") as file:
+        file.write("2025-04-01,EUR,not-a-rate\n")
+    os.utime(rates.path, (0, os.path.getmtime(rates.path) + 1))
+
+    async def refresh_once():
+        task = asyncio.create_task(rates.refresh_periodically(3600))
+        await asyncio.sleep(0.05)
+        assert not task.done()  # The failed reload didn't end the refresher
+        task.cancel()
+
+    asyncio.run(refresh_once())
+    assert rates.tables["EUR"][1].tolist() == [1.03, 1.04, 1.08]
+
+    broken = FxRates(rates.path)  # A first load that fails leaves only the quote currency convertible
+    dates = np.asarray(["2025-01-01", "2025-01-01"], dtype="datetime64[D]")
+    converted = broken.convert(np.asarray([1.0, 1.0]), np.asarray(["USD", "EUR"]), dates, "USD")
+    assert converted[0] == 1 and np.isnan(converted[1])
+
+
+def test_summarize_in_a_base_currency(rates):
+    columns = ExpenseColumns()
+    columns.extend([
+        {"amount": 10.0, "category": "food", "currency": "USD", "created_at": "2025-01-06T10:00:00+00:00"},
+        {"amount": 20.0, "category": "food", "currency": "EUR", "created_at": "2025-02-01T08:00:00+00:00"},
+        {"amount": 5.0, "category": "food", "currency": "GBP", "created_at": "2025-02-01T08:00:00+00:00"},
+    ])
+    with patch("utils.analytics.fx_rates", rates):
+        summary = summarize(columns, "month", "USD")
+    assert summary["totals"] == [{"key": "GBP", "currency": "GBP", "total": 5.0, "count": 1},
+                                 {"key": "USD", "currency": "USD", "total": 30.8, "count": 2}]
+
+
+@patch("services.expense.supabase")
+def test_get_expenses_with_base_currency(mock_supabase, rates):
+    mock_supabase.get_expenses_by_user = AsyncMock(return_value=[
+        {"id": "6f1a4a9e-7f0e-4d3c-9a7e-0c1f5b2e8d11", "user_id": "b79ab841-9bc5-426c-826e-192110dbada0",
+         "amount": 10.0, "category": "food", "description": None, "payment_method": "bank", "is_recurring": False,
+         "currency": "USD", "created_at": "2025-03-02T10:00:00+00:00"}])
+
+    with patch("services.expense.fx_rates", rates):
+        response = client.get("/expenses/testuser@example.com?base_currency=EUR",
+                              headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()[0]["base_currency"] == "EUR"
+    assert response.json()[0]["base_amount"] == 9.26
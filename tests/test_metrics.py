@@ -0,0 +1,34 @@
+from unittest.mock import AsyncMock, patch
+from utils.metrics import MetricsRegistry
+from tests.conftest import client
+from services import Category
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.inc("http_requests_total", (("method", "GET"), ("route", "/categories"), ("status", "200")))
+    registry.inc("http_requests_total", (("method", "GET"), ("route", "/categories"), ("status", "200")))
+    registry.observe("http_request_duration_seconds", (("route", "/categories"),), 0.02)
+    registry.add_collector(lambda: [("cache_size", {"cache": 'to"ken'}, 3)])
+
+    text = registry.render()
+    assert '# TYPE http_requests_total counter' in text
+    assert 'http_requests_total{method="GET",route="/categories",status="200"} 2' in text
+    assert 'http_request_duration_seconds_bucket{route="/categories",le="0.01"} 0' in text
+    assert 'http_request_duration_seconds_bucket{route="/categories",le="0.025"} 1' in text
+    assert 'http_request_duration_seconds_bucket{route="/categories",le="+Inf"} 1' in text
+    assert 'http_request_duration_seconds_count{route="/categories"} 1' in text
+    assert 'cache_size{cache="to\\"ken"} 3' in text
+
+
+@patch.object(Category, 'get_all', new_callable=AsyncMock)
+def test_metrics_endpoint_reports_route_templates(mock_get_all_categories):
+    mock_get_all_categories.return_value = []
+    client.get("/categories", headers={"Authorization": "Bearer mock_token"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/categories",status="200"}' in response.text
+    assert 'cache_hits{cache="token"}' in response.text
+    assert "supabase_pool_in_use" in response.text
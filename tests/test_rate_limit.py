@@ -0,0 +1,91 @@
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+from middleware import RateLimitMiddleware, TokenBucket
+from db.resilience import ConcurrencyLimiter
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from utils.metrics import MetricsRegistry
+from tests.conftest import client
+from services import Category
+from utils import token_cache
+from fastapi import FastAPI
+from db import UpstreamBusy
+
+import asyncio
+import pytest
+import time
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == pytest.approx(0.5, abs=0.01)
+    with patch("middleware.rate_limit_middleware.time.monotonic", return_value=time.monotonic() + 0.5):
+        assert bucket.take() == 0
+
+
+def test_requests_over_the_limit_get_429_per_user_and_route():
+    app = FastAPI()
+    registry = MetricsRegistry()
+    app.add_middleware(RateLimitMiddleware, metrics=registry, routes=app.router.routes, rate=1, burst=2,
+                       route_limits={("POST", "/expenses"): (1, 1)}, enabled=True)
+    app.get("/expenses/{user_email}")(lambda user_email: [])
+    app.post("/expenses")(lambda: {})
+    token_cache.set("token-a", ({"id": "user-a"}, "token-a"))
+    token_cache.set("token-b", ({"id": "user-b"}, "token-b"))
+    test_client = TestClient(app)
+
+    statuses = [test_client.get(f"/expenses/{email}", headers={"Authorization": "Bearer token-a"}).status_code
+                for email in ("a@example.com", "b@example.com", "c@example.com")]
+    assert statuses == [200, 200, 429]  # One bucket for the route template, not per path
+    assert test_client.get("/expenses/a@example.com", headers={"Authorization": "Bearer token-b"}).status_code == 200
+    assert test_client.post("/expenses", headers={"Authorization": "Bearer token-a"}).status_code == 200
+    response = test_client.post("/expenses", headers={"Authorization": "Bearer token-a"})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+    assert registry.counters["http_requests_shed_total"] == {
+        (("reason", "rate_limited"), ("route", "/expenses/{user_email}")): 1,
+        (("reason", "rate_limited"), ("route", "/expenses")): 1}
+
+
+def test_clients_behind_a_trusted_proxy_get_their_own_buckets():
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, metrics=MetricsRegistry(), routes=app.router.routes,
+                       route_limits={("POST", "/login"): (1, 1)}, enabled=True)
+    app.post("/login")(lambda: {})
+    test_client = TestClient(ProxyHeadersMiddleware(app, trusted_hosts="*"))
+
+    def login(address: str) -> int:
+        return test_client.post("/login", headers={"X-Forwarded-For": f"{address}, 10.0.0.1"}).status_code
+
+    assert [login("203.0.113.1"), login("203.0.113.2"), login("203.0.113.1")] == [200, 200, 429]
+
+
+def test_concurrency_limiter_queues_then_sheds():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=1, queue_timeout=1)
+    order = []
+
+    async def request(name, seconds):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    async def run():
+        first = asyncio.ensure_future(request("first", 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(request("queued", 0))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamBusy):
+            await request("shed", 0)
+        await asyncio.gather(first, second)
+
+    asyncio.run(run())
+    assert order == ["first", "queued"]
+    assert limiter.active == 0 and limiter.rejected == 1
+
+
+@patch.object(Category, 'get_all', new_callable=AsyncMock)
+def test_upstream_busy_is_answered_with_429(mock_get_all_categories):
+    mock_get_all_categories.side_effect = UpstreamBusy(2)
+
+    response = client.get("/categories", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
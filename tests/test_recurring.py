@@ -0,0 +1,76 @@
+from benchmarks.fake_supabase import SERVICE_KEY
+from tests.test_fake_supabase import run_against_fake
+from services.recurring import Recurring, add_months
+from datetime import datetime, timezone
+from db.supabase import Supabase
+from unittest.mock import AsyncMock, patch
+from db import Query
+
+import asyncio
+import pytest
+
+NOW = datetime(2025, 4, 15, tzinfo=timezone.utc)
+
+
+def test_add_months_clamps_to_the_end_of_the_month():
+    assert add_months(datetime(2025, 1, 31), 1) == datetime(2025, 2, 28)
+    assert add_months(datetime(2024, 1, 31), 1) == datetime(2024, 2, 29)
+    assert add_months(datetime(2025, 11, 30), 3) == datetime(2026, 2, 28)
+    assert add_months(datetime(2025, 3, 31), -1) == datetime(2025, 2, 28)
+
+
+def test_run_once_materializes_due_occurrences_once():
+    async def scenario(client, session):
+        facade = Supabase()
+        facade.client = facade.db = client
+        user_id = session["user"]["id"]
+        await client.insert("expenses", [
+            {"user_id": user_id, "amount": 10, "category": "rent", "is_recurring": True,
+             "created_at": "2025-01-31T09:00:00+00:00"},
+            {"user_id": user_id, "amount": 20, "category": "food", "is_recurring": False,
+             "created_at": "2025-01-01T09:00:00+00:00"},
+            {"user_id": user_id, "amount": 30, "category": "gym", "is_recurring": True,
+             "created_at": "2025-04-01T09:00:00+00:00"},
+        ], SERVICE_KEY)
+        with patch("db.supabase.SUPABASE_SERVICE_KEY", SERVICE_KEY), patch("services.recurring.supabase", facade):
+            produced = [await Recurring.run_once(NOW), await Recurring.run_once(NOW)]
+        rows = await client.select("expenses", SERVICE_KEY, Query().eq("amount", 10).order("created_at"))
+        return produced, [(row["created_at"][:10], row["is_recurring"]) for row in rows]
+
+    produced, rows = run_against_fake(scenario)
+    assert produced == [2, 0]
+    assert rows == [("2025-01-31", False), ("2025-02-28", False), ("2025-03-31", True)]
+
+
+def test_an_interrupted_run_is_completed_by_the_next_one():
+    async def scenario(client, session):
+        facade = Supabase()
+        facade.client = facade.db = client
+        await client.insert("expenses", {"user_id": session["user"]["id"], "amount": 10, "category": "rent",
+                                         "is_recurring": True, "created_at": "2025-02-15T09:00:00+00:00"}, SERVICE_KEY)
+        with patch("db.supabase.SUPABASE_SERVICE_KEY", SERVICE_KEY), patch("services.recurring.supabase", facade):
+            # Cancelled between inserting the occurrences and clearing the flag
+            with patch.object(facade, "stop_recurring", AsyncMock(side_effect=asyncio.CancelledError)):
+                with pytest.raises(asyncio.CancelledError):
+                    await Recurring.run_once(NOW)
+            produced = await Recurring.run_once(NOW)
+        rows = await client.select("expenses", SERVICE_KEY, Query().order("created_at"))
+        return produced, [(row["created_at"][:10], row["is_recurring"]) for row in rows]
+
+    produced, rows = run_against_fake(scenario)
+    assert produced == 0  # The occurrence inserted before the interruption isn't created again
+    assert rows == [("2025-02-15", False), ("2025-03-15", True)]
+
+
+def test_only_one_worker_holds_the_lease():
+    async def scenario(client, session):
+        facade = Supabase()
+        facade.client = facade.db = client
+        expires_at, later = "2025-04-15T00:15:00+00:00", "2025-04-15T00:20:00+00:00"
+        with patch("db.supabase.SUPABASE_SERVICE_KEY", SERVICE_KEY):
+            return [await facade.acquire_lease("job", "a", NOW.isoformat(), expires_at),
+                    await facade.acquire_lease("job", "b", NOW.isoformat(), expires_at),
+                    await facade.acquire_lease("job", "a", NOW.isoformat(), expires_at),
+                    await facade.acquire_lease("job", "b", later, later)]
+
+    assert run_against_fake(scenario) == [True, False, True, True]
@@ -0,0 +1,98 @@
+from db.resilience import CircuitBreaker, UpstreamUnavailable
+from db import AsyncSupabaseClient, async_supabase_client
+from unittest.mock import AsyncMock, patch
+from tests.conftest import client
+from services import Category
+
+import asyncio
+import aiohttp
+import pytest
+import time
+
+
+def upstream_error(status):
+    return aiohttp.ClientResponseError(None, (), status=status, message="Service Unavailable")
+
+
+def test_circuit_breaker_opens_and_recovers_through_a_probe():
+    breaker = CircuitBreaker("rest", failure_rate=0.5, min_requests=4, window=30, open_seconds=5)
+    for succeeded in (True, False, False, True):
+        breaker.record(succeeded, breaker.before_request())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(UpstreamUnavailable) as error:
+        breaker.before_request()
+    assert 0 < error.value.retry_after <= 5
+
+    with patch("db.resilience.time.monotonic", return_value=time.monotonic() + 10):
+        probe = breaker.before_request()
+        assert probe and breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(UpstreamUnavailable):
+            breaker.before_request()  # Only one probe at a time
+        breaker.record(True, probe)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.rejected == 2
+
+
+def test_reads_are_retried_and_writes_are_not():
+    supabase_client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    responses = [upstream_error(503), upstream_error(503), (None, [{"id": "1"}])]
+
+    async def fake_attempt(method, *args):
+        response = responses.pop(0) if method == "GET" else upstream_error(503)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    supabase_client._attempt = fake_attempt
+    with patch.object(async_supabase_client, "RETRY_BASE_DELAY", 0):
+        assert asyncio.run(supabase_client._request("GET", "rest/v1/expenses")) == [{"id": "1"}]
+        with pytest.raises(UpstreamUnavailable):
+            asyncio.run(supabase_client._request("POST", "rest/v1/expenses", data={}))
+    assert supabase_client.retried_requests == 2
+    assert supabase_client.breakers["rest"].failures == 3
+
+
+def test_slow_reads_are_hedged():
+    supabase_client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    calls = []
+
+    async def fake_attempt(method, url, data, params, headers, timeout, latencies):
+        calls.append(url)
+        await asyncio.sleep(1 if len(calls) == 1 else 0)
+        return None, len(calls)
+
+    supabase_client._attempt = fake_attempt
+    window = supabase_client.latencies.setdefault("GET /rest/v1/expenses", async_supabase_client.LatencyWindow())
+    for _ in range(20):
+        window.add(0.01)
+    with patch.object(async_supabase_client, "HEDGE_READS", True):
+        assert asyncio.run(supabase_client._request("GET", "rest/v1/expenses")) == 2
+    assert supabase_client.hedged_requests == 1
+
+    assert list(supabase_client.latencies) == ["GET /rest/v1/expenses"]
+
+
+def test_request_timeouts_keep_the_socket_timeouts():
+    supabase_client = AsyncSupabaseClient("http://localhost:54321", "anon-key")
+    timeouts = []
+
+    async def fake_attempt(method, url, data, params, headers, timeout, latencies):
+        timeouts.append(timeout)
+        return None, None
+
+    supabase_client._attempt = fake_attempt
+    for user_id in ("1", "2"):
+        asyncio.run(supabase_client._request("DELETE", f"auth/v1/admin/users/{user_id}"))
+    assert timeouts[0].total == async_supabase_client.AUTH_TIMEOUT
+    assert timeouts[0].sock_connect == async_supabase_client.CONNECT_TIMEOUT
+    assert timeouts[0].sock_read == async_supabase_client.READ_TIMEOUT
+    assert list(supabase_client.latencies) == ["DELETE /auth/v1/admin"]  # Not one window per user id
+
+
+@patch.object(Category, 'get_all', new_callable=AsyncMock)
+def test_upstream_unavailable_is_answered_with_503(mock_get_all_categories):
+    mock_get_all_categories.side_effect = UpstreamUnavailable("rest", 4.2, "Circuit open")
+
+    response = client.get("/categories", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,63 @@
+from utils import UserRollup, rollups, record_expenses, forget_expenses
+from unittest.mock import AsyncMock, patch
+from tests.conftest import client
+from services import Rollup
+
+import asyncio
+
+USER = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com"}, "mock_token")
+
+
+def make_row(expense_id: str, amount: float, category: str = "food", created_at: str = "2025-01-15T10:00:00+00:00",
+             currency: str = "USD") -> dict:
+    return {"id": expense_id, "amount": amount, "category": category, "currency": currency, "created_at": created_at}
+
+
+def test_user_rollup_incremental_updates():
+    rollup = UserRollup()
+    rollup.add(make_row("e1", 10.0))
+    rollup.add(make_row("e2", 5.0))
+    rollup.add(make_row("e3", 7.0, created_at="2025-02-01T00:00:00+00:00", currency="EUR"))
+    assert rollup.totals("2025-01") == [{"month": "2025-01", "category": "food", "currency": "USD", "total": 15.0,
+                                         "count": 2}]
+
+    rollup.add(make_row("e2", 8.0, category="travel"))  # Updated expense moves to another category
+    rollup.add(make_row("e1", 10.0))  # Recording the same expense again doesn't count it twice
+    rollup.remove("e3")
+    rollup.remove("unknown")
+    assert rollup.totals() == [{"month": "2025-01", "category": "food", "currency": "USD", "total": 10.0, "count": 1},
+                               {"month": "2025-01", "category": "travel", "currency": "USD", "total": 8.0, "count": 1}]
+
+
+@patch("services.rollup.supabase")
+def test_rollup_rebuild_then_incremental(mock_supabase):
+    async def pages(user, filters, page_size, columns):
+        yield [make_row("e1", 10.0), make_row("e2", 2.5)]
+        yield [make_row("e3", 4.0, created_at="2025-03-02T00:00:00+00:00")]
+
+    mock_supabase.iter_expenses_by_user = pages
+    rollups.cache.pop(USER[0]["id"])
+
+    assert [entry["total"] for entry in asyncio.run(Rollup.get(USER))] == [12.5, 4.0]
+    record_expenses(USER, [make_row("e4", 1.5, created_at="2025-03-05T00:00:00+00:00")])
+    forget_expenses(USER, ["e1"])
+    assert asyncio.run(Rollup.get(USER, "2025-03")) == [{"month": "2025-03", "category": "food", "currency": "USD",
+                                                         "total": 5.5, "count": 2}]
+    assert asyncio.run(Rollup.get(USER, "2025-01"))[0]["total"] == 2.5
+    rollups.cache.pop(USER[0]["id"])
+
+
+@patch.object(Rollup, 'get', new_callable=AsyncMock)
+def test_get_expense_rollups(mock_get_rollups):
+    mock_get_rollups.return_value = [{"month": "2025-01", "category": "food", "currency": "USD", "total": 10.0,
+                                      "count": 1}]
+
+    response = client.get("/expenses/testuser@example.com/rollups?month=2025-01",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()[0]["total"] == 10.0
+    assert mock_get_rollups.call_args.args[1] == "2025-01"
+
+    response = client.get("/expenses/testuser@example.com/rollups?month=January",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 422
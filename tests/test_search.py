@@ -0,0 +1,79 @@
+from utils import UserSearchIndex, search_indexes, record_expenses, forget_expenses
+from unittest.mock import AsyncMock, patch
+from tests.conftest import client
+from services import Search
+
+import asyncio
+
+USER = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com"}, "mock_token")
+
+
+def make_row(expense_id: str, description: str, category: str = "food") -> dict:
+    return {"id": expense_id, "user_id": USER[0]["id"], "amount": 1.0, "category": category,
+            "description": description, "payment_method": "bank", "is_recurring": False, "currency": "USD",
+            "created_at": "2025-01-06T10:00:00+00:00"}
+
+
+def test_index_ranks_fuzzy_and_prefix_matches():
+    index = UserSearchIndex()
+    index.add(make_row("e1", "Coffee with the team"))
+    index.add(make_row("e2", "Coffee beans, coffee filters"))
+    index.add(make_row("e3", "Groceries", category="household"))
+
+    assert [expense_id for expense_id, _ in index.search("coffee", 10)] == ["e2", "e1"]
+    assert [expense_id for expense_id, _ in index.search("cofee", 10)] == ["e2", "e1"]  # Typo
+    assert [expense_id for expense_id, _ in index.search("groc", 10)] == ["e3"]  # Unfinished word
+    assert {expense_id for expense_id, _ in index.search("household team", 10)} == {"e1", "e3"}  # Any term
+    assert index.search("rent", 10) == []
+
+
+def test_index_replaces_and_removes_expenses():
+    index = UserSearchIndex()
+    index.add(make_row("e1", "Taxi to the airport"))
+    index.add(make_row("e1", "Train to the airport"))
+    assert index.search("taxi", 10) == []
+    assert [expense_id for expense_id, _ in index.search("train", 10)] == ["e1"]
+    index.remove("e1")
+    assert len(index) == 0 and not index.postings and not index.term_trigrams
+
+
+@patch("services.search.supabase")
+def test_search_builds_lazily_then_updates_incrementally(mock_supabase):
+    rows = {row["id"]: row for row in [make_row("e1", "Dinner at Luigi's"), make_row("e2", "Cinema tickets")]}
+
+    async def pages(user, filters, page_size, columns):
+        yield [{"id": row["id"], "created_at": row["created_at"], "description": row["description"],
+                "category": row["category"]} for row in rows.values()]
+
+    async def get_expenses_by_ids(user, expense_ids):
+        return [rows[expense_id] for expense_id in expense_ids if expense_id in rows]
+
+    mock_supabase.iter_expenses_by_user = pages
+    mock_supabase.get_expenses_by_ids = get_expenses_by_ids
+    search_indexes.cache.pop(USER[0]["id"])
+
+    assert [row["id"] for row in asyncio.run(Search.expenses(USER, "diner", 10))] == ["e1"]
+    rows["e3"] = make_row("e3", "Dinner with parents")
+    record_expenses(USER, [rows["e3"]])
+    assert {row["id"] for row in asyncio.run(Search.expenses(USER, "dinner", 10))} == {"e1", "e3"}
+    del rows["e1"]
+    forget_expenses(USER, ["e1"])
+    assert [row["id"] for row in asyncio.run(Search.expenses(USER, "dinner", 10))] == ["e3"]
+    search_indexes.cache.pop(USER[0]["id"])
+
+
+@patch.object(Search, 'expenses', new_callable=AsyncMock)
+def test_search_expenses_endpoint(mock_search):
+    mock_search.return_value = [make_row("6f1a4a9e-7f0e-4d3c-9a7e-0c1f5b2e8d11", "Coffee")]
+
+    response = client.get("/expenses/testuser@example.com/search?q=cofee&limit=5",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 200
+    assert response.json()[0]["description"] == "Coffee"
+    assert mock_search.call_args.args[1:] == ("cofee", 5)
+
+    response = client.get("/expenses/someone@example.com/search?q=coffee",
+                          headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 403
+    response = client.get("/expenses/testuser@example.com/search?q=", headers={"Authorization": "Bearer mock_token"})
+    assert response.status_code == 422
@@ -0,0 +1,66 @@
+from db.sql import (compile_select, compile_count, compile_insert, compile_upsert, compile_update, compile_delete,
+                    filter_params)
+from db.postgres_backend import _coerce, _json_value
+from datetime import datetime, timezone
+from db import Query, quote, supabase
+from decimal import Decimal
+
+import pytest
+import uuid
+
+
+def test_keyset_page_compiles_to_parameterized_sql():
+    created_at, expense_id = quote("2024-01-02T00:00:00+00:00"), quote("e1")
+    query = (Query().select("id", "amount").eq("user_id", "u1").in_("category", ["food", "travel"])
+             .or_(f"created_at.lt.{created_at}", f"and(created_at.eq.{created_at},id.lt.{expense_id})")
+             .order("created_at", desc=True).order("id", desc=True).limit(5))
+
+    sql, params = compile_select("expenses", *filter_params(query))
+    assert sql == ('SELECT "id", "amount" FROM "expenses" WHERE "user_id" = $1 AND "category" IN ($2, $3) AND '
+                   '("created_at" < $4 OR ("created_at" = $5 AND "id" < $6)) '
+                   'ORDER BY "created_at" DESC, "id" DESC LIMIT $7')
+    assert params == [("user_id", "u1"), ("category", "food"), ("category", "travel"),
+                      ("created_at", "2024-01-02T00:00:00+00:00"), ("created_at", "2024-01-02T00:00:00+00:00"),
+                      ("id", "e1"), (None, 5)]
+
+
+def test_filters_writes_and_ranges():
+    query_params, _ = filter_params(Query().is_("description", None).ilike("category", "fo*").neq("amount", 3))
+    sql, params = compile_count("expenses", query_params)
+    assert sql == ('SELECT count(*) FROM "expenses" WHERE "description" IS NULL AND "category" ILIKE $1 '
+                   'AND "amount" <> $2')
+    assert params == [("category", "fo%"), ("amount", "3")]
+
+    sql, params = compile_select("expenses", *filter_params(Query().range(10, 19)))
+    assert sql == 'SELECT * FROM "expenses" LIMIT $1 OFFSET $2' and params == [(None, 10), (None, 10)]
+
+    sql, params = compile_insert("expenses", [{"amount": 1, "category": "food"}, {"amount": 2}])
+    assert sql == 'INSERT INTO "expenses" ("amount", "category") VALUES ($1, $2), ($3, DEFAULT) RETURNING *'
+    assert params == [("amount", 1), ("category", "food"), ("amount", 2)]
+
+    sql, _ = compile_upsert("users", [{"id": "u1", "email": "testuser@example.com"}], ["id"])
+    assert sql == ('INSERT INTO "users" ("id", "email") VALUES ($1, $2) '
+                   'ON CONFLICT ("id") DO UPDATE SET "email" = EXCLUDED."email" RETURNING *')
+    sql, _ = compile_upsert("users", [{"id": "u1", "email": "testuser@example.com"}], ["id"], ignore_duplicates=True)
+    assert sql.endswith('ON CONFLICT ("id") DO NOTHING RETURNING *')
+
+    sql, _ = compile_update("expenses", [("id", "eq.e1")], {"amount": 5})
+    assert sql == 'UPDATE "expenses" SET "amount" = $1 WHERE "id" = $2 RETURNING *'
+    with pytest.raises(ValueError):
+        compile_delete("expenses", [])
+    with pytest.raises(ValueError):
+        compile_select("expenses; drop table users", [])
+
+
+def test_values_are_converted_to_and_from_column_types():
+    expense_id = uuid.uuid4()
+    assert _coerce("uuid", str(expense_id)) == expense_id
+    assert _coerce("numeric", "10.5") == Decimal("10.5")
+    assert _coerce("timestamptz", "2024-01-02") == datetime(2024, 1, 2, tzinfo=timezone.utc)
+    assert _coerce("bool", "true") is True and _coerce("text", "food") == "food" and _coerce("numeric", 3) == 3
+    assert _json_value(expense_id) == str(expense_id) and _json_value(Decimal("10.5")) == 10.5
+    assert _json_value(datetime(2024, 1, 2, tzinfo=timezone.utc)) == "2024-01-02T00:00:00+00:00"
+
+
+def test_rest_is_the_default_storage_backend():
+    assert supabase.db is supabase.client
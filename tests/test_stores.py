@@ -0,0 +1,76 @@
+from utils import UserStore, UserRollup, record_expenses, forget_expenses
+from utils.stores import _stores
+
+import asyncio
+import pytest
+
+USER = ({"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com"}, "mock_token")
+
+
+def make_row(expense_id: str, amount: float) -> dict:
+    return {"id": expense_id, "amount": amount, "category": "food", "currency": "USD",
+            "created_at": "2025-01-15T10:00:00+00:00"}
+
+
+@pytest.fixture
+def store():
+    store = UserStore(UserRollup, 10, 60)
+    yield store
+    _stores.remove(store)
+
+
+def test_concurrent_builds_share_one_pass_and_see_writes(store):
+    passes = []
+
+    async def pages():
+        passes.append(1)
+        yield [make_row("e1", 1.0)]
+        await asyncio.sleep(0.01)
+        yield [make_row("e2", 2.0)]
+
+    async def scenario():
+        first = asyncio.ensure_future(store.get(USER[0]["id"], pages()))
+        while store.cache.peek(USER[0]["id"]) is None:
+            await asyncio.sleep(0)
+        record_expenses(USER, [make_row("e3", 4.0)])  # Written while the pass runs
+        return await asyncio.gather(first, store.get(USER[0]["id"], pages()))
+
+    first, second = asyncio.run(scenario())
+    assert first is second and len(passes) == 1
+    assert first.totals()[0]["total"] == 7.0
+
+    forget_expenses(USER, ["e1"])
+    assert store.cache.peek(USER[0]["id"]).totals()[0]["total"] == 6.0
+
+
+def test_failed_build_is_not_served(store):
+    async def pages():
+        yield [make_row("e1", 1.0)]
+        raise ConnectionError("upstream went away")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(store.get(USER[0]["id"], pages()))
+    assert store.cache.peek(USER[0]["id"]) is None
+    record_expenses(USER, [make_row("e2", 2.0)])  # Users without a loaded structure are skipped
+
+
+def test_writes_during_a_build_win_over_pages_read_before_them(store):
+    async def scenario():
+        paused, resume = asyncio.Event(), asyncio.Event()
+
+        async def pages():
+            yield [make_row("e1", 1.0)]
+            page = [make_row("e2", 2.0), make_row("e3", 3.0)]  # Read before the writes below commit
+            paused.set()
+            await resume.wait()
+            yield page
+
+        build = asyncio.ensure_future(store.get(USER[0]["id"], pages()))
+        await paused.wait()
+        forget_expenses(USER, ["e2"])
+        record_expenses(USER, [make_row("e3", 5.0)])
+        resume.set()
+        return await build
+
+    assert asyncio.run(scenario()).totals()[0]["total"] == 6.0
+    assert not store._written
@@ -14,7 +14,10 @@ def test_register_user(mock_register_user):
 
 
 @patch.object(User, 'login', new_callable=AsyncMock)
-def test_login_user(mock_login_user):
+@patch.object(User, 'register', new_callable=AsyncMock)
+def test_login_user(mock_register_user, mock_login_user):
+    mock_register_user.return_value = {"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com",
+                                       "created_at": "2025-01-15T17:24:15.541471"}
     mock_login_user.return_value = {"access_token": "fake_token"}
     client.post("/register", json={"email": "testuser@example.com", "password": "password123"})
     response = client.post("/login", json={"email": "testuser@example.com", "password": "password123"})
@@ -47,7 +50,10 @@ def test_get_user_by_email(mock_register_user, mock_login_user, mock_validate_us
 
 @patch.object(User, 'delete', new_callable=AsyncMock)
 @patch.object(User, 'login', new_callable=AsyncMock)
-def test_delete_user(mock_login_user, mock_delete_user):
+@patch.object(User, 'register', new_callable=AsyncMock)
+def test_delete_user(mock_register_user, mock_login_user, mock_delete_user):
+    mock_register_user.return_value = {"id": "b79ab841-9bc5-426c-826e-192110dbada0", "email": "testuser@example.com",
+                                       "created_at": "2025-01-15T17:24:15.541471"}
     mock_delete_user.return_value = None
     mock_login_user.return_value = {"access_token": "fake_token"}
     client.post("/register", json={"email": "testuser@example.com", "password": "password123"})
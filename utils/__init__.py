@@ -1,2 +1,13 @@
-from .utils import check_category_exists, check_expense_authorization, validate_user_by_token
+from .utils import (check_category_exists, check_expense_authorization, validate_user_by_token, get_token_lifetime,
+                    token_cache, rejected_token_cache, get_category_names, get_user_categories_by_name,
+                    cache_user_category, uncache_user_category, category_cache)
 from .constants import PREDEFINED_CATEGORIES
+from .cache import TTLCache
+from .pagination import encode_cursor, decode_cursor
+from .analytics import ExpenseColumns, summarize, SUMMARY_COLUMNS
+from .stores import UserStore, record_expenses, forget_expenses
+from .rollups import UserRollup, rollups
+from .conditional import cache_validators, is_not_modified
+from .metrics import metrics, metrics_trace_config, cache_samples
+from .fx import fx_rates, FxRates
+from .search import UserSearchIndex, search_indexes, SEARCH_COLUMNS
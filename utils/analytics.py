@@ -0,0 +1,84 @@
+from typing import Dict, List, Optional, Tuple
+from .fx import fx_rates
+
+import numpy as np
+
+SUMMARY_COLUMNS = ("amount", "category", "payment_method", "currency")
+
+
+class ExpenseColumns:
+    """Columnar buffer of expense rows, so aggregations run over NumPy arrays instead of row by row."""
+
+    def __init__(self):
+        self.amounts: List[float] = []
+        self.categories: List[str] = []
+        self.payment_methods: List[str] = []
+        self.currencies: List[str] = []
+        self.dates: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def extend(self, rows: List[dict]) -> None:
+        """Append a page of rows, keeping only the columns needed for summaries."""
+        self.amounts.extend(row["amount"] for row in rows)
+        self.categories.extend(row["category"] for row in rows)
+        self.payment_methods.extend(row.get("payment_method") or "unknown" for row in rows)
+        self.currencies.extend(row.get("currency") or "unknown" for row in rows)
+        # Supabase returns UTC timestamps, the date part is all that's needed for the period buckets
+        self.dates.extend(row["created_at"][:10] for row in rows)
+
+
+def period_keys(dates: np.ndarray, bucket: str) -> np.ndarray:
+    """Map `datetime64[D]` dates to the start of their day, ISO week (Monday) or month."""
+    if bucket == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    if bucket == "week":
+        # 1970-01-01 was a Thursday, so shifting by 3 makes Monday the first day of the week
+        return dates - (dates.astype(np.int64) + 3) % 7
+    return dates
+
+
+def group_totals(keys: np.ndarray, currencies: Tuple[np.ndarray, np.ndarray], amounts: np.ndarray) -> List[Dict]:
+    """
+    Sum amounts and count rows per (key, currency) pair with a single vectorized pass. `currencies` are the unique
+    currencies and each row's index into them, as returned by `np.unique(..., return_inverse=True)`.
+    """
+    if not len(amounts):
+        return []
+    currency_values, currency_codes = currencies
+    key_values, key_codes = np.unique(keys, return_inverse=True)
+    codes = key_codes * len(currency_values) + currency_codes
+    size = len(key_values) * len(currency_values)
+    totals = np.bincount(codes, weights=amounts, minlength=size)
+    counts = np.bincount(codes, minlength=size)
+
+    groups = []
+    for code in np.flatnonzero(counts):
+        key_index, currency_index = divmod(int(code), len(currency_values))
+        groups.append({"key": str(key_values[key_index]), "currency": str(currency_values[currency_index]),
+                       "total": round(float(totals[code]), 2), "count": int(counts[code])})
+    return groups
+
+
+def summarize(columns: ExpenseColumns, bucket: str, base_currency: Optional[str] = None) -> dict:
+    """
+    Compute totals per currency, category, payment method and period bucket. With a `base_currency`, amounts are
+    converted to it at the rate of their date first, amounts in a currency without rates keep their own currency.
+    """
+    amounts = np.asarray(columns.amounts, dtype=np.float64)
+    currencies = np.asarray(columns.currencies, dtype=str)
+    dates = np.asarray(columns.dates, dtype="datetime64[D]")
+    if base_currency:
+        converted = fx_rates.convert(amounts, currencies, dates, base_currency)
+        convertible = ~np.isnan(converted)
+        amounts = np.where(convertible, converted, amounts)
+        currencies = np.where(convertible, base_currency, currencies)
+    currency_groups = np.unique(currencies, return_inverse=True)
+    return {
+        "count": len(amounts),
+        "totals": group_totals(currencies, currency_groups, amounts),
+        "by_category": group_totals(np.asarray(columns.categories, dtype=str), currency_groups, amounts),
+        "by_payment_method": group_totals(np.asarray(columns.payment_methods, dtype=str), currency_groups, amounts),
+        "by_period": group_totals(period_keys(dates, bucket), currency_groups, amounts),
+    }
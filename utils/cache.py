@@ -0,0 +1,75 @@
+from typing import Any, Callable, Hashable, Optional
+from collections import OrderedDict
+
+import time
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL. Not thread-safe, meant for a single event loop."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for the key, counting a hit or a miss."""
+        value = self.peek(key, self)
+        if value is self:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value without touching the LRU order or the hit/miss counters."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value. A shorter `ttl` than the cache default can be given (e.g. a token's remaining lifetime)."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Remove a single entry if present."""
+        if self._data.pop(key, None) is not None:
+            self.evictions += 1
+
+    def evict_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every entry whose value matches the predicate. Returns the number of removed entries."""
+        keys = [key for key, (value, _) in self._data.items() if predicate(value)]
+        for key in keys:
+            del self._data[key]
+        self.evictions += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop all entries, keeping the counters."""
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Return size and hit/miss/eviction counters, used to size the cache."""
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}
@@ -0,0 +1,28 @@
+from typing import List
+from fastapi import Request
+
+import hashlib
+
+
+def cache_validators(rows: List[dict], *parts: str) -> dict:
+    """
+    Build a weak `ETag` header for a list of rows.
+
+    The ETag is derived from the row count, the first and last ids, the newest `updated_at`/`created_at` and any
+    extra parts identifying the request (e.g. its query string), so it changes when rows are created, updated or
+    deleted. No `Last-Modified` is sent: a date alone can't tell a deletion or a change within the same second apart.
+    """
+    latest = max((row.get("updated_at") or row.get("created_at") or "" for row in rows), default="")
+    first_id, last_id = (rows[0].get("id"), rows[-1].get("id")) if rows else (None, None)
+    fingerprint = "|".join(map(str, (len(rows), first_id, last_id, latest, *parts)))
+    return {"ETag": f'W/"{hashlib.blake2b(fingerprint.encode(), digest_size=12).hexdigest()}"'}
+
+
+def is_not_modified(request: Request, validators: dict) -> bool:
+    """Evaluate `If-None-Match` (weak comparison) against the validators. `If-Modified-Since` isn't honoured."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etag = validators["ETag"].removeprefix("W/")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
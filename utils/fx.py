@@ -0,0 +1,129 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import logging
+import asyncio
+import csv
+import os
+
+import numpy as np
+
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                                                        "fx_rates.csv"))
+FX_REFRESH_SECONDS = float(os.getenv("FX_REFRESH_SECONDS", 3600))  # How often the rate file is checked for changes
+FX_QUOTE_CURRENCY = "USD"  # Rates in the file are the value of one unit of a currency in this currency
+
+logger = logging.getLogger(__name__)
+
+
+class FxRates:
+    """
+    Date-indexed FX rates loaded from a CSV file of `date,currency,rate` rows, where `rate` is the value of one unit of
+    `currency` in USD on that date.
+
+    Each currency's rates are kept as a pair of sorted NumPy arrays (dates and rates), so converting a whole result set
+    is one binary search per currency. A date uses the latest rate published on or before it, dates before the first
+    rate use the first one.
+    """
+
+    def __init__(self, path: str = FX_RATES_FILE):
+        self.path = path
+        self.tables: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+        self.modified: Optional[float] = None
+
+    @property
+    def version(self) -> str:
+        """Identifies the loaded rates, so responses converted with them can be told apart in cache validators."""
+        self._ensure_loaded()
+        return str(self.modified)
+
+    def load(self) -> None:
+        """
+        (Re)load the rate file. A missing file leaves only the quote currency convertible, a malformed one raises and
+        leaves the loaded rates as they were.
+        """
+        columns: Dict[str, Tuple[list, list]] = {}
+        try:
+            modified = os.path.getmtime(self.path)
+            with open(self.path, newline="") as file:
+                for row in csv.DictReader(file):
+                    dates, rates = columns.setdefault(row["currency"].strip().upper(), ([], []))
+                    dates.append(row["date"].strip())
+                    rates.append(float(row["rate"]))
+        except FileNotFoundError:
+            modified = None
+        tables = {}
+        for currency, (dates, rates) in columns.items():
+            dates = np.asarray(dates, dtype="datetime64[D]")
+            order = np.argsort(dates, kind="stable")
+            tables[currency] = (dates[order], np.asarray(rates, dtype=np.float64)[order])
+        self.tables, self.modified = tables, modified
+
+    def refresh(self) -> bool:
+        """Reload the rate file if it changed since it was loaded. Returns whether it was reloaded."""
+        try:
+            modified = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            modified = None
+        if self.tables is not None and modified == self.modified:
+            return False
+        self.load()
+        return True
+
+    async def refresh_periodically(self, interval: float = FX_REFRESH_SECONDS) -> None:
+        """Check the rate file for changes every `interval` seconds, until cancelled. Failed reloads are logged."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Reloading FX rates from %s failed, keeping the loaded rates", self.path)
+            await asyncio.sleep(interval)
+
+    def _ensure_loaded(self) -> None:
+        """Load the rates on first use. If that fails, only the quote currency is convertible until a refresh works."""
+        if self.tables is not None:
+            return
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Loading FX rates from %s failed", self.path)
+            self.tables, self.modified = {}, None
+
+    def _quote_values(self, currency: str, dates: np.ndarray) -> np.ndarray:
+        """Value of one unit of `currency` in the quote currency on each date, NaN when it has no rates."""
+        if currency == FX_QUOTE_CURRENCY:
+            return np.ones(len(dates))
+        table = self.tables.get(currency)
+        if table is None:
+            return np.full(len(dates), np.nan)
+        table_dates, rates = table
+        indexes = np.searchsorted(table_dates, dates, side="right") - 1
+        return rates[np.maximum(indexes, 0)]
+
+    def convert(self, amounts: np.ndarray, currencies: np.ndarray, dates: np.ndarray, base_currency: str) -> np.ndarray:
+        """
+        Convert amounts in mixed currencies to `base_currency` at the rate of each amount's date (`datetime64[D]`).
+        Amounts in a currency without rates come back as NaN.
+        """
+        self._ensure_loaded()
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if not len(amounts):
+            return amounts
+        values = np.empty(len(amounts))
+        currency_values, currency_codes = np.unique(currencies, return_inverse=True)
+        for code, currency in enumerate(currency_values):
+            rows = currency_codes == code
+            values[rows] = self._quote_values(str(currency), dates[rows])
+        return amounts * values / self._quote_values(base_currency, dates)
+
+    def add_base_amounts(self, rows: Sequence[dict], base_currency: str) -> None:
+        """Set `base_currency` and `base_amount` on expense rows, converting them all in one batch."""
+        amounts = np.fromiter((row["amount"] for row in rows), dtype=np.float64, count=len(rows))
+        currencies = np.asarray([row.get("currency") or FX_QUOTE_CURRENCY for row in rows], dtype=str)
+        dates = np.asarray([row["created_at"][:10] for row in rows], dtype="datetime64[D]")
+        converted = np.round(self.convert(amounts, currencies, dates, base_currency), 2)
+        for row, amount in zip(rows, converted.tolist()):
+            row["base_currency"] = base_currency
+            row["base_amount"] = None if amount != amount else amount  # NaN when the currency has no rates
+
+
+fx_rates = FxRates()
@@ -0,0 +1,127 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+from utils.cache import TTLCache
+from bisect import bisect_left
+
+import aiohttp
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, rendered cumulatively like Prometheus expects."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, plus collectors sampled at scrape time, in Prometheus text format."""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register a callable returning (name, labels, value) gauge samples, called on every scrape."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in series.items())
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels((*labels, ('le', str(bound))))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        gauges: Dict[str, List[str]] = {}
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                gauges.setdefault(name, []).append(f"{name}{_format_labels(tuple(labels.items()))} {value:g}")
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def cache_samples(name: str, cache: TTLCache) -> Iterable[Sample]:
+    """Expose a cache's size and hit/miss/eviction counters as samples labelled with the cache name."""
+    for stat, value in cache.stats().items():
+        yield f"cache_{stat}", {"cache": name}, value
+
+
+def upstream_endpoint(path: str) -> str:
+    """Reduce an upstream URL path to a low-cardinality label, e.g. `/rest/v1/expenses` or `/auth/v1/token`."""
+    return "/".join(path.split("/")[:4])
+
+
+def metrics_trace_config(metrics: "MetricsRegistry") -> aiohttp.TraceConfig:
+    """aiohttp trace hooks recording per-upstream-endpoint latency, status, errors and connection reuse."""
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+        context.reused = False
+
+    async def on_connection_reuseconn(session, context, params):
+        context.reused = True
+
+    async def on_request_end(session, context, params):
+        labels = (("method", params.method), ("endpoint", upstream_endpoint(params.url.path)))
+        metrics.observe("upstream_request_duration_seconds", labels, time.perf_counter() - context.start)
+        metrics.inc("upstream_requests_total", (*labels, ("status", str(params.response.status))))
+        metrics.inc("upstream_connections_total", (("reused", "true" if context.reused else "false"),))
+
+    async def on_request_exception(session, context, params):
+        labels = (("method", params.method), ("endpoint", upstream_endpoint(params.url.path)),
+                  ("error", type(params.exception).__name__))
+        metrics.inc("upstream_errors_total", labels)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,26 @@
+from fastapi import HTTPException
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+
+import binascii
+import base64
+
+
+def encode_cursor(row: dict) -> str:
+    """Encode the (created_at, id) keyset of a row into an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{row['created_at']}|{row['id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor created by `encode_cursor` back into its (created_at, id) keyset. Its parts are checked to be a
+    timestamp and a UUID, so a tampered cursor is rejected here instead of by the database.
+    """
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        datetime.fromisoformat(created_at)
+        UUID(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, row_id
@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Tuple
+from utils.stores import UserStore
+
+import os
+
+ROLLUP_CACHE_SIZE = int(os.getenv("ROLLUP_CACHE_SIZE", 1000))
+ROLLUP_CACHE_TTL = float(os.getenv("ROLLUP_CACHE_TTL", 3600))
+
+
+class UserRollup:
+    """Running totals and counts of one user's expenses per month x category x currency."""
+
+    def __init__(self):
+        self.months: Dict[str, Dict[Tuple[str, str], List[float]]] = {}
+        self.contributions: Dict[str, Tuple[str, Tuple[str, str], float]] = {}
+
+    def add(self, row: dict) -> None:
+        """Add an expense, replacing its previous contribution if it was already counted."""
+        self.remove(row["id"])
+        month, key = row["created_at"][:7], (row["category"], row.get("currency") or "unknown")
+        bucket = self.months.setdefault(month, {}).setdefault(key, [0.0, 0])
+        bucket[0] += row["amount"]
+        bucket[1] += 1
+        self.contributions[row["id"]] = (month, key, row["amount"])
+
+    def remove(self, expense_id: str) -> None:
+        """Take an expense's contribution back out, if it was counted."""
+        contribution = self.contributions.pop(expense_id, None)
+        if contribution is None:
+            return
+        month, key, amount = contribution
+        bucket = self.months[month][key]
+        bucket[0] -= amount
+        bucket[1] -= 1
+        if not bucket[1]:
+            del self.months[month][key]
+            if not self.months[month]:
+                del self.months[month]
+
+    def totals(self, month: Optional[str] = None) -> List[dict]:
+        """Return the rollups of one month (`YYYY-MM`), or of every month."""
+        months = [month] if month else sorted(self.months)
+        return [{"month": name, "category": category, "currency": currency, "total": round(total, 2), "count": count}
+                for name in months
+                for (category, currency), (total, count) in sorted(self.months.get(name, {}).items())]
+
+
+rollups = UserStore(UserRollup, ROLLUP_CACHE_SIZE, ROLLUP_CACHE_TTL)
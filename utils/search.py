@@ -0,0 +1,97 @@
+from typing import Dict, List, Set, Tuple
+from utils.stores import UserStore
+from collections import Counter
+
+import heapq
+import math
+import re
+import os
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 1000))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 3600))
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", 0.4))  # Minimum trigram similarity of a match
+SEARCH_COLUMNS = ("description", "category")
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def trigrams(term: str) -> Set[str]:
+    """The trigrams of a term padded like pg_trgm does, so short terms and word starts weigh in too."""
+    padded = f"  {term} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class UserSearchIndex:
+    """
+    Inverted index over one user's expense descriptions and categories, ranked with BM25 term weights.
+
+    Query terms match indexed terms by trigram similarity, so typos and word prefixes still find expenses.
+    """
+    K1 = 1.2
+
+    def __init__(self):
+        self.documents: Dict[str, Tuple[str, ...]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}  # Term -> expense id -> occurrences
+        self.term_trigrams: Dict[str, Set[str]] = {}  # Trigram -> terms containing it
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, row: dict) -> None:
+        """Index an expense, replacing its previous terms if it was already indexed."""
+        self.remove(row["id"])
+        terms = Counter(tokenize(" ".join(str(row.get(column) or "") for column in SEARCH_COLUMNS)))
+        self.documents[row["id"]] = tuple(terms)
+        for term, count in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                for trigram in trigrams(term):
+                    self.term_trigrams.setdefault(trigram, set()).add(term)
+            postings[row["id"]] = count
+
+    def remove(self, expense_id: str) -> None:
+        """Take an expense's terms back out, if it was indexed."""
+        for term in self.documents.pop(expense_id, ()):
+            postings = self.postings[term]
+            del postings[expense_id]
+            if postings:
+                continue
+            del self.postings[term]
+            for trigram in trigrams(term):
+                terms = self.term_trigrams[trigram]
+                terms.discard(term)
+                if not terms:
+                    del self.term_trigrams[trigram]
+
+    def _matching_terms(self, token: str) -> Dict[str, float]:
+        """Indexed terms similar to a query token, with their similarity (1 for the token itself)."""
+        token_trigrams = trigrams(token)
+        shared = Counter(term for trigram in token_trigrams for term in self.term_trigrams.get(trigram, ()))
+        matches = {}
+        for term, count in shared.items():
+            similarity = count / (len(token_trigrams) + len(trigrams(term)) - count)
+            if term.startswith(token) and len(token) >= 3:
+                similarity = max(similarity, 0.8)  # Search as you type
+            if similarity >= SEARCH_FUZZY_THRESHOLD:
+                matches[term] = similarity
+        return matches
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """Return up to `limit` (expense id, score) pairs matching any query term, best first."""
+        scores: Dict[str, float] = {}
+        for token in dict.fromkeys(tokenize(query)):
+            for term, similarity in self._matching_terms(token).items():
+                postings = self.postings[term]
+                idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for expense_id, count in postings.items():
+                    weight = similarity * idf * count * (self.K1 + 1) / (count + self.K1)
+                    scores[expense_id] = scores.get(expense_id, 0.0) + weight
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+search_indexes = UserStore(UserSearchIndex, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
@@ -0,0 +1,85 @@
+from typing import Any, AsyncIterable, Callable, Dict, Hashable, Iterable, List, Set
+from utils.cache import TTLCache
+
+import asyncio
+
+# Every UserStore, kept up to date by `record_expenses` and `forget_expenses`
+_stores: List["UserStore"] = []
+
+
+class UserStore:
+    """
+    Per-user structures derived from a user's expenses (e.g. rollups, a search index), kept in a TTL cache.
+
+    A structure is any object with `add(row)`, which replaces the expense if it was added already, and
+    `remove(expense_id)`, so writes never need the previous version of a row. It's built on first use in a single
+    streaming pass over the user's expenses, and installed before the pass starts so expenses written meanwhile are
+    added to it too. The ids those writes touch are skipped in the pass's later pages, which may have been read before
+    the write committed. A pass that fails drops it again, so partial structures are never served. Concurrent builds for
+    the same user share one pass. Only users whose structure is loaded are kept up to date by the write hooks.
+    """
+
+    def __init__(self, factory: Callable[[], Any], maxsize: int, ttl: float):
+        self.factory = factory
+        self.cache = TTLCache(maxsize, ttl)
+        self._builds: Dict[Hashable, asyncio.Task] = {}
+        self._written: Dict[Hashable, Set[str]] = {}  # User id -> expense ids written during their build's pass
+        _stores.append(self)
+
+    async def get(self, user_id: Hashable, pages: AsyncIterable[List[dict]]) -> Any:
+        """Return the user's structure, building it from `pages` of their expenses if it isn't loaded."""
+        value = self.cache.get(user_id)
+        if value is None or user_id in self._builds:
+            value = await self.build(user_id, pages)
+        return value
+
+    async def build(self, user_id: Hashable, pages: AsyncIterable[List[dict]]) -> Any:
+        """(Re)build the user's structure from `pages` of their expenses, or join the build in progress."""
+        task = self._builds.get(user_id)
+        if task is None:
+            task = self._builds[user_id] = asyncio.ensure_future(self._build(user_id, pages))
+            task.add_done_callback(lambda _: self._builds.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _build(self, user_id: Hashable, pages: AsyncIterable[List[dict]]) -> Any:
+        value = self.factory()
+        written = self._written[user_id] = set()
+        self.cache.set(user_id, value)
+        try:
+            async for page in pages:
+                for row in page:
+                    if row["id"] not in written:
+                        value.add(row)
+        except BaseException:
+            self.cache.pop(user_id)
+            raise
+        finally:
+            del self._written[user_id]
+        return value
+
+    def _loaded(self, user_id: Hashable, expense_ids: Iterable[str]) -> Any:
+        """Return the user's structure if it's loaded, noting the written ids if its pass is running."""
+        written = self._written.get(user_id)
+        if written is not None:
+            written.update(expense_ids)
+        return self.cache.peek(user_id)
+
+
+def record_expenses(user: tuple, rows: Iterable[dict]) -> None:
+    """Add created or updated expenses to the user's loaded structures."""
+    rows = list(rows)
+    for store in _stores:
+        value = store._loaded(user[0]["id"], [row["id"] for row in rows])
+        if value is not None:
+            for row in rows:
+                value.add(row)
+
+
+def forget_expenses(user: tuple, expense_ids: Iterable[str]) -> None:
+    """Remove deleted expenses from the user's loaded structures."""
+    expense_ids = list(expense_ids)
+    for store in _stores:
+        value = store._loaded(user[0]["id"], expense_ids)
+        if value is not None:
+            for expense_id in expense_ids:
+                value.remove(expense_id)
@@ -1,27 +1,45 @@
 from utils.constants import PREDEFINED_CATEGORIES
 from fastapi import HTTPException
-from typing import Tuple, Optional
-from asyncio import sleep
+from typing import Tuple, Optional, Set, Dict
+from utils.cache import TTLCache
 from db import supabase
 
+import time
 import jwt
 import os
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+JWT_LEEWAY = float(os.getenv("JWT_LEEWAY", 10))
+REJECTED_TOKEN_CACHE_SIZE = int(os.getenv("REJECTED_TOKEN_CACHE_SIZE", 10000))
+REJECTED_TOKEN_CACHE_TTL = float(os.getenv("REJECTED_TOKEN_CACHE_TTL", 300))
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", 10000))
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", 300))
+
+PREDEFINED_CATEGORIES_BY_NAME = {category["name"]: category for category in PREDEFINED_CATEGORIES}
+PREDEFINED_CATEGORY_NAMES = frozenset(PREDEFINED_CATEGORIES_BY_NAME)
+
+# Verified token -> (user, token) results of `User.validate`
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+# Tokens that failed verification for good (bad signature, expired, malformed)
+rejected_token_cache = TTLCache(REJECTED_TOKEN_CACHE_SIZE, REJECTED_TOKEN_CACHE_TTL)
+# User id -> {lowercase name: category} of the user's custom categories, least recently used users are evicted
+category_cache = TTLCache(CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL)
 
 
 async def check_category_exists(user: tuple, category_name: str,
                                 raise_exception: bool = True) -> Tuple[Optional[str], Optional[dict]]:
     """Check if a category exists in predefined or user-created categories."""
+    category_name = category_name.lower()
 
     # Check if the category is a predefined category
-    predefined_category = next((cat for cat in PREDEFINED_CATEGORIES if cat["name"].lower() == category_name.lower()),
-                               None)
+    predefined_category = PREDEFINED_CATEGORIES_BY_NAME.get(category_name)
     if predefined_category:
         return "predefined", predefined_category
 
     # Check if the category exists in the user's custom categories
-    user_category = await supabase.get_user_category_by_name(user, category_name)
+    user_category = (await get_user_categories_by_name(user)).get(category_name)
     if user_category:
         return "user", user_category
 
@@ -31,6 +49,34 @@ async def check_category_exists(user: tuple, category_name: str,
     return None, None
 
 
+async def get_user_categories_by_name(user: tuple) -> Dict[str, dict]:
+    """Get the user's custom categories keyed by lowercase name. Served from the category cache when possible."""
+    categories = category_cache.get(user[0]["id"])
+    if categories is None:
+        categories = {category["name"].lower(): category for category in await supabase.get_user_categories(user)}
+        category_cache.set(user[0]["id"], categories)
+    return categories
+
+
+def cache_user_category(user: tuple, category: dict) -> None:
+    """Write a newly created custom category through to the user's cached categories."""
+    categories = category_cache.peek(user[0]["id"])
+    if categories is not None:
+        categories[category["name"].lower()] = category
+
+
+def uncache_user_category(user: tuple, category_name: str) -> None:
+    """Remove a deleted custom category from the user's cached categories."""
+    categories = category_cache.peek(user[0]["id"])
+    if categories is not None:
+        categories.pop(category_name.lower(), None)
+
+
+async def get_category_names(user: tuple) -> Set[str]:
+    """Get the names of all predefined and user-created categories, to validate many expenses at once."""
+    return PREDEFINED_CATEGORY_NAMES | (await get_user_categories_by_name(user)).keys()
+
+
 async def check_expense_authorization(expense_id: str, user: tuple) -> dict:
     """Check if the user is authorized to access the expense and if the expense exists."""
     existing_expense = await supabase.get_expense_by_id(expense_id, user)
@@ -41,22 +87,40 @@ async def check_expense_authorization(expense_id: str, user: tuple) -> dict:
     return existing_expense
 
 
-async def validate_user_by_token(token: str, retries: int = 3, delay: int = 1):
+async def validate_user_by_token(token: str) -> str:
     """
-    Validate the JWT token and return the user's email with exponential backoff.
+    Validate the JWT token and return the user's email.
 
-    This is needed since Supabase needs time to sign the token.
+    Supabase may hand out tokens whose `iat`/`nbf` are slightly ahead of our clock, so those claims are checked with
+    a leeway instead of sleeping and retrying. `exp` gets no leeway. Any other failure is final and the token is
+    remembered as rejected, so replaying it fails without decoding it again.
     """
-    for attempt in range(retries):
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"], options={"verify_aud": False})
-            email = payload.get("email")
-            if email:
-                return email
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-        except jwt.PyJWTError:
-            if attempt < retries - 1:
-                await sleep(delay)
-                delay *= 2
-            else:
-                raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if rejected_token_cache.get(token):
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"],
+                             options={"verify_aud": False, "verify_iat": False, "verify_nbf": False})
+        not_before = [payload[claim] for claim in ("iat", "nbf") if claim in payload]
+        if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in not_before):
+            raise jwt.InvalidTokenError("iat and nbf must be numbers")
+    except jwt.PyJWTError:
+        rejected_token_cache.set(token, True)
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if any(value > time.time() + JWT_LEEWAY for value in not_before):
+        # Not valid yet even with the leeway, but it will be soon so don't remember it as rejected
+        raise HTTPException(status_code=401, detail="Token is not yet valid")
+
+    email = payload.get("email")
+    if not email:
+        rejected_token_cache.set(token, True)
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return email
+
+
+def get_token_lifetime(token: str) -> Optional[float]:
+    """Return the remaining lifetime of an already verified token in seconds, based on its `exp` claim."""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return exp - time.time() if exp else None